@@ -0,0 +1,91 @@
+"""Compare loading images one by one with loading the prebuilt atlas.
+
+Images packed by ``build_atlas.py`` are loaded as the game would
+without an atlas (decoded one by one, added to a texture bin) and from
+the atlas (pages decoded, regions cut). Both decoding alone and
+decoding plus texture upload are timed (median of a few runs), along
+with groups and draw calls of a batch of sprites drawing all images.
+The atlas is built first. Requires OpenGL, the context is created
+headless. Run from the repository root::
+
+    python benchmarks/atlas.py [runs]
+"""
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pyglet
+
+pyglet.options['headless'] = True
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lastsanta import atlas, graphics           # NOQA
+import build_atlas                              # NOQA
+
+RESOURCES_PATH = ROOT / 'resources'
+
+
+def load_separate(paths: list[Path], upload: bool) -> list[pyglet.image.AbstractImage]:
+    """Load images one by one, as the game's default image handles."""
+    texture_bin = pyglet.image.atlas.TextureBin()
+    images = [pyglet.image.load(str(path)) for path in paths]
+    if upload:
+        images = [texture_bin.add(image, 1) for image in images]
+    return images
+
+
+def load_atlas(index: dict, upload: bool) -> list[pyglet.image.AbstractImage]:
+    """Load atlas pages and cut their regions."""
+    atlas_path = RESOURCES_PATH / atlas.ATLAS_DIRECTORY
+    pages = [pyglet.image.load(str(atlas_path / filename)) for filename in index['pages']]
+    if not upload:
+        return pages
+
+    textures = [page.get_texture() for page in pages]
+    return [textures[region['page']].get_region(region['x'], region['y'],
+                                                region['width'], region['height'])
+            for region in index['regions'].values()]
+
+
+def median_time(function, runs: int) -> float:
+    """Return the median time of a function, in milliseconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1e3)
+    return statistics.median(times)
+
+
+def draw_statistics(images: list[pyglet.image.AbstractImage]) -> tuple[int, int]:
+    """Return groups and draw calls of a batch with a sprite per image."""
+    batch = pyglet.graphics.Batch()
+    sprites = [pyglet.sprite.Sprite(image, batch=batch) for image in images]    # NOQA
+    return graphics.batch_statistics(batch)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    build_atlas.main()
+    with open(RESOURCES_PATH / atlas.ATLAS_DIRECTORY / atlas.INDEX_FILENAME,
+              encoding='utf8') as fin:
+        index = json.load(fin)
+    paths = [RESOURCES_PATH / f'{key}.png' for key in index['regions']]
+
+    print(f'{len(paths)} images, {len(index["pages"])} atlas page(s)')
+    print(f'{"":>9} {"decode ms":>10} {"load ms":>8} {"groups":>7} {"draws":>6}')
+    for name, load, argument in (('separate', load_separate, paths),
+                                 ('atlas', load_atlas, index)):
+        decode_time = median_time(lambda: load(argument, False), runs)
+        load_time = median_time(lambda: load(argument, True), runs)
+        groups, draws = draw_statistics(load(argument, True))
+        print(f'{name:>9} {decode_time:>10.1f} {load_time:>8.1f} {groups:>7} {draws:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Stress axis collisions: throw items at maximum speed with ``MAX_DT``.
+
+Both the per-entity and the vectorized (if NumPy is available) physics
+are run. The script fails if any item tunnels out of the workbench.
+Run from the repository root::
+
+    python benchmarks/axis_stress.py
+"""
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+import desper
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lastsanta import constants, logic, physics, vectorized     # NOQA
+
+ITEM_COUNT = 2000
+FRAMES = 600
+# Sizes of the thinnest/smallest parts, they travel farther than
+# their size each frame
+ITEM_SIZES = (25, 194), (51, 115), (65, 245), (119, 62), (237, 89)
+
+
+def build_world(*processors: desper.Processor) -> desper.World:
+    """Build a workbench with items thrown in random directions."""
+    world = desper.World()
+    for processor in processors:
+        world.add_processor(processor)
+
+    # Same layout as game.MainGameTransformer
+    world.create_entity(physics.CollisionAxes(constants.HORIZONTAL_MAIN_SEPARATOR_Y, 1))
+    world.create_entity(physics.CollisionAxes(constants.VERTICAL_MAIN_SEPARATOR_X, 0))
+    world.create_entity(physics.CollisionAxes(0., 1))
+    world.create_entity(physics.CollisionAxes(0., 0))
+    world.create_entity(physics.CollisionAxes(constants.VIEW_W, 0))
+
+    for _ in range(ITEM_COUNT):
+        width, height = random.choice(ITEM_SIZES)
+        angle = random.uniform(0, 2 * math.pi)
+        world.create_entity(
+            desper.Transform2D((random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X + 10,
+                                               constants.VIEW_W - width - 10),
+                                random.uniform(10, constants.HORIZONTAL_MAIN_SEPARATOR_Y
+                                               - height - 10))),
+            physics.CollisionRectangle((width, height)),
+            physics.Velocity(logic.MAX_MOUSE_INTERTIA_SPEED * math.cos(angle),
+                             logic.MAX_MOUSE_INTERTIA_SPEED * math.sin(angle)))
+
+    return world
+
+
+def escaped(world: desper.World) -> int:
+    """Count items that are not entirely inside the workbench."""
+    count = 0
+    for entity, coll_rectangle in world.get(physics.CollisionRectangle):
+        x, y = world.get_component(entity, desper.Transform2D).position
+        tolerance = 1e-6
+        count += (x < constants.VERTICAL_MAIN_SEPARATOR_X - tolerance
+                  or x + coll_rectangle.size[0] > constants.VIEW_W + tolerance
+                  or y < -tolerance
+                  or y + coll_rectangle.size[1]
+                  > constants.HORIZONTAL_MAIN_SEPARATOR_Y + tolerance)
+    return count
+
+
+def main() -> int:
+    backends = {'per-entity': lambda: (physics.RectangleToAxisProcessor(),
+                                       physics.VelocityProcessor())}
+    if vectorized.AVAILABLE:
+        backends['vectorized'] = lambda: (vectorized.VectorizedPhysicsProcessor(),)
+
+    failed = False
+    for name, processors in backends.items():
+        random.seed(0)
+        world = build_world(*processors())
+
+        start = time.perf_counter()
+        for _ in range(FRAMES):
+            world.process(constants.MAX_DT)
+        elapsed = time.perf_counter() - start
+
+        escaped_count = escaped(world)
+        failed |= escaped_count > 0
+        print(f'{name:>10}: {elapsed / FRAMES * 1e3:.2f} ms/frame, '
+              f'{escaped_count}/{ITEM_COUNT} items escaped')
+
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Check compiled gift constraints against the original trees.
+
+Random part lists are checked through both :meth:`Constraint.check`
+and :class:`logic.CompiledConstraint`, results must be identical. The
+same goes for parts counted in worlds (:func:`logic.table_counts`),
+running or still being built.
+Timings of both are then reported, the compiled one also when part
+counts are already available.
+
+Run from the repository root::
+
+    python benchmarks/constraints.py
+"""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import desper
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lastsanta import gifts, logic      # NOQA
+
+PART_NAMES = sorted({*gifts.BASES, *gifts.HUMAN_PARTS, *gifts.CRITICAL_ITEMS,
+                     gifts.LIGHTBULB, gifts.WHEEL, gifts.DRAGON_HEAD, gifts.BATTERY,
+                     gifts.WING, gifts.SPRING, 'unknown'})
+SAMPLES = 2000
+PART_COUNTS = 5, 50, 500
+
+
+def random_parts(max_count: int) -> list[logic.GiftPart]:
+    """Return a random list of gift parts."""
+    return [logic.GiftPart(random.choice(PART_NAMES))
+            for _ in range(random.randint(0, max_count))]
+
+
+def check_equivalence():
+    """Assert that compiled and tree constraints agree on random inputs."""
+    number_constraints = {
+        'at_most_3': logic.ItemsNumberConstraint(3),
+        'more_than_2': logic.JointConstraint(
+            logic.ItemsNumberConstraint(2, logic.operator.gt),
+            gifts.gifts['car'])}
+
+    for name, constraint in {**gifts.gifts, **number_constraints}.items():
+        compiled = logic.CompiledConstraint(constraint)
+        for _ in range(SAMPLES):
+            parts = random_parts(random.choice(PART_COUNTS))
+            expected = constraint.check(parts)
+            result = compiled.check(parts)
+            assert result[0] == expected[0], (name, parts, result, expected)
+            assert all(map(logic.operator.is_, result[1], expected[1])), (name, parts)
+            assert len(result[1]) == len(expected[1]), (name, parts)
+
+    print(f'{len(gifts.gifts) + len(number_constraints)} constraints match '
+          f'on {SAMPLES} random inputs each')
+
+
+def check_world_counts():
+    """Assert that parts counted in worlds agree with tree constraints.
+
+    Worlds being built (not dispatching yet) do not index their parts
+    until they are switched to, counts shall be right anyway.
+    """
+    for dispatch_enabled in (False, True):
+        for _ in range(SAMPLES // 10):
+            world = desper.World()
+            world.dispatch_enabled = dispatch_enabled
+            world.add_processor(logic.ItemChainProcessor())
+            parts = random_parts(random.choice(PART_COUNTS))
+            for part in parts:
+                world.create_entity(desper.Transform2D(), logic.Item(), part)
+
+            counts = logic.table_counts(world)
+            for name, constraint in gifts.gifts.items():
+                result = logic.CompiledConstraint(constraint).check_counts(counts)
+                assert result[0] == constraint.check(parts)[0], (name, dispatch_enabled, parts)
+
+    print(f'World counts match on {SAMPLES // 10} worlds, being built and running')
+
+
+def main():
+    check_equivalence()
+    check_world_counts()
+
+    print(f'{"parts":>6} {"tree (us)":>10} {"compiled (us)":>14} {"counted (us)":>13}')
+    for part_count in PART_COUNTS:
+        parts = [logic.GiftPart(random.choice(PART_NAMES)) for _ in range(part_count)]
+        counts = logic.count_parts(parts)
+        tree_time = compiled_time = counted_time = 0.
+        for constraint in gifts.gifts.values():
+            compiled = logic.CompiledConstraint(constraint)
+            tree_time += min(timeit.repeat(lambda: constraint.check(parts),
+                                           number=100, repeat=3)) / 100
+            compiled_time += min(timeit.repeat(lambda: compiled.check(parts),
+                                               number=100, repeat=3)) / 100
+            counted_time += min(timeit.repeat(lambda: compiled.check_counts(counts),
+                                              number=100, repeat=3)) / 100
+        print(f'{part_count:>6} {tree_time * 1e6:>10.1f} {compiled_time * 1e6:>14.1f} '
+              f'{counted_time * 1e6:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
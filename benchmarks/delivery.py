@@ -0,0 +1,185 @@
+"""Check incremental part counts and time delivery checks.
+
+Random hooks, unhooks, gift part removals and deletions are applied to
+a world of items. After each step, the part counts kept by
+:class:`logic.ItemChainProcessor` are compared with counts rebuilt from
+scratch. Orders added to freshly built game worlds (headless) are
+checked against the baseline, which spawned all the parts of each
+unsatisfied item set. Then, finding and checking the major gift is
+timed against a full rebuild of all assemblies.
+
+Run from the repository root::
+
+    python benchmarks/delivery.py
+"""
+import os
+import random
+import sys
+import timeit
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import desper                           # NOQA
+
+import lastsanta                        # NOQA
+from lastsanta import constants, game, gifts, headless, logic, recording   # NOQA
+
+ITEM_COUNTS = 50, 500, 5000
+GENERATED_COUNTS = 50, 2 * constants.PART_BUDGET
+"""Parts generated in fresh worlds, below and above the part budget."""
+STEPS = 2000
+PART_NAMES = gifts.BASES + gifts.HUMAN_PARTS + (gifts.WHEEL, gifts.LIGHTBULB, gifts.BATTERY)
+
+
+def build_world(item_count: int) -> desper.World:
+    """Build a world with the given number of parts, randomly hooked."""
+    world = desper.World()
+    world.add_processor(logic.ItemChainProcessor())
+    chains = world.get_processor(logic.ItemChainProcessor)
+
+    entities = [world.create_entity(desper.Transform2D(), logic.Item(),
+                                    logic.GiftPart(random.choice(PART_NAMES)))
+                for _ in range(item_count)]
+    for child in entities:
+        parent = random.choice(entities)
+        if random.random() < 0.8 and not chains.contains(child, parent):
+            chains.hook(child, parent, logic.Vec2())
+
+    return world
+
+
+def rebuilt_counts(world: desper.World) -> dict[int, Counter[str]]:
+    """Rebuild part counts of all assemblies, walking the world."""
+    roots = {}
+    for entity, item in world.get(logic.Item):
+        root = entity
+        while world.get_component(root, logic.Item).hooked is not None:
+            root = world.get_component(root, logic.Item).hooked
+        roots.setdefault(root, []).append(entity)
+
+    return {root: Counter(world.get_component(member, logic.GiftPart).name
+                          for member in members
+                          if world.has_component(member, logic.GiftPart))
+            for root, members in roots.items()}
+
+
+def check_consistency():
+    """Assert that incremental counts match rebuilt ones."""
+    world = build_world(200)
+    chains = world.get_processor(logic.ItemChainProcessor)
+
+    for _ in range(STEPS):
+        entities = [entity for entity, _ in world.get(logic.Item)]
+        entity = random.choice(entities)
+        operation = random.random()
+        if operation < 0.4:
+            parent = random.choice(entities)
+            if not chains.contains(entity, parent):
+                chains.hook(entity, parent, logic.Vec2())
+        elif operation < 0.7:
+            chains.unhook(entity)
+        elif operation < 0.8:
+            world.remove_component(entity, logic.GiftPart)
+        elif operation < 0.9:
+            world.add_component(entity, logic.GiftPart(random.choice(PART_NAMES)))
+        else:
+            # Children of deleted items become roots
+            for child in tuple(chains.children(entity)):
+                chains.unhook(child)
+            world.delete_entity(entity)
+            world.process(0)
+            world.create_entity(desper.Transform2D(), logic.Item(),
+                                logic.GiftPart(random.choice(PART_NAMES)))
+
+        expected = rebuilt_counts(world)
+        assert set(chains.assemblies()) == set(expected)
+        for root, counts in expected.items():
+            assert chains.part_counts(root) == counts, (root, chains.part_counts(root), counts)
+        assert chains.part_counts() == sum(expected.values(), start=Counter())
+
+    print(f'Part counts match after {STEPS} random operations')
+
+
+def fresh_spawns(gift_name: str, number_of_generated: int) -> tuple[int, int, desper.World]:
+    """Build a game world, return baseline and actual spawns, and the world.
+
+    The world is switched to, so that parts are indexed and reclaimed
+    ones deleted.
+    """
+    loop = headless.HeadlessLoop()
+    desper.default_loop = loop
+    # Level and order reseed the generator
+    recording.replayed_seeds.extend((random.getrandbits(64), random.getrandbits(64)))
+    handle = headless.game_world_handle(gift_name, letter_name='tutorial1',
+                                        number_of_generated=number_of_generated)
+
+    # Look at the table right before the order
+    table = []
+    order_index = next(index for index, function in enumerate(handle.transform_functions)
+                       if isinstance(function, game.GiftTransformer))
+    handle.transform_functions.insert(order_index, lambda _, world: table.extend(
+        part for _, part in world.get(logic.GiftPart)))
+
+    world = handle()
+    spawned = len(world.get(logic.GiftPart)) - len(table)
+    baseline = sum(reason.count for reason in gifts.gifts[gift_name].check(table)[1]
+                   if type(reason) is logic.ItemSetConstraint)
+    loop.switch(handle)
+    loop.step()
+    return baseline, spawned, world
+
+
+def check_fresh_spawns():
+    """Assert that orders on fresh worlds spawn at most the baseline.
+
+    Above the part budget, parts are reclaimed before spawning: parts
+    shall fit the budget instead. Orders shall be satisfiable anyway.
+    """
+    lastsanta.populate_resources(str(ROOT / 'resources'))
+    print(f'{"gift":>12} ' + ' '.join(f'{f"baseline/spawned/parts ({count})":>30}'
+                                      for count in GENERATED_COUNTS))
+    for gift_name, gift in gifts.gifts.items():
+        results = []
+        for number_of_generated in GENERATED_COUNTS:
+            baseline, spawned, world = fresh_spawns(gift_name, number_of_generated)
+            parts = [part for _, part in world.get(logic.GiftPart)]
+            if number_of_generated + baseline <= constants.PART_BUDGET:
+                assert spawned <= baseline, (gift_name, number_of_generated, baseline, spawned)
+            else:
+                assert len(parts) <= constants.PART_BUDGET, (gift_name, len(parts))
+            assert not any(type(reason) is logic.ItemSetConstraint
+                           for reason in gift.check(parts)[1]), (gift_name, number_of_generated)
+            results.append(f'{baseline}/{spawned}/{len(parts)}')
+
+        print(f'{gift_name:>12} ' + ' '.join(f'{result:>30}' for result in results))
+
+
+def main():
+    random.seed(0)
+    check_consistency()
+    check_fresh_spawns()
+
+    constraint = logic.CompiledConstraint(gifts.gifts['car'])
+    print(f'{"items":>6} {"rebuild (us)":>13} {"incremental (us)":>17} {"speedup":>8}')
+    for item_count in ITEM_COUNTS:
+        world = build_world(item_count)
+
+        def rebuild():
+            counts = rebuilt_counts(world)
+            return constraint.check_counts(max(counts.values(), key=Counter.total))
+
+        def incremental():
+            return constraint.check_counts(logic.find_major_gift(world)[1])
+
+        rebuild_time = min(timeit.repeat(rebuild, number=5, repeat=3)) / 5
+        incremental_time = min(timeit.repeat(incremental, number=100, repeat=3)) / 100
+        print(f'{item_count:>6} {rebuild_time * 1e6:>13.1f} {incremental_time * 1e6:>17.1f} '
+              f'{rebuild_time / incremental_time:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Time dialogue loading with and without the compiled cache.
+
+Each dialogue resource is loaded parsing its JSON (cold) and from the
+on disk cache (warm). Variable substitution through pre-split
+templates is also compared with scanning the text for every line.
+
+Run from the repository root::
+
+    python benchmarks/dialogue_cache.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lastsanta import constants, dialogue       # NOQA
+
+DIAL_ROOT = Path(__file__).resolve().parent.parent / 'resources' / constants.DIAL_RESOURCES_PATH
+REPEAT = 20
+
+
+def scan_substitute(text: str, variables) -> str:
+    """Substitute variables scanning the text, as done for every line."""
+    return dialogue.TEMPLATE_VARIABLE_PATTERN.sub(
+        lambda match: str(variables.get(match[1], match[0])), text)
+
+
+def main():
+    filenames = sorted(DIAL_ROOT.rglob('*.json'))
+
+    print(f'{"resource":>24} {"cold (ms)":>10} {"warm (ms)":>10}')
+    for filename in filenames:
+        handle = dialogue.DialogueHandle(str(filename))
+
+        def cold():
+            handle.cache_filename.unlink(missing_ok=True)
+            handle.load()
+
+        cold_time = min(timeit.repeat(cold, number=1, repeat=REPEAT))
+        warm_time = min(timeit.repeat(handle.load, number=1, repeat=REPEAT))
+        print(f'{filename.relative_to(DIAL_ROOT).as_posix():>24} '
+              f'{cold_time * 1e3:>10.3f} {warm_time * 1e3:>10.3f}')
+
+    texts = list(dialogue.compile_templates(
+        (DIAL_ROOT / 'story.json').read_text(encoding='utf8')))
+    variables = {'_click': 3}
+    for text in texts:
+        assert (dialogue.text_template(text).substitute(variables)
+                == scan_substitute(text, variables))
+
+    scan_time = min(timeit.repeat(
+        lambda: [scan_substitute(text, variables) for text in texts], number=100, repeat=5))
+    template_time = min(timeit.repeat(
+        lambda: [dialogue.text_template(text).substitute(variables) for text in texts],
+        number=100, repeat=5))
+    print(f'{len(texts)} story lines, per line: scan {scan_time / len(texts) * 1e4:.2f} us, '
+          f'template {template_time / len(texts) * 1e4:.2f} us')
+
+
+if __name__ == '__main__':
+    main()
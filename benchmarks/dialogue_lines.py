@@ -0,0 +1,69 @@
+"""Time advancing dialogue lines.
+
+Building a new dialogue world for each line (as it used to be done) is
+compared with updating the persistent world of
+:class:`dialogue.DialoguePresenter`. Requires a display (or headless
+OpenGL).
+
+Run from the repository root::
+
+    python benchmarks/dialogue_lines.py
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import desper
+import pyglet_desper as pdesper
+from ddesigner import Dialogue
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lastsanta       # NOQA
+from lastsanta import constants, dialogue, hotkeys      # NOQA
+
+STORY = (Path(__file__).resolve().parent.parent / 'resources'
+         / constants.DIAL_RESOURCES_PATH / 'story.json')
+LINES = 200
+
+
+def build_line_world(text: str, story: Dialogue) -> desper.World:
+    """Build a whole dialogue world for a line."""
+    handle = desper.WorldHandle()
+    handle.transform_functions.append(pdesper.init_graphics_transformer)
+    handle.transform_functions.append(dialogue.DialogueWorldTransformer(text))
+    handle.transform_functions.append(dialogue.DialogueMachineTransfomer(story, None))
+    handle.transform_functions.append(hotkeys.hotkeys_transformer)
+    return handle()
+
+
+def measure(function, texts) -> list[float]:
+    """Return latencies of calling function for each text, in ms."""
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        function(text)
+        latencies.append((time.perf_counter() - start) * 1e3)
+
+    return latencies
+
+
+def main():
+    story = Dialogue(dialogue.DialogueHandle(str(STORY)).load())
+    texts = [f'Line {index}\n' + 'Lorem ipsum dolor sit amet. ' * (index % 8 + 1)
+             for index in range(LINES)]
+
+    rebuild = measure(lambda text: build_line_world(text, story), texts)
+
+    presenter = dialogue.DialoguePresenter()
+    presenter.show(texts[0], story, None, lastsanta.loop.switch)
+    persistent = measure(lambda text: presenter.show(text, story, None), texts)
+
+    print(f'{"strategy":>12} {"median (ms)":>12} {"max (ms)":>10}')
+    for name, latencies in (('rebuild', rebuild), ('persistent', persistent)):
+        print(f'{name:>12} {statistics.median(latencies):>12.3f} {max(latencies):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
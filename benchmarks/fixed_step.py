@@ -0,0 +1,91 @@
+"""Compare variable and fixed timestep loops under different frame rates.
+
+The same bouncing workbench is run for a few simulated seconds, ticked
+at several display rates (with jitter and an occasional hitch), by the
+plain ``pdesper.Loop`` (one world step of ``dt`` per tick) and by
+:class:`timestep.FixedStepLoop`. Reported are world steps (i.e. physics
+cost) per second and, for the fixed loop, time dropped by the
+substeps guard.
+
+Run from the repository root::
+
+    python benchmarks/fixed_step.py
+"""
+import math
+import os
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import desper                                                   # NOQA
+
+from lastsanta import constants, logic, physics, timestep      # NOQA
+import pyglet_desper as pdesper     # NOQA (after lastsanta, which may set headless mode)
+
+ITEM_COUNT = 200
+SECONDS = 10
+FRAME_RATES = 30, 60, 144, 240
+HITCH_EVERY = 120
+HITCH_TIME = 0.25
+
+
+def build_world(_, world: desper.World):
+    """Build a workbench with items thrown in random directions."""
+    random.seed(0)
+    world.add_processor(physics.RectangleToAxisProcessor())
+    world.add_processor(physics.VelocityProcessor())
+    world.create_entity(physics.CollisionAxes(constants.HORIZONTAL_MAIN_SEPARATOR_Y, 1))
+    world.create_entity(physics.CollisionAxes(constants.VERTICAL_MAIN_SEPARATOR_X, 0))
+    world.create_entity(physics.CollisionAxes(0., 1))
+    world.create_entity(physics.CollisionAxes(constants.VIEW_W, 0))
+
+    for _ in range(ITEM_COUNT):
+        angle = random.uniform(0, 2 * math.pi)
+        speed = random.uniform(0, logic.MAX_MOUSE_INTERTIA_SPEED)
+        world.create_entity(
+            desper.Transform2D((random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X + 10,
+                                               constants.VIEW_W - 110),
+                                random.uniform(10, constants.HORIZONTAL_MAIN_SEPARATOR_Y - 110))),
+            physics.CollisionRectangle((100, 100)),
+            physics.Velocity(speed * math.cos(angle), speed * math.sin(angle)))
+
+
+def run(loop: pdesper.Loop, frame_rate: int, hitches: bool) -> int:
+    """Tick a loop at the given rate, return the number of world steps."""
+    handle = desper.WorldHandle()
+    handle.transform_functions.append(build_world)
+    loop.switch(handle)
+
+    jitter = random.Random(frame_rate)
+    elapsed = 0.
+    frame = 0
+    while elapsed < SECONDS:
+        dt = jitter.uniform(0.8, 1.2) / frame_rate
+        frame += 1
+        if hitches and frame % HITCH_EVERY == 0:
+            dt += HITCH_TIME
+        dt = min(dt, SECONDS - elapsed)
+        elapsed += dt
+        loop.iteration(dt)
+
+    # The variable loop steps once per frame
+    return getattr(loop, 'steps', frame)
+
+
+def main():
+    print(f'{"FPS":>5} {"hitches":>8} {"variable steps/s":>17} {"fixed steps/s":>14} '
+          f'{"fixed dropped (s)":>18}')
+    for hitches in (False, True):
+        for rate in FRAME_RATES:
+            variable_steps = run(pdesper.Loop(), rate, hitches)
+            fixed_loop = timestep.FixedStepLoop()
+            fixed_steps = run(fixed_loop, rate, hitches)
+            print(f'{rate:>5} {hitches!s:>8} {variable_steps / SECONDS:>17.1f} '
+                  f'{fixed_steps / SECONDS:>14.1f} {fixed_loop.dropped:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Soak a game world in headless mode, with synthetic drags.
+
+A game world is built without a window and stepped with a fixed
+timestep as fast as possible. Every few frames, a random part is
+grabbed, dragged around and released. Run from the repository root
+(``-O`` silences debug prints of mouse motion)::
+
+    python -O benchmarks/headless_soak.py [gift] [frames]
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import desper                       # NOQA
+from pyglet.math import Vec2        # NOQA
+
+import lastsanta                    # NOQA
+from lastsanta import constants, headless, logic, physics   # NOQA
+
+DRAG_FRAMES = 30
+
+
+def random_drags(loop: headless.HeadlessLoop, frames: int):
+    """Step the loop, dragging random parts around."""
+    while loop.frames < frames:
+        world = loop.current_world
+        parts = world.get(logic.GiftPart)
+        if not parts:
+            loop.step()
+            continue
+
+        # Grab at the center of the part's collision rectangle
+        entity, _ = random.choice(parts)
+        rectangle = world.get_component(entity, physics.CollisionRectangle)
+        point = (Vec2(*world.get_component(entity, desper.Transform2D).position)
+                 - Vec2(*rectangle.offset) + Vec2(*rectangle.size) / 2)
+        target = Vec2(random.uniform(0, constants.VIEW_W),
+                      random.uniform(0, constants.HORIZONTAL_MAIN_SEPARATOR_Y))
+
+        loop.press(point)
+        loop.step()
+        previous = point
+        for frame in range(1, DRAG_FRAMES + 1):
+            new_point = point.lerp(target, frame / DRAG_FRAMES)
+            loop.motion(new_point, new_point - previous)
+            loop.step()
+            previous = new_point
+        loop.release(target)
+        loop.step()
+
+
+def main():
+    gift_name = sys.argv[1] if len(sys.argv) > 1 else 'car'
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 3600
+
+    lastsanta.populate_resources(str(ROOT / 'resources'))
+    loop = headless.HeadlessLoop()
+    desper.default_loop = loop
+
+    start = time.perf_counter()
+    loop.switch(headless.game_world_handle(gift_name))
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    random_drags(loop, frames)
+    elapsed = time.perf_counter() - start
+
+    print(f'world built in {build_time * 1e3:.1f} ms, '
+          f'{len(loop.current_world.get(logic.GiftPart))} parts')
+    print(f'{loop.frames} frames in {elapsed:.2f}s: {loop.frames / elapsed:.0f} frames/s '
+          f'({loop.frames * loop.dt / elapsed:.1f}x real time)')
+    print('chains:', dict(loop.current_world.get_processor(logic.ItemChainProcessor)
+                          .part_counts()))
+
+
+if __name__ == '__main__':
+    main()
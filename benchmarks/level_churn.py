@@ -0,0 +1,83 @@
+"""Play many levels in the same game world, as the story does with ``back``.
+
+A game world is built in headless mode, then orders of the story are
+applied one after the other (see :class:`game.GiftTransformer`), for a
+few rounds. For each level, random parts are dragged around for a
+while and the major gift is delivered. Parts on the table and time
+per frame are reported for each level, with the default part budget
+and with no budget at all. Run from the repository root (``-O``
+silences debug prints of mouse motion)::
+
+    python -O benchmarks/level_churn.py [rounds] [frames per level]
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import desper                       # NOQA
+
+import lastsanta                    # NOQA
+from lastsanta import constants, game, gifts, headless, logic   # NOQA
+from headless_soak import random_drags                          # NOQA
+
+STORY_GIFTS = ('tutorial1', 'tutorial2', 'tutorial3', 'dragon_head', 'carpet', 'car', 'angel',
+               'uranium', 'bullet')
+NUMBER_OF_GENERATED = 50
+
+
+def play(part_budget: int, rounds: int, frames: int) -> list[tuple[str, int, float]]:
+    """Play levels, return gift name, parts and ms per frame of each."""
+    random.seed(0)
+    loop = headless.HeadlessLoop()
+    desper.default_loop = loop
+    handle = headless.game_world_handle(STORY_GIFTS[0],
+                                        number_of_generated=NUMBER_OF_GENERATED)
+    loop.switch(handle)
+
+    levels = []
+    for gift_name in STORY_GIFTS * rounds:
+        world = handle()
+        for entity, _ in world.get(logic.GiftConstraint):
+            world.delete_entity(entity)
+        game.GiftTransformer(gifts.gifts[gift_name], part_budget)(handle, world)
+        loop.step()
+
+        start_frame = loop.frames
+        start = time.perf_counter()
+        random_drags(loop, loop.frames + frames)
+        elapsed = time.perf_counter() - start
+        levels.append((gift_name, len(world.get(logic.GiftPart)),
+                       elapsed * 1e3 / (loop.frames - start_frame)))
+
+        # Deliver
+        major_entity, _ = logic.find_major_gift(world)
+        if major_entity is not None:
+            game.launch_gift(major_entity)
+
+    return levels
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+
+    lastsanta.populate_resources(str(ROOT / 'resources'))
+    budgeted = play(constants.PART_BUDGET, rounds, frames)
+    unbounded = play(sys.maxsize, rounds, frames)
+
+    print(f'{"level":>5} {"gift":>12} {"parts":>6} {"ms/frame":>9} '
+          f'{"parts (no budget)":>18} {"ms/frame":>9}')
+    for index, ((gift_name, parts, frame_time), (_, unbounded_parts, unbounded_time)) \
+            in enumerate(zip(budgeted, unbounded)):
+        print(f'{index:>5} {gift_name:>12} {parts:>6} {frame_time:>9.3f} '
+              f'{unbounded_parts:>18} {unbounded_time:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Replay a recorded session headless, as fast as possible.
+
+Record a session by running the game with the ``LASTSANTA_RECORD``
+environment variable set to a file name, then replay it from the
+repository root (``-O`` silences debug prints of mouse motion)::
+
+    LASTSANTA_RECORD=session.lsr python main.py
+    python -O benchmarks/replay.py session.lsr
+
+The world state is checked against the recorded one (exit status is
+1 on mismatches). Replay speed is reported, along with the slowest
+recorded steps and their replayed time, to reproduce slow frames.
+"""
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import lastsanta                        # NOQA
+from lastsanta import headless          # NOQA
+
+SLOWEST_STEPS = 10
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    lastsanta.populate_resources(str(ROOT / 'resources'))
+    result = headless.replay(sys.argv[1])
+
+    recorded_time = sum(result.recorded_times) / 1e6
+    print(f'{result.steps} steps in {result.time:.2f}s: {result.steps / result.time:.0f} steps/s')
+    print(f'step time: {recorded_time:.2f}s recorded, '
+          f'{sum(result.replayed_times) / 1e6:.2f}s replayed')
+
+    print(f'{"step":>8} {"recorded (ms)":>14} {"replayed (ms)":>14}')
+    slowest = sorted(range(result.steps), key=lambda step: -result.recorded_times[step])
+    for step in slowest[:SLOWEST_STEPS]:
+        print(f'{step:>8} {result.recorded_times[step] / 1e3:>14.2f} '
+              f'{result.replayed_times[step] / 1e3:>14.2f}')
+
+    if result.mismatches:
+        print(f'world state differs after steps: {result.mismatches[:10]} '
+              f'({len(result.mismatches)} of {result.digests} checks)')
+        sys.exit(1)
+    print(f'world state matches ({result.digests} checks)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Simulate a bounce storm and compare direct playback with the mixer.
+
+Each frame, many ``on_bounce`` events are triggered. Playing each of
+them directly (as ``SFXManager`` used to do) is compared with
+:class:`sound.Mixer`, in terms of started players and time spent.
+Bounces are also posted to a world event bus
+(:class:`physics.DispatchLaterProcessor`), which delivers them to
+``SFXManager`` once per frame.
+
+Run from the repository root::
+
+    python benchmarks/sfx_storm.py
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+import desper
+import pyglet
+import pyglet_desper as pdesper
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lastsanta import physics, sound     # NOQA
+
+FRAMES = 60
+BOUNCES_PER_FRAME = 200
+
+
+def direct(frame_bounces: int) -> int:
+    for _ in range(frame_bounces):
+        desper.resource_map[random.choice(sound.HIT_SFXS)].play()
+    return frame_bounces
+
+
+def main():
+    pdesper.resource_populator.root = str(Path(__file__).resolve().parent.parent / 'resources')
+    pdesper.resource_populator(desper.resource_map, trim_extensions=True)
+    for key in sound.HIT_SFXS:
+        desper.resource_map[key]
+
+    start = time.perf_counter()
+    started = sum(direct(BOUNCES_PER_FRAME) for _ in range(FRAMES))
+    direct_time = time.perf_counter() - start
+
+    mixer = sound.Mixer()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        for _ in range(BOUNCES_PER_FRAME):
+            mixer.play(random.choice(sound.HIT_SFXS))
+        mixer.flush()
+    mixer_time = time.perf_counter() - start
+    pyglet.clock.unschedule(mixer.flush)
+
+    world = desper.World()
+    dispatch_later = physics.DispatchLaterProcessor()
+    world.add_processor(dispatch_later)
+    world.create_entity(sound.SFXManager())
+    entities = list(range(BOUNCES_PER_FRAME))
+    played = sound.mixer.played
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        physics.post_batch(world, 'on_bounce', entities)
+        world.process(0.)
+        sound.mixer.flush()
+    bus_time = time.perf_counter() - start
+    pyglet.clock.unschedule(sound.mixer.flush)
+    channel = dispatch_later.channels['on_bounce']
+
+    print(f'{FRAMES} frames, {BOUNCES_PER_FRAME} bounces per frame')
+    print(f'direct: {started} players started, {direct_time * 1e3 / FRAMES:.2f} ms/frame')
+    print(f'mixer:  {mixer.played} played, {mixer.coalesced} coalesced, {mixer.dropped} dropped, '
+          f'{mixer_time * 1e3 / FRAMES:.2f} ms/frame')
+    print(f'bus:    {channel.posted} posted, {channel.delivered} delivered, '
+          f'{sound.mixer.played - played} played, {bus_time * 1e3 / FRAMES:.2f} ms/frame')
+
+
+if __name__ == '__main__':
+    main()
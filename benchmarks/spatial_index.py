@@ -0,0 +1,93 @@
+"""Compare full scans and the spatial index for item picking/hooking.
+
+Run from the repository root::
+
+    python benchmarks/spatial_index.py
+"""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import desper
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lastsanta import constants, logic, physics     # NOQA
+
+ITEM_COUNTS = 50, 500, 5000
+QUERIES = 200
+ITEM_SIZE = 150, 150
+
+
+def build_world(item_count: int) -> desper.World:
+    """Build a world with the given number of randomly placed items."""
+    world = desper.World()
+    world.add_processor(physics.SpatialIndexProcessor())
+
+    for _ in range(item_count):
+        world.create_entity(
+            desper.Transform2D((random.uniform(0, constants.VIEW_W - ITEM_SIZE[0]),
+                                random.uniform(0, constants.VIEW_H - ITEM_SIZE[1]))),
+            physics.CollisionRectangle(ITEM_SIZE),
+            physics.SpatialIndexSync(),
+            logic.Item())
+
+    return world
+
+
+def scan_point(world: desper.World, point) -> list[int]:
+    return [entity for entity, _ in world.get(logic.Item)
+            if physics.point_collision(point, desper.controller(entity, world))]
+
+
+def index_point(world: desper.World, point) -> list[int]:
+    spatial_index = world.get_processor(physics.SpatialIndexProcessor)
+    return [entity for entity in spatial_index.query_point(point)
+            if physics.point_collision(point, desper.controller(entity, world))]
+
+
+def scan_rectangle(world: desper.World, target: int) -> list[int]:
+    target_controller = desper.controller(target, world)
+    return [entity for entity, _ in world.get(physics.CollisionRectangle)
+            if entity != target
+            and physics.rectangle_collision(target_controller, desper.controller(entity, world))]
+
+
+def index_rectangle(world: desper.World, target: int) -> list[int]:
+    target_controller = desper.controller(target, world)
+    position = world.get_component(target, desper.Transform2D).position
+    coll_rectangle = world.get_component(target, physics.CollisionRectangle)
+    spatial_index = world.get_processor(physics.SpatialIndexProcessor)
+    return [entity for entity in spatial_index.query_rectangle(
+                position - coll_rectangle.offset, coll_rectangle.size)
+            if entity != target
+            and physics.rectangle_collision(target_controller, desper.controller(entity, world))]
+
+
+def main():
+    random.seed(0)
+    print(f'{"items":>6} {"query":>10} {"scan (us)":>12} {"index (us)":>12} {"speedup":>8}')
+
+    for item_count in ITEM_COUNTS:
+        world = build_world(item_count)
+        points = [(random.uniform(0, constants.VIEW_W), random.uniform(0, constants.VIEW_H))
+                  for _ in range(QUERIES)]
+        targets = random.choices(world.entities, k=QUERIES)
+
+        for query_name, scan, index, arguments in (
+                ('point', scan_point, index_point, points),
+                ('rectangle', scan_rectangle, index_rectangle, targets)):
+            # Sanity check: both strategies shall find the same entities
+            assert all(sorted(scan(world, arg)) == sorted(index(world, arg))
+                       for arg in arguments)
+
+            scan_time = timeit.timeit(lambda: [scan(world, arg) for arg in arguments], number=1)
+            index_time = timeit.timeit(lambda: [index(world, arg) for arg in arguments],
+                                       number=1)
+            print(f'{item_count:>6} {query_name:>10} {scan_time / QUERIES * 1e6:>12.1f} '
+                  f'{index_time / QUERIES * 1e6:>12.1f} {scan_time / index_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Measure level setup time and piling of parts, for many parts.
+
+Game worlds are built in headless mode with 50, 500 and 5,000 parts
+(see :class:`game.MainGameTransformer`), placed as blue noise and, for
+comparison, uniformly at random (as if NumPy was not installed, see
+:mod:`lastsanta.spawning`). Setup time covers building the world and
+switching to it (i.e. until all components are added). Piling is the
+mean number of other parts whose collision rectangle overlaps each
+part's. Run from the repository root (``-O`` silences debug prints of
+mouse motion)::
+
+    python -O benchmarks/spawn.py [runs]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import desper                       # NOQA
+import numpy as np                  # NOQA
+
+import lastsanta                    # NOQA
+from lastsanta import headless, logic, physics, spawning   # NOQA
+
+GIFT_NAME = 'car'
+PART_COUNTS = 50, 500, 5000
+
+
+def build(number_of_generated: int) -> tuple[float, desper.World]:
+    """Build and switch to a game world, return seconds taken and world."""
+    random.seed(0)
+    loop = headless.HeadlessLoop()
+    desper.default_loop = loop
+    handle = headless.game_world_handle(GIFT_NAME, number_of_generated=number_of_generated)
+
+    start = time.perf_counter()
+    world = handle()
+    loop.switch(handle)
+    loop.step()
+    return time.perf_counter() - start, world
+
+
+def piling(world: desper.World) -> float:
+    """Return the mean number of overlapping parts per part."""
+    rectangles = []
+    for entity, _ in world.get(logic.GiftPart):
+        transform = world.get_component(entity, desper.Transform2D)
+        rectangle = world.get_component(entity, physics.CollisionRectangle)
+        x = transform.position[0] - rectangle.offset[0]
+        y = transform.position[1] - rectangle.offset[1]
+        rectangles.append((x, y, x + rectangle.size[0], y + rectangle.size[1]))
+
+    rectangles = np.array(rectangles)
+    overlaps = 0
+    # Chunked, to keep pairwise arrays small
+    for chunk in np.array_split(rectangles, max(len(rectangles) // 500, 1)):
+        overlaps += np.count_nonzero(
+            (chunk[:, None, 0] < rectangles[None, :, 2])
+            & (rectangles[None, :, 0] < chunk[:, None, 2])
+            & (chunk[:, None, 1] < rectangles[None, :, 3])
+            & (rectangles[None, :, 1] < chunk[:, None, 3]))
+    # Every part overlaps itself
+    return (overlaps - len(rectangles)) / len(rectangles)
+
+
+def measure(number_of_generated: int, runs: int) -> tuple[float, float]:
+    """Return median setup time (ms) and piling of the last run."""
+    times = []
+    for _ in range(runs):
+        elapsed, world = build(number_of_generated)
+        times.append(elapsed * 1e3)
+    return statistics.median(times), piling(world)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    lastsanta.populate_resources(str(ROOT / 'resources'))
+    build(PART_COUNTS[0])           # Load resources
+    numpy_spawning = spawning.AVAILABLE
+    print(f'{"parts":>6} {"placement":>10} {"setup ms":>9} {"sample ms":>10} {"piling":>7}')
+    for number_of_generated in PART_COUNTS:
+        for placement, available in (('blue', True), ('uniform', False)):
+            spawning.AVAILABLE = available and numpy_spawning
+            setup_time, pile = measure(number_of_generated, runs)
+
+            sizes = {'part': (32, 32)}
+            start = time.perf_counter()
+            spawning.sample(('part',), number_of_generated, sizes, rng=random.Random(0))
+            sample_time = (time.perf_counter() - start) * 1e3
+
+            print(f'{number_of_generated:>6} {placement:>10} {setup_time:>9.1f} '
+                  f'{sample_time:>10.2f} {pile:>7.2f}')
+    spawning.AVAILABLE = numpy_spawning
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure startup milestones of the game, from source or frozen.
+
+The game is started a few times with the ``LASTSANTA_STARTUP_REPORT``
+environment variable set (see :mod:`lastsanta.startup`), and closed
+once the report is written (i.e. when all resources are loaded).
+Median times of each milestone are printed. Run from the repository
+root::
+
+    python benchmarks/startup.py [--runs N] [--headless]
+    python benchmarks/startup.py --executable build/<dir>/last_santa
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+TIMEOUT = 60.
+
+
+def run_once(command: list[str], env: dict[str, str]) -> dict[str, float]:
+    """Start the game, return its milestones (in milliseconds)."""
+    with tempfile.TemporaryDirectory() as directory:
+        report = Path(directory) / 'startup.txt'
+        process = subprocess.Popen(command, cwd=ROOT, env=env | {
+            'LASTSANTA_STARTUP_REPORT': str(report)})
+        deadline = time.monotonic() + TIMEOUT
+        try:
+            while not report.exists() or not report.read_text(encoding='utf8').endswith('\n'):
+                if process.poll() is not None:
+                    raise RuntimeError(f'game exited with status {process.returncode}')
+                if time.monotonic() > deadline:
+                    raise TimeoutError('no startup report')
+                time.sleep(0.05)
+        finally:
+            process.kill()
+            process.wait()
+
+        marks = {}
+        for line in report.read_text(encoding='utf8').splitlines():
+            name, rest = line.split(': ', 1)
+            marks[name] = float(rest.split('ms', 1)[0])
+        return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--executable', help='frozen build to run instead of main.py')
+    parser.add_argument('--headless', action='store_true', help='run without a display')
+    args = parser.parse_args()
+
+    command = [args.executable] if args.executable else [sys.executable, '-OO', 'main.py']
+    env = dict(os.environ)
+    if args.headless:
+        env['LASTSANTA_HEADLESS'] = '1'
+
+    runs = defaultdict(list)
+    for _ in range(args.runs):
+        for name, mark_time in run_once(command, env).items():
+            runs[name].append(mark_time)
+
+    print(f'{"milestone":<20} {"median (ms)":>12} {"min (ms)":>10}')
+    for name, times in sorted(runs.items(), key=lambda item: statistics.median(item[1])):
+        print(f'{name:<20} {statistics.median(times):>12.1f} {min(times):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+"""Micro-benchmarks of logic, physics and dialogue hot paths.
+
+Workbenches of 50, 500 and 5000 gift parts are built in headless mode
+(see :mod:`lastsanta.headless`), either loose or hooked in deep chains.
+Each benchmark times a single operation many times and records the
+median, mean and minimum time per operation, in microseconds.
+
+Results are written as JSON. Given a baseline (a previous results
+file), results are compared and regressions (median slower than the
+baseline by more than the tolerance, or benchmarks of the baseline
+that did not run) are flagged, with a non zero exit code. Run from the
+repository root::
+
+    python -O benchmarks/suite.py --output baseline.json
+    python -O benchmarks/suite.py --compare baseline.json [--tolerance 0.2]
+"""
+import argparse
+import datetime
+import functools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('LASTSANTA_HEADLESS', '1')
+
+import desper                                   # NOQA
+from ddesigner import Dialogue                  # NOQA
+from ddesigner.default_model import ShowMessageNode     # NOQA
+from pyglet.math import Vec2                    # NOQA
+
+import lastsanta                                # NOQA
+from lastsanta import constants, dialogue, game, gifts, graphics, logic, physics    # NOQA
+from lastsanta import masks, vectorized         # NOQA
+
+SIZES = 50, 500, 5000
+CHAIN_DEPTH = 25
+QUERIES = 100
+DIALOGUE_STEPS = 100
+MIN_CALLS = 5
+MIN_TIME = 0.2
+MAX_CALLS = 10000
+DEFAULT_TOLERANCE = 0.2
+STORY = ROOT / 'resources' / constants.DIAL_RESOURCES_PATH / 'story.json'
+
+
+@dataclass
+class Fixture:
+    """A workbench full of gift parts."""
+    world: desper.World
+    parts: list[int]
+    roots: list[int]
+
+
+def build_fixture(size: int, chain_depth: int = 1) -> Fixture:
+    """Build a workbench with the given number of parts.
+
+    Parts are hooked in chains of ``chain_depth`` parts each (``1``
+    means loose parts).
+    """
+    world = desper.World()
+    world.add_processor(logic.ItemDragProcessor())
+    world.add_processor(physics.SpatialIndexProcessor())
+    world.add_processor(logic.ItemChainProcessor())
+    world.add_processor(graphics.ZOrderProcessor())
+    world.add_processor(logic.HookedProcessor())
+    world.add_processor(physics.RectangleToAxisProcessor())
+    world.add_processor(physics.VelocityProcessor())
+
+    # Same layout as game.MainGameTransformer
+    world.create_entity(physics.CollisionAxes(constants.HORIZONTAL_MAIN_SEPARATOR_Y, 1))
+    world.create_entity(physics.CollisionAxes(constants.VERTICAL_MAIN_SEPARATOR_X, 0))
+    world.create_entity(physics.CollisionAxes(0., 1))
+    world.create_entity(physics.CollisionAxes(0., 0))
+    world.create_entity(physics.CollisionAxes(constants.VIEW_W, 0))
+
+    zorder = world.get_processor(graphics.ZOrderProcessor)
+    part_names = sorted(desper.resource_map[game.TOYS_RESOURCE_PATH].handles.keys())
+    parts = []
+    for _ in range(size):
+        part_name = random.choice(part_names)
+        part_image = desper.resource_map[game.TOYS_RESOURCE_PATH][part_name]
+        x = random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X + 10,
+                           constants.VIEW_W - part_image.width - 10)
+        y = random.uniform(10, constants.HORIZONTAL_MAIN_SEPARATOR_Y - part_image.height - 200)
+        parts.append(world.create_entity(
+            *game.GiftPartProto(x, y, part_name, batch=zorder.batch, group=zorder.group,
+                                program=zorder.program)))
+
+    chains = world.get_processor(logic.ItemChainProcessor)
+    roots = []
+    for start in range(0, size, chain_depth):
+        chain = parts[start:start + chain_depth]
+        roots.append(chain[0])
+        for parent, child in zip(chain, chain[1:]):
+            chains.hook(child, parent, Vec2(-10, -10))
+    world.get_processor(logic.HookedProcessor).process(0.)
+
+    return Fixture(world, parts, roots)
+
+
+@functools.cache
+def chained_fixture(size: int) -> Fixture:
+    """Return a shared fixture of chained parts, shall not be modified."""
+    return build_fixture(size, CHAIN_DEPTH)
+
+
+def random_point() -> Vec2:
+    return Vec2(random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X, constants.VIEW_W),
+                random.uniform(0, constants.HORIZONTAL_MAIN_SEPARATOR_Y))
+
+
+@dataclass
+class Case:
+    """A single benchmarked operation.
+
+    ``batch`` is the number of elementary operations done by each call
+    of ``operation``, times are reported per elementary operation.
+    ``reset`` is called (untimed) before each call.
+    """
+    operation: Callable[[], object]
+    batch: int = 1
+    reset: Callable[[], object] | None = None
+
+
+benchmarks: dict[str, tuple[Callable[..., Case], bool]] = {}
+
+
+def benchmark(name: str, sized=True):
+    """Register a benchmark, parametrized on workbench size if sized."""
+    def decorator(function):
+        benchmarks[name] = function, sized
+        return function
+
+    return decorator
+
+
+@benchmark('find_drag')
+def find_drag(size: int) -> Case:
+    fixture = build_fixture(size)
+    drag = fixture.world.get_processor(logic.ItemDragProcessor)
+    points = [random_point() for _ in range(QUERIES)]
+
+    def operation():
+        for point in points:
+            drag.find_drag(point)
+
+    return Case(operation, QUERIES)
+
+
+@benchmark('end_drag')
+def end_drag(size: int) -> Case:
+    fixture = build_fixture(size)
+    world = fixture.world
+    drag = world.get_processor(logic.ItemDragProcessor)
+    chains = world.get_processor(logic.ItemChainProcessor)
+    dropped = []
+
+    def reset():
+        # Unhook the part dropped last time and drag a random one
+        if dropped:
+            chains.unhook(dropped.pop())
+
+        entity = random.choice(fixture.parts)
+        chains.unhook(entity)
+        drag.dragged = desper.controller(entity, world)
+        transform = world.get_component(entity, desper.Transform2D)
+        drag.pickup_position = transform.position
+        transform.position = desper.math.Vec2(*(random_point() - Vec2(100, 100)))
+        dropped.append(entity)
+
+    return Case(drag.end_drag, reset=reset)
+
+
+@benchmark('hooked_process')
+def hooked_process(size: int) -> Case:
+    fixture = build_fixture(size, CHAIN_DEPTH)
+    world = fixture.world
+    hooked = world.get_processor(logic.HookedProcessor)
+    transforms = [world.get_component(root, desper.Transform2D) for root in fixture.roots]
+    offset = desper.math.Vec2(1, 0)
+
+    def reset():
+        # Move all assemblies
+        nonlocal offset
+        offset = -offset
+        for transform in transforms:
+            transform.position += offset
+
+    return Case(lambda: hooked.process(0.), reset=reset)
+
+
+def moving_fixture(size: int) -> Fixture:
+    """Build a fixture where all parts move."""
+    fixture = build_fixture(size)
+    for entity in fixture.parts:
+        angle = random.uniform(0, 2 * math.pi)
+        fixture.world.add_component(entity, physics.Velocity(
+            logic.MAX_MOUSE_INTERTIA_SPEED * math.cos(angle),
+            logic.MAX_MOUSE_INTERTIA_SPEED * math.sin(angle)))
+
+    return fixture
+
+
+@benchmark('velocity_step')
+def velocity_step(size: int) -> Case:
+    processor = moving_fixture(size).world.get_processor(physics.VelocityProcessor)
+    return Case(lambda: processor.process(1 / 60))
+
+
+@benchmark('axis_step')
+def axis_step(size: int) -> Case:
+    processor = moving_fixture(size).world.get_processor(physics.RectangleToAxisProcessor)
+    return Case(lambda: processor.process(1 / 60))
+
+
+if vectorized.AVAILABLE:
+    @benchmark('vectorized_step')
+    def vectorized_step(size: int) -> Case:
+        world = moving_fixture(size).world
+        processor = vectorized.VectorizedPhysicsProcessor()
+        world.add_processor(processor)
+        return Case(lambda: processor.process(1 / 60))
+
+
+@benchmark('find_major_gift')
+def find_major_gift(size: int) -> Case:
+    world = chained_fixture(size).world
+    return Case(lambda: logic.find_major_gift(world))
+
+
+def register_constraint_benchmarks():
+    """Register tree and compiled checks of all gift constraints."""
+    for gift_name, constraint in gifts.gifts.items():
+        def tree_check(size: int, constraint=constraint) -> Case:
+            world = chained_fixture(size).world
+            items = [part for _, part in world.get(logic.GiftPart)]
+            return Case(lambda: constraint.check(items))
+
+        def compiled_check(size: int, constraint=constraint) -> Case:
+            world = chained_fixture(size).world
+            compiled = logic.CompiledConstraint(constraint)
+            _, counts = logic.find_major_gift(world)
+            return Case(lambda: compiled.check_counts(counts))
+
+        benchmark(f'constraint_tree/{gift_name}')(tree_check)
+        benchmark(f'constraint_compiled/{gift_name}')(compiled_check)
+
+
+register_constraint_benchmarks()
+
+
+@benchmark('point_to_gamespace', sized=False)
+def point_to_gamespace() -> Case:
+    points = [(random.uniform(0, 960), random.uniform(0, 540)) for _ in range(QUERIES)]
+    mapping = physics.GameSpaceMapping((0, 0, 960, 540))
+
+    def operation():
+        for x, y in points:
+            mapping.point(x, y)
+
+    return Case(operation, QUERIES)
+
+
+def toy_masks() -> list[masks.AlphaMask]:
+    toys = desper.resource_map[game.TOYS_RESOURCE_PATH]
+    return [masks.get(f'{game.TOYS_RESOURCE_PATH}/{name}', toys[name].width, toys[name].height)
+            for name in sorted(toys.handles)]
+
+
+@benchmark('mask_contains', sized=False)
+def mask_contains() -> Case:
+    queries = [(mask, random.randrange(mask.width), random.randrange(mask.height))
+               for mask in random.choices(toy_masks(), k=QUERIES)]
+
+    def operation():
+        for mask, x, y in queries:
+            mask.contains(x, y)
+
+    return Case(operation, QUERIES)
+
+
+@benchmark('mask_overlaps', sized=False)
+def mask_overlaps() -> Case:
+    all_masks = toy_masks()
+    queries = [(mask, other, random.randint(-other.width // 2, mask.width // 2),
+                random.randint(-other.height // 2, mask.height // 2))
+               for mask, other in zip(random.choices(all_masks, k=QUERIES),
+                                      random.choices(all_masks, k=QUERIES))]
+
+    def operation():
+        for mask, other, dx, dy in queries:
+            mask.overlaps(other, dx, dy)
+
+    return Case(operation, QUERIES)
+
+
+@benchmark('dialogue_load', sized=False)
+def dialogue_load() -> Case:
+    handle = dialogue.DialogueHandle(str(STORY))
+    handle.load()           # Make sure the cache is there
+    return Case(handle.load)
+
+
+@benchmark('dialogue_load_uncached', sized=False)
+def dialogue_load_uncached() -> Case:
+    handle = dialogue.DialogueHandle(str(STORY))
+    return Case(handle.load, reset=lambda: handle.cache_filename.unlink(missing_ok=True))
+
+
+@benchmark('dialogue_step', sized=False)
+def dialogue_step() -> Case:
+    data = dialogue.DialogueHandle(str(STORY)).load()
+    story = None
+
+    def reset():
+        nonlocal story
+        story = Dialogue(data)
+
+    def operation():
+        for _ in range(DIALOGUE_STEPS):
+            node = story.next()
+            if node is None:
+                break
+            if isinstance(node, ShowMessageNode):
+                dialogue.parse_text(node, dialogue.LANG_ITA, story.variables)
+
+    return Case(operation, DIALOGUE_STEPS, reset)
+
+
+def measure(case: Case) -> dict:
+    """Time a case, return statistics in microseconds per operation."""
+    timings = []
+    start = time.perf_counter()
+    while (len(timings) < MIN_CALLS
+           or time.perf_counter() - start < MIN_TIME and len(timings) < MAX_CALLS):
+        if case.reset is not None:
+            case.reset()
+
+        call_start = time.perf_counter_ns()
+        case.operation()
+        timings.append((time.perf_counter_ns() - call_start) / 1e3 / case.batch)
+
+    return {'median_us': statistics.median(timings), 'mean_us': statistics.fmean(timings),
+            'min_us': min(timings), 'calls': len(timings)}
+
+
+def selected(key: str, pattern: str, sizes) -> bool:
+    """Check if a result is covered by a run (see :func:`run`)."""
+    name, _, size = key.partition('[')
+    return name.startswith(pattern) and (not size or int(size[:-1]) in sizes)
+
+
+def run(sizes, pattern: str = '') -> dict:
+    """Run all benchmarks whose name starts with pattern."""
+    results = {}
+    for name, (function, sized) in benchmarks.items():
+        if not name.startswith(pattern):
+            continue
+
+        for size in sizes if sized else (None,):
+            key = name if size is None else f'{name}[{size}]'
+            random.seed(key)
+            case = function(size) if sized else function()
+            results[key] = measure(case)
+            print(f'{key:<40} {results[key]["median_us"]:>12.2f} us', file=sys.stderr)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print a comparison with a baseline, return regressed keys.
+
+    Benchmarks of the baseline missing from results are regressions.
+    """
+    regressions = []
+    print(f'{"benchmark":<40} {"baseline":>12} {"current":>12} {"ratio":>7}')
+    for key, result in results.items():
+        if key not in baseline:
+            print(f'{key:<40} {"-":>12} {result["median_us"]:>12.2f} {"new":>7}')
+            continue
+
+        ratio = result['median_us'] / baseline[key]['median_us']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f'{key:<40} {baseline[key]["median_us"]:>12.2f} {result["median_us"]:>12.2f} '
+              f'{ratio:>7.2f}{flag}')
+
+    for key, result in baseline.items():
+        if key not in results:
+            print(f'{key:<40} {result["median_us"]:>12.2f} {"-":>12} {"":>7}  MISSING')
+            regressions.append(key)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='workbench sizes (number of parts)')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name starts with this')
+    parser.add_argument('--output', type=Path, help='write results to this JSON file')
+    parser.add_argument('--compare', type=Path, help='baseline results (JSON) to compare to')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown over the baseline (0.2 means 20%%)')
+    args = parser.parse_args()
+
+    lastsanta.populate_resources(str(ROOT / 'resources'))
+    results = run(args.sizes, args.filter)
+
+    report = {
+        'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'processor': platform.processor(), 'optimized': not __debug__,
+                 'numpy': vectorized.AVAILABLE},
+        'results': results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf8') as fout:
+            json.dump(report, fout, indent=1)
+    elif args.compare is None:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.compare is not None:
+        with open(args.compare, encoding='utf8') as fin:
+            baseline = {key: result for key, result in json.load(fin)['results'].items()
+                        if selected(key, args.filter, args.sizes)}
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.tolerance:.0%} or missing')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
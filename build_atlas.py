@@ -0,0 +1,120 @@
+"""Pack game images into texture atlas pages.
+
+Images listed in :data:`SOURCES` (relative to the resources
+directory) are packed in one or more PNG pages under
+``resources/atlas``, along with an index (``index.json``)::
+
+    {
+        "pages": ["page0.png", ...],
+        "regions": {
+            "image/toys/arm": {
+                "page": 0, "x": ..., "y": ..., "width": ..., "height": ...,
+                "sha1": ...
+            },
+            ...
+        }
+    }
+
+Coordinates follow pyglet's convention (origin at the bottom left).
+Hashes of the content of source images let the game ignore stale
+regions, see :mod:`lastsanta.atlas`. Run from the repository root
+(building with ``cx_setup.py`` runs it automatically)::
+
+    python build_atlas.py
+"""
+import json
+import os
+from pathlib import Path
+
+import pyglet
+
+from lastsanta.atlas import ATLAS_DIRECTORY, INDEX_FILENAME, file_digest
+
+RESOURCES_PATH = Path(__file__).resolve().parent / 'resources'
+SOURCES = 'image/toys/*.png', 'image/handler.png', 'image/delivery.png', 'image/letter.png'
+PAGE_SIZE = 1024
+PADDING = 2
+
+
+def resource_key(path: Path, root: Path) -> str:
+    """Return the resource map key of an image, without extension."""
+    return path.relative_to(root).with_suffix('').as_posix()
+
+
+def pack(sizes: dict[str, tuple[int, int]], page_size: int = PAGE_SIZE,
+         padding: int = PADDING) -> dict[str, tuple[int, int, int]]:
+    """Pack rectangles in shelves, tallest first.
+
+    Return, for each key, page index and position.
+    """
+    positions = {}
+    page = x = y = shelf_height = 0
+    for key, (width, height) in sorted(sizes.items(), key=lambda kv: (-kv[1][1], kv[0])):
+        if width + padding > page_size or height + padding > page_size:
+            raise ValueError(f'{key} does not fit in a {page_size}x{page_size} page')
+
+        # New shelf
+        if x + width + padding > page_size:
+            x = 0
+            y += shelf_height
+            shelf_height = 0
+
+        # New page
+        if y + height + padding > page_size:
+            page += 1
+            x = y = shelf_height = 0
+
+        positions[key] = page, x + padding, y + padding
+        x += width + padding
+        shelf_height = max(shelf_height, height + padding)
+
+    return positions
+
+
+def build(root: Path = RESOURCES_PATH, sources=SOURCES, page_size: int = PAGE_SIZE):
+    """Build atlas pages and index for the given sources."""
+    paths = sorted({path for pattern in sources for path in root.glob(pattern)})
+    images = {resource_key(path, root): pyglet.image.load(str(path)).get_image_data()
+              for path in paths}
+    positions = pack({key: (image.width, image.height) for key, image in images.items()},
+                     page_size)
+
+    page_count = max((page for page, _, _ in positions.values()), default=-1) + 1
+    pages = [bytearray(page_size * page_size * 4) for _ in range(page_count)]
+    for key, image in images.items():
+        page, x, y = positions[key]
+        pitch = image.width * 4
+        data = image.get_data('RGBA', pitch)
+        for row in range(image.height):
+            start = ((y + row) * page_size + x) * 4
+            pages[page][start:start + pitch] = data[row * pitch:(row + 1) * pitch]
+
+    atlas_path = root / ATLAS_DIRECTORY
+    atlas_path.mkdir(exist_ok=True)
+    page_filenames = [f'page{index}.png' for index in range(page_count)]
+    for filename, data in zip(page_filenames, pages):
+        pyglet.image.ImageData(page_size, page_size, 'RGBA', bytes(data)).save(
+            str(atlas_path / filename))
+
+    regions = {}
+    for path in paths:
+        key = resource_key(path, root)
+        page, x, y = positions[key]
+        regions[key] = {'page': page, 'x': x, 'y': y,
+                        'width': images[key].width, 'height': images[key].height,
+                        'sha1': file_digest(path)}
+
+    with open(atlas_path / INDEX_FILENAME, 'w', encoding='utf8') as fout:
+        json.dump({'pages': page_filenames, 'regions': regions}, fout, indent=1)
+
+    return page_count, len(regions)
+
+
+def main():
+    page_count, region_count = build()
+    print(f'Packed {region_count} images in {page_count} page(s) '
+          f'under {os.path.join("resources", ATLAS_DIRECTORY)}')
+
+
+if __name__ == '__main__':
+    main()
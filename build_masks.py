@@ -0,0 +1,104 @@
+"""Compute alpha masks and opaque bounds of toy images.
+
+Pixels of the images listed in :data:`SOURCES` (relative to the
+resources directory) are opaque if their alpha is at least
+:data:`ALPHA_THRESHOLD`. Masks are packed one bit per pixel, row by
+row (bottom row first, lowest bit first), in ``resources/masks``::
+
+    masks.bin       packed rows of all masks, one after the other
+    index.json      {
+                        "masks": {
+                            "image/toys/arm": {
+                                "width": ..., "height": ...,
+                                "bounds": [x_start, y_start, x_end, y_end],
+                                "offset": ..., "sha1": ...
+                            },
+                            ...
+                        }
+                    }
+
+Each row takes ``(width + 7) // 8`` bytes, starting at ``offset`` in
+``masks.bin``. Bounds enclose opaque pixels (ends are exclusive), in
+pyglet's convention (origin at the bottom left). Hashes of the content
+of source images let the game ignore stale masks, see
+:mod:`lastsanta.masks`. Run from the repository root (building with
+``cx_setup.py`` runs it automatically)::
+
+    python build_masks.py
+"""
+import json
+import os
+from pathlib import Path
+
+import pyglet
+
+from build_atlas import resource_key
+from lastsanta.atlas import file_digest
+from lastsanta.masks import MASKS_DIRECTORY, INDEX_FILENAME, DATA_FILENAME
+
+RESOURCES_PATH = Path(__file__).resolve().parent / 'resources'
+SOURCES = 'image/toys/*.png',
+ALPHA_THRESHOLD = 32
+
+
+def pack_rows(width: int, height: int, alpha: bytes,
+              threshold: int = ALPHA_THRESHOLD) -> tuple[bytes, tuple[int, int, int, int]]:
+    """Pack opaque pixels given the alpha channel, one row at a time.
+
+    Return packed rows and the bounds of opaque pixels (empty bounds
+    if there are none).
+    """
+    stride = (width + 7) // 8
+    packed = bytearray()
+    opaque_rows = []
+    for y in range(height):
+        row_alpha = alpha[y * width:(y + 1) * width]
+        row = int(''.join('1' if value >= threshold else '0'
+                          for value in reversed(row_alpha)), 2)
+        packed += row.to_bytes(stride, 'little')
+        if row:
+            opaque_rows.append((y, row))
+
+    if not opaque_rows:
+        return bytes(packed), (0, 0, 0, 0)
+
+    # Lowest set bit of a row is its first opaque pixel
+    x_start = min((row & -row).bit_length() - 1 for _, row in opaque_rows)
+    x_end = max(row.bit_length() for _, row in opaque_rows)
+    return bytes(packed), (x_start, opaque_rows[0][0], x_end, opaque_rows[-1][0] + 1)
+
+
+def build(root: Path = RESOURCES_PATH, sources=SOURCES, threshold: int = ALPHA_THRESHOLD):
+    """Build masks and index for the given sources."""
+    paths = sorted({path for pattern in sources for path in root.glob(pattern)})
+
+    data = bytearray()
+    masks = {}
+    for path in paths:
+        image = pyglet.image.load(str(path)).get_image_data()
+        alpha = image.get_data('RGBA', image.width * 4)[3::4]
+        packed, bounds = pack_rows(image.width, image.height, alpha, threshold)
+
+        masks[resource_key(path, root)] = {
+            'width': image.width, 'height': image.height, 'bounds': bounds,
+            'offset': len(data), 'sha1': file_digest(path)}
+        data += packed
+
+    masks_path = root / MASKS_DIRECTORY
+    masks_path.mkdir(exist_ok=True)
+    with open(masks_path / DATA_FILENAME, 'wb') as fout:
+        fout.write(data)
+    with open(masks_path / INDEX_FILENAME, 'w', encoding='utf8') as fout:
+        json.dump({'masks': masks}, fout, indent=1)
+
+    return len(masks), len(data)
+
+
+def main():
+    mask_count, size = build()
+    print(f'Computed {mask_count} masks ({size} bytes) '
+          f'under {os.path.join("resources", MASKS_DIRECTORY)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
-from cx_Freeze import setup, Executable
+from cx_Freeze import setup, Executable, build_exe
 import sys
 
+import build_atlas
+import build_masks
+
 TARGET = 'last_santa'
 ICON = 'resources/image/toys/lightbulb.png'
 EXCLUDE = ['tkinter', 'ssl', 'html', 'xml', 'xmlrpc', 'email',
-           'distutils', 'concurrent', 'multiprocessing', 'http', 'lib2to3',
+           'distutils', 'multiprocessing', 'http', 'lib2to3',
            'unittest', 'asyncio', 'pydoc_data']
 INCLUDE_FILES = ['resources']
 
@@ -13,6 +16,16 @@ build_options = {'excludes': EXCLUDE, 'optimize': 2,
 
 base = 'Win32GUI' if sys.platform == 'win32' else None
 
+
+class BuildExe(build_exe):
+    """Build the texture atlas and masks before freezing, to ship them along with resources."""
+
+    def run(self):
+        build_atlas.main()
+        build_masks.main()
+        super().run()
+
+
 executables = [
     Executable('main.py', base=base, target_name=TARGET, icon=ICON),
 ]
@@ -21,4 +34,5 @@ setup(name='L\'ultimo aiutante di Babbo Natale',
       version='1.0.0',
       description='',
       options={'build_exe': build_options},
+      cmdclass={'build_exe': BuildExe},
       executables=executables)
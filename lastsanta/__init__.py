@@ -1,38 +1,109 @@
+import os
 import sys
 from pathlib import Path
 
-import desper
-import pyglet_desper as pdesper
-from pyglet.window import Window
-from pyglet.gl import glClearColor
-from ddesigner import Dialogue
+from . import startup       # Imported first, to time startup
+
+import pyglet
 
 from . import constants
-from . import dialogue
 
-# Setup main loop and window
+# Headless mode shall be set before any OpenGL related import
+if os.environ.get(constants.HEADLESS_ENV_VAR):
+    pyglet.options['headless'] = True
+    pyglet.options['audio'] = ('silent',)
+
+import desper                       # NOQA
+import pyglet_desper as pdesper     # NOQA
+from pyglet.window import Window                 # NOQA
+from pyglet.gl import glClearColor              # NOQA
+from ddesigner import Dialogue                  # NOQA
+
+from . import atlas                             # NOQA
+from . import dialogue                          # NOQA
+from . import fonts                             # NOQA
+from . import loading                           # NOQA
+from . import masks                             # NOQA
+from . import recording                         # NOQA
+from . import timestep                          # NOQA
+
+# Setup main loop, the window is created by main
 interval = 1 / 60
-loop = pdesper.Loop(interval)
+loop = timestep.FixedStepLoop(constants.SIMULATION_STEP, interval)
 desper.default_loop = loop
-window = Window(960, 540)
-loop.connect_window_events(window, 'on_draw', 'on_mouse_press', 'on_mouse_release', 'on_resize',
-                           'on_mouse_motion', 'on_mouse_drag', 'on_key_press')
+window: Window | None = None
+loader = loading.ResourceLoader(desper.resource_map)
 
 
-def main():
-    glClearColor(*(constants.BG_COLOR / 255))
+def create_window() -> Window:
+    """Create the game window and connect it to the main loop."""
+    global window
+    window = Window(960, 540)
+    loop.connect_window_events(window, 'on_draw', 'on_mouse_press', 'on_mouse_release',
+                               'on_resize', 'on_mouse_motion', 'on_mouse_drag', 'on_key_press')
+    return window
+
 
+def populate_resources(root: str | None = None):
+    """Populate the resource map, without loading resources.
+
+    If not given, the default root is used (next to the executable if
+    the application is frozen).
+    """
+    if root is not None:
+        pdesper.resource_populator.root = root
     # Change root of resources if the app is frozen
-    if getattr(sys, 'frozen', False):
+    elif getattr(sys, 'frozen', False):
         # The application is frozen
         pdesper.resource_populator.root = str(Path(sys.executable).parent / 'resources')
 
-    pdesper.resource_populator.add_rule(constants.DIAL_RESOURCES_PATH, dialogue.DialogueHandle)
+    # Only JSON files, compiled caches also live in the directory
+    pdesper.resource_populator.add_rule(constants.DIAL_RESOURCES_PATH, dialogue.DialogueHandle,
+                                        file_exts={'.json'})
     pdesper.resource_populator(desper.resource_map, trim_extensions=True)
+    atlas.install(desper.resource_map, pdesper.resource_populator.root)
+    masks.install(desper.resource_map, pdesper.resource_populator.root)
+
 
-    # Load fonts
-    for font_handle in desper.resource_map['font'].handles:
-        desper.resource_map['font'][font_handle]
+def main():
+    startup.timer.mark('import')
+    create_window()
+    startup.timer.mark('window')
+    # Game space mouse input is recorded by physics.MouseToGameSpace
+    if os.environ.get(constants.RECORD_ENV_VAR):
+        recorder = recording.start(os.environ[constants.RECORD_ENV_VAR])
+        window.push_handlers(on_key_press=recorder.key)
+    glClearColor(*(constants.BG_COLOR / 255))
+
+    populate_resources()
+    startup.timer.mark('resource scan')
 
+    # Fonts are loaded by the worlds that need them
     dialogue.continue_dialogue(Dialogue(desper.resource_map['dial/story']), loop.switch)
+    startup.timer.mark('first line')
+    startup.on_first_frame(window, after_first_frame)
+
     loop.loop()
+
+
+def after_first_frame():
+    """Load what is not needed by dialogue lines, in background."""
+    startup.timer.mark('first frame')
+    imports = startup.import_deferred()
+    loader.start()
+
+    # Glyphs of dialogue lines. Those of letters are pre-warmed once
+    # the dialogue names them (see dialogue.prewarm_letter)
+    for handle in desper.resource_map.get(constants.DIAL_RESOURCES_PATH).handles.values():
+        fonts.prewarmer.request(dialogue.presenter.font_name, dialogue.presenter.font_size,
+                                handle.characters())
+
+    report_filename = os.environ.get(constants.STARTUP_REPORT_ENV_VAR)
+    if report_filename:
+        def write_report(dt):
+            if loader.done and not imports.is_alive():
+                startup.timer.mark('resources loaded')
+                startup.timer.write_report(report_filename)
+                pyglet.clock.unschedule(write_report)
+
+        pyglet.clock.schedule_interval(write_report, 0.1)
@@ -0,0 +1,114 @@
+"""Use prebuilt texture atlases (see ``build_atlas.py``).
+
+:func:`install` replaces image handles in the resource map with
+handles of atlas regions. The game keeps using the same keys (e.g.
+``image/toys/arm``), while all packed images share a few textures.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import desper
+import pyglet
+
+ATLAS_DIRECTORY = 'atlas'
+INDEX_FILENAME = 'index.json'
+
+
+class AtlasPageHandle(desper.Handle[pyglet.image.Texture]):
+    """Handle for a whole atlas page, as a texture."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def load(self) -> pyglet.image.Texture:
+        return pyglet.image.load(self.filename).get_texture()
+
+
+class AtlasRegionHandle(desper.Handle[pyglet.image.TextureRegion]):
+    """Handle for an image packed in an atlas page."""
+
+    def __init__(self, page: AtlasPageHandle, x: int, y: int, width: int, height: int,
+                 filename: str | None = None):
+        self.page = page
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.filename = filename
+
+    def load(self) -> pyglet.image.TextureRegion:
+        return self.page().get_region(self.x, self.y, self.width, self.height)
+
+
+_digests: dict[Path, tuple[tuple[int, int], str]] = {}
+
+
+def file_digest(path: Path) -> str:
+    """Return the hash of a file's content, to check freshness.
+
+    Digests are cached per file, until its modification time or size
+    change.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = stat.st_mtime_ns, stat.st_size
+    cached = _digests.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    digest = hashlib.sha1(path.read_bytes()).hexdigest()
+    _digests[path] = key, digest
+    return digest
+
+
+def is_fresh(source: Path, entry: dict) -> bool:
+    """Check if a source file did not change since it was built from.
+
+    ``entry`` is its entry in the index of the build. Content is
+    compared, by hash: copies of the resources (e.g. without
+    modification times) are fresh.
+    """
+    try:
+        return file_digest(source) == entry.get('sha1')
+    except OSError:
+        return False
+
+
+def install(resource_map: desper.ResourceMap, root: str) -> list[str]:
+    """Hand out atlas regions from the resource map, if an atlas exists.
+
+    Only images currently in the map whose source did not change since
+    the atlas was built are replaced. ``root`` is the resources
+    directory. Return replaced keys.
+    """
+    atlas_path = Path(root) / ATLAS_DIRECTORY
+    try:
+        with open(atlas_path / INDEX_FILENAME, encoding='utf8') as fin:
+            index = json.load(fin)
+    except (OSError, ValueError):
+        return []
+
+    # Pages are also added to the map, so that they are found by the
+    # resource loader
+    pages = []
+    for filename in index['pages']:
+        page = AtlasPageHandle(str(atlas_path / filename))
+        resource_map[f'{ATLAS_DIRECTORY}/{Path(filename).stem}'] = page
+        pages.append(page)
+
+    replaced = []
+    for key, region in index['regions'].items():
+        handle = resource_map.get(key)
+        if not isinstance(handle, desper.Handle) or handle.cached:
+            continue
+
+        filename = getattr(handle, 'filename', None)
+        if filename is None or not is_fresh(Path(filename), region):
+            continue
+
+        resource_map[key] = AtlasRegionHandle(pages[region['page']], region['x'], region['y'],
+                                              region['width'], region['height'], filename)
+        replaced.append(key)
+
+    return replaced
@@ -2,16 +2,28 @@ import pyglet.math as pmath
 
 DIAL_RESOURCES_PATH = 'dial'
 
+HEADLESS_ENV_VAR = 'LASTSANTA_HEADLESS'
+PROFILE_ENV_VAR = 'LASTSANTA_PROFILE'
+RECORD_ENV_VAR = 'LASTSANTA_RECORD'
+STARTUP_REPORT_ENV_VAR = 'LASTSANTA_STARTUP_REPORT'
+
 VIEW_W = 1920
 VIEW_H = 1080
 
 BG_COLOR = pmath.Vec4(16, 16, 42, 255)
 FG_COLOR = pmath.Vec4(255, 200, 0, 255)
 
+LETTER_FONT_SIZE = 20
+
 HORIZONTAL_MAIN_SEPARATOR_Y = VIEW_H - 240.
 HORIZONTAL_MAIN_SEPARATOR_WIDTH = 5.
 
 VERTICAL_MAIN_SEPARATOR_X = VIEW_W / 2
 
-MIN_DT = 1 / 240
+PART_BUDGET = 80
+"""Gift parts kept on the table across levels (see ``game.GiftTransformer``)."""
+
+SIMULATION_STEP = 1 / 60
+MAX_SUBSTEPS = 5
 MAX_DT = 1 / 20
+"""Largest step physics shall withstand (see ``benchmarks/axis_stress.py``)."""
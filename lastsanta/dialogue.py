@@ -1,3 +1,15 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import string
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 import desper
 import pyglet_desper as pdesper
 from ddesigner import from_file, DialogueData, Dialogue
@@ -6,14 +18,17 @@ from pyglet.text import Label
 from pyglet.math import Mat4
 
 from . import constants
+from . import fonts
 from . import physics
 from . import graphics
-from . import game
-from . import gifts
 from . import hotkeys
 from . import sound
 
+if TYPE_CHECKING:
+    from . import game      # Imported lazily, see game_world_handle
+
 LANG_ITA = 'ITA'
+LETTERS_RESOURCE_PATH = 'dial/letters'
 GIFT_NAME_DIALOGUE_VAR = 'gift_name'
 LETTER_NAME_DIALOGUE_VAR = 'letter_name'
 LETTER_FONT_NAME_VAR = 'letter_font_name'
@@ -24,16 +39,177 @@ HP_VAR = 'hp'
 TUTORIAL_VAR = 'tutorial'
 VOICE_VAR = 'voice'
 
+DIALOGUE_CACHE_DIR = '__pycache__'
+DIALOGUE_CACHE_VERSION = 1
+TEMPLATE_VARIABLE_PATTERN = re.compile(r'\$\{(\w+)\}')
+
+
+class TextTemplate:
+    """Text with ``${variable}`` placeholders, split once.
+
+    Literal text and variable names alternate in :attr:`parts`.
+    """
+    __slots__ = ('parts',)
+
+    def __init__(self, text: str):
+        self.parts = tuple(TEMPLATE_VARIABLE_PATTERN.split(text))
+
+    def substitute(self, variables) -> str:
+        """Return text with placeholders replaced by variable values.
+
+        Placeholders of unknown variables are left untouched.
+        """
+        if len(self.parts) == 1:
+            return self.parts[0]
+
+        parts = list(self.parts)
+        for index in range(1, len(parts), 2):
+            name = parts[index]
+            parts[index] = str(variables[name]) if name in variables else f'${{{name}}}'
+
+        return ''.join(parts)
+
+
+_text_templates: dict[str, TextTemplate] = {}
+
+
+def text_template(text: str) -> TextTemplate:
+    """Return the (cached) template of a text."""
+    template = _text_templates.get(text)
+    if template is None:
+        template = _text_templates[text] = TextTemplate(text)
+    return template
+
+
+def parse_text(node: ShowMessageNode, language: str, variables) -> str:
+    """Return the text of a message node, with variables substituted.
+
+    Equivalent to ``node.parse_text``, without scanning the text again.
+    """
+    return text_template(node.text[language]).substitute(variables)
+
+
+def compile_templates(source: str) -> dict[str, TextTemplate]:
+    """Return templates of all message texts from a dialogue JSON source."""
+    templates = {}
+    for dialogue_tree in json.loads(source):
+        for node in dialogue_tree.get('nodes', ()):
+            if node.get('node_type') != 'show_message':
+                continue
+            for text in node.get('text', {}).values():
+                templates[text] = TextTemplate(text)
+
+    return templates
+
 
 class DialogueHandle(desper.Handle[DialogueData]):
-    """Handle for dialogue resources."""
+    """Handle for dialogue resources.
+
+    Parsed dialogues and their text templates are cached on disk (in a
+    ``__pycache__`` directory next to the resource). The cache is
+    invalidated when the resource changes, based on modification time,
+    size and hash of its content.
+    """
 
     def __init__(self, filename):
         self.filename = filename
+        self.templates: dict[str, TextTemplate] = {}
+        self._characters: frozenset[str] | None = None
+
+    @property
+    def cache_filename(self) -> Path:
+        path = Path(self.filename)
+        return path.parent / DIALOGUE_CACHE_DIR / f'{path.name}.pickle'
 
     def load(self) -> DialogueData:
-        with open(self.filename, encoding='utf8') as fin:
-            return from_file(fin)
+        stat = Path(self.filename).stat()
+        key = stat.st_mtime_ns, stat.st_size
+
+        header, payload = self._read_cache()
+        if header is not None and header['key'] == key:
+            data, templates = payload
+            self.templates = templates
+            _text_templates.update(templates)
+            return data
+
+        with open(self.filename, 'rb') as fin:
+            source = fin.read()
+        digest = hashlib.sha1(source).hexdigest()
+
+        # Touched but unchanged, refresh the key
+        if header is not None and header['digest'] == digest:
+            data, templates = payload
+        else:
+            text = source.decode('utf8')
+            data = from_file(io.StringIO(text))
+            templates = compile_templates(text)
+
+        self.templates = templates
+        _text_templates.update(templates)
+        self._write_cache({'version': DIALOGUE_CACHE_VERSION, 'key': key, 'digest': digest},
+                          (data, templates))
+        return data
+
+    def characters(self) -> frozenset[str]:
+        """Return characters of the messages (loading the dialogue).
+
+        Digits are included, for substituted numbers.
+        """
+        if self._characters is None:
+            self()
+            self._characters = frozenset(''.join(part for template in self.templates.values()
+                                                 for part in template.parts[::2])
+                                         + string.digits)
+        return self._characters
+
+    def _read_cache(self) -> tuple[dict | None, tuple | None]:
+        """Return header and payload of the cache, if valid."""
+        try:
+            with open(self.cache_filename, 'rb') as fin:
+                header = pickle.load(fin)
+                if header.get('version') != DIALOGUE_CACHE_VERSION:
+                    return None, None
+                return header, pickle.load(fin)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError,
+                ImportError):
+            return None, None
+
+    def _write_cache(self, header: dict, payload: tuple):
+        """Write the cache, silently give up on failure.
+
+        The cache is written to a temporary file first, then moved in
+        place: readers (e.g. other threads) never see a partial one.
+        """
+        cache_filename = self.cache_filename
+        temporary_filename = None
+        try:
+            cache_filename.parent.mkdir(exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=cache_filename.parent,
+                                             prefix=cache_filename.name, suffix='.tmp',
+                                             delete=False) as fout:
+                temporary_filename = fout.name
+                pickle.dump(header, fout)
+                pickle.dump(payload, fout)
+            os.replace(temporary_filename, cache_filename)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            if temporary_filename is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(temporary_filename)
+
+
+def game_world_handle(dialogue: Dialogue, plausible_parts: tuple[str, ...],
+                      number_of_generated: int, gift,
+                      letter_transformer: 'game.LetterTransformer') -> desper.WorldHandle:
+    """Return the handle of a new game world (without hotkeys)."""
+    from . import game      # NOQA (imported after the first frame, see startup)
+
+    handle = desper.WorldHandle()
+    handle.transform_functions.append(pdesper.init_graphics_transformer)
+    handle.transform_functions.append(
+        game.MainGameTransformer(dialogue, plausible_parts, number_of_generated))
+    handle.transform_functions.append(game.GiftTransformer(gift))
+    handle.transform_functions.append(letter_transformer)
+    return handle
 
 
 def continue_dialogue(dialogue: Dialogue, switch_function=desper.switch, language=LANG_ITA):
@@ -48,8 +224,8 @@ def continue_dialogue(dialogue: Dialogue, switch_function=desper.switch, languag
                 continue_dialogue(Dialogue(desper.resource_map['dial/story']), language=language)
                 stop = True
 
-            # If it's a dialogue line, build a new world handle and
-            # switch to it.
+            # If it's a dialogue line, show it in the dialogue world
+            # (switching to it if needed).
             case ShowMessageNode():
                 # Keep track of game world handle
                 current_world = desper.default_loop.current_world
@@ -59,18 +235,15 @@ def continue_dialogue(dialogue: Dialogue, switch_function=desper.switch, languag
                     if passthrough_query:
                         _, passthrough_handle = passthrough_query[0]
 
-                new_handle = desper.WorldHandle()
-                new_handle.transform_functions.append(pdesper.init_graphics_transformer)
-                new_handle.transform_functions.append(
-                    DialogueWorldTransformer(new_node.parse_text(language, dialogue.variables)))
-                new_handle.transform_functions.append(
-                    DialogueMachineTransfomer(dialogue, passthrough_handle))
-                new_handle.transform_functions.append(hotkeys.hotkeys_transformer)
-                switch_function(new_handle)
+                presenter.show(parse_text(new_node, language, dialogue.variables), dialogue,
+                               passthrough_handle, switch_function)
+                prewarm_letter(dialogue)
                 stop = True
 
             # On wait, get back to new game
             case WaitNode():
+                from . import game, gifts       # NOQA (see startup)
+
                 # Retrieve metadata for game world
                 gift = gifts.gifts[dialogue[GIFT_NAME_DIALOGUE_VAR]]
                 go_back = dialogue[BACK_DIALOGUE_VAR]
@@ -96,18 +269,24 @@ def continue_dialogue(dialogue: Dialogue, switch_function=desper.switch, languag
 
                 # New world, build from scratch
                 else:
-                    handle.transform_functions.append(pdesper.init_graphics_transformer)
-                    handle.transform_functions.append(
-                        game.MainGameTransformer(dialogue, tuple(normal_items),
-                                                 number_of_generated))
-                    handle.transform_functions.append(game.GiftTransformer(gift))
-                    handle.transform_functions.append(letter_transformer)
+                    handle = game_world_handle(dialogue, tuple(sorted(normal_items)),
+                                               number_of_generated, gift, letter_transformer)
                     handle.transform_functions.append(hotkeys.hotkeys_transformer)
 
                 switch_function(handle)
                 stop = True
 
 
+def prewarm_letter(dialogue: Dialogue):
+    """Pre-warm glyphs of the next letter, once named by the dialogue."""
+    letter_name = dialogue[LETTER_NAME_DIALOGUE_VAR]
+    letter_font_name = dialogue[LETTER_FONT_NAME_VAR]
+    letter_handle = desper.resource_map.get(LETTERS_RESOURCE_PATH).handles.get(letter_name)
+    if letter_handle is not None and letter_font_name:
+        fonts.prewarmer.request(letter_font_name, constants.LETTER_FONT_SIZE,
+                                letter_handle.characters())
+
+
 @desper.event_handler('on_mouse_game_press')
 class DialogueTriggerOnClick:
     """On click, continue dialogue."""
@@ -130,13 +309,14 @@ class DialogueWorldTransformer:
 
     def __call__(self, _, world: desper.World):
         main_batch = pdesper.retrieve_batch(world)
+        fonts.require(self.font_name)
 
         # Rendering
         world.add_processor(graphics.CameraProcessor())
         world.create_entity(
             graphics.BlackBarsViewportHandler(constants.VIEW_W, constants.VIEW_H),
-            pdesper.Camera(main_batch,
-                           projection=Mat4.orthogonal_projection(0, 1920, 0, 1080, 0, 1)))
+            graphics.Camera(main_batch,
+                            projection=Mat4.orthogonal_projection(0, 1920, 0, 1080, 0, 1)))
 
         world.create_entity(Label(self.text, x=100, y=100, width=constants.VIEW_W - 100,
                                   multiline=True, anchor_y='bottom',
@@ -150,7 +330,7 @@ class DialogueWorldTransformer:
 class DialogueMachineTransfomer:
     """Given a dialogue state machine, add logic to transition forward."""
 
-    def __init__(self, dialogue: Dialogue, previous: desper.WorldHandle):
+    def __init__(self, dialogue: Dialogue, previous: desper.WorldHandle | None):
         self.dialogue = dialogue
         self.previous = previous
 
@@ -158,8 +338,64 @@ class DialogueMachineTransfomer:
         world.add_processor(physics.DispatchLaterProcessor(), -1)
         world.create_entity(physics.MouseToGameSpace())
         world.create_entity(DialogueTriggerOnClick(self.dialogue))
-        world.create_entity(self.previous)
+        if self.previous is not None:
+            world.create_entity(self.previous)
 
         # Sound
-        if self.dialogue[VOICE_VAR]:
-            world.create_entity(sound.VoiceSFXManager())
+        world.create_entity(sound.VoiceSFXManager(bool(self.dialogue[VOICE_VAR])))
+
+
+class DialoguePresenter:
+    """Show dialogue lines in a single, persistent world.
+
+    The world is built for the first line. Following lines only replace
+    the label text, the dialogue continued on click and the handle of
+    the world to get back to.
+    """
+
+    def __init__(self, font_name='Mechanical', font_size=50):
+        self.font_name = font_name
+        self.font_size = font_size
+        self.handle: desper.WorldHandle | None = None
+
+    def show(self, text: str, dialogue: Dialogue, previous: desper.WorldHandle | None,
+             switch_function=desper.switch):
+        """Show a line, switching to the dialogue world if needed."""
+        if self.handle is None:
+            self.handle = desper.WorldHandle()
+            self.handle.transform_functions.append(pdesper.init_graphics_transformer)
+            self.handle.transform_functions.append(
+                DialogueWorldTransformer(text, self.font_name, self.font_size))
+            self.handle.transform_functions.append(
+                DialogueMachineTransfomer(dialogue, previous))
+            self.handle.transform_functions.append(hotkeys.hotkeys_transformer)
+            switch_function(self.handle)
+            return
+
+        world = self.handle()
+        _, label = world.get(Label)[0]
+        label.text = text
+
+        _, trigger = world.get(DialogueTriggerOnClick)[0]
+        trigger.dialogue = dialogue
+
+        for entity, _ in world.get(desper.WorldHandle):
+            world.remove_component(entity, desper.WorldHandle)
+        if previous is not None:
+            world.create_entity(previous)
+
+        _, voice = world.get(sound.VoiceSFXManager)[0]
+        voice.enabled = bool(dialogue[VOICE_VAR])
+
+        if desper.default_loop.current_world is world:
+            voice.play()
+        else:
+            # Resizes (e.g. fullscreen) are missed while in other worlds
+            window = graphics.current_window()
+            if window is not None:
+                for _, viewport_handler in world.get(graphics.BlackBarsViewportHandler):
+                    viewport_handler.on_resize(window.width, window.height)
+            switch_function(self.handle)
+
+
+presenter = DialoguePresenter()
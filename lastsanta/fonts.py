@@ -0,0 +1,102 @@
+"""Load fonts on demand and pre-warm their glyphs.
+
+Font files are registered (:func:`require`) the first time a label
+needs their family. The first label in a font and size rasterizes
+all of its glyphs, which may stall a frame: :class:`GlyphPrewarmer`
+rasterizes them ahead of time, a few at a time, in idle time.
+"""
+import time
+from collections import deque
+from collections.abc import Iterable
+
+import desper
+import pyglet
+from pyglet.font.base import Font
+
+FONTS_RESOURCE_PATH = 'font'
+LABEL_DPI = 96
+"""Resolution assumed by labels, part of the key of their fonts."""
+PREWARM_BUDGET = 1 / 500
+"""Time (in seconds) spent rasterizing glyphs on each clock tick."""
+
+_required: set[str] = set()
+
+
+def _family_key(font_name: str) -> str:
+    """Return a key matching the font family to its file names."""
+    return font_name.replace(' ', '').lower()
+
+
+def require(font_name: str):
+    """Register the font files of a family, if not done yet.
+
+    Files are matched by name: ``Playfair Display`` matches
+    ``PlayfairDisplayRegular-ywLOY.ttf``.
+    """
+    family_key = _family_key(font_name)
+    if family_key in _required:
+        return
+    _required.add(family_key)
+
+    for key, handle in desper.resource_map[FONTS_RESOURCE_PATH].handles.items():
+        if key.lower().startswith(family_key):
+            handle()
+
+
+class GlyphPrewarmer:
+    """Rasterize glyphs of fonts in idle time.
+
+    Requested glyphs (:meth:`request`) are rasterized on each clock
+    tick, within a time budget. Fonts are kept alive along with their
+    glyphs, labels in the same font and size find them ready.
+    """
+
+    def __init__(self, budget: float = PREWARM_BUDGET):
+        self.budget = budget
+        self.rasterized = 0
+        self.fonts: dict[tuple[str, float], Font] = {}
+        self._queue: deque[tuple[Font, str]] = deque()
+
+    @property
+    def pending(self) -> int:
+        """Number of glyphs still to be rasterized."""
+        return sum(len(characters) for _, characters in self._queue)
+
+    def font(self, font_name: str, font_size: float) -> Font:
+        """Return a font, as loaded by labels."""
+        font = self.fonts.get((font_name, font_size))
+        if font is None:
+            require(font_name)
+            font = self.fonts[font_name, font_size] = pyglet.font.load(font_name, font_size,
+                                                                       dpi=LABEL_DPI)
+        return font
+
+    def request(self, font_name: str, font_size: float, characters: Iterable[str]):
+        """Rasterize characters of a font, unless they are already."""
+        font = self.font(font_name, font_size)
+        missing = ''.join(sorted(set(characters).difference(font.glyphs)))
+        if not missing:
+            return
+
+        if not self._queue:
+            pyglet.clock.schedule(self.poll)
+        self._queue.append((font, missing))
+
+    def poll(self, dt=0., budget: float | None = None):
+        """Rasterize requested glyphs, within a budget.
+
+        Scheduled on the pyglet clock by :meth:`request`.
+        """
+        deadline = time.perf_counter() + (self.budget if budget is None else budget)
+        while self._queue and time.perf_counter() < deadline:
+            font, characters = self._queue.popleft()
+            font.get_glyphs(characters[0])
+            self.rasterized += 1
+            if len(characters) > 1:
+                self._queue.appendleft((font, characters[1:]))
+
+        if not self._queue:
+            pyglet.clock.unschedule(self.poll)
+
+
+prewarmer = GlyphPrewarmer()
@@ -1,6 +1,7 @@
 """Main game world utilities."""
 import random
-from collections.abc import Iterable
+from collections import Counter
+from collections.abc import Iterable, Sequence
 
 import desper
 import pyglet_desper as pdesper
@@ -16,9 +17,14 @@ from . import logic
 from . import constants
 from . import physics
 from . import dialogue
+from . import fonts
+from . import masks
+from . import recording
 from . import sound
+from . import spawning
+from . import vectorized
 
-LETTERS_RESOURCE_PATH = 'dial/letters'
+LETTERS_RESOURCE_PATH = dialogue.LETTERS_RESOURCE_PATH
 TOYS_RESOURCE_PATH = 'image/toys'
 
 
@@ -41,31 +47,44 @@ class DeliveryButton(desper.Controller):
         # Retrive gift and constraint
         major_entity, major_gift = logic.find_major_gift(self.world)
         constraint_entity, constraint_container = gift_constraint_query[0]
-        constraint: logic.Constraint = constraint_container.constraint
+        constraint: logic.CompiledConstraint = constraint_container.compiled
 
         self.world.delete_entity(constraint_entity)
 
+        # Check before launching, which stops counting the gift's parts
+        check_result = constraint.check_counts(major_gift)
+
         # Launch gift
-        launch_gift(major_entity)
+        if major_entity is not None:
+            launch_gift(major_entity)
 
-        self.world.dispatch('on_delivery', constraint.check(major_gift))
+        self.world.dispatch('on_delivery', check_result)
 
 
 @desper.coroutine
 def launch_gift(entity):
-    """Launch given gift entity and delete it briefly after."""
+    """Launch given gift entity and delete it briefly after.
+
+    All the items hooked to it are launched along.
+    """
     current_world = desper.default_loop.current_world
-    # Remove collisions to make it go wooo, remove item to prevent dragging
-    current_world.remove_component(entity, logic.Item)
-    current_world.remove_component(entity, physics.CollisionRectangle)
-    current_world.remove_component(entity, physics.Velocity)
-    current_world.remove_component(entity, logic.GiftPart)
-    current_world.add_component(entity, physics.Velocity(0, 1500.))
+    chains = current_world.get_processor(logic.ItemChainProcessor)
     # Make on top
-    current_world.get_component(entity, Sprite).group = pyglet.graphics.Group(
-        logic.get_next_top_value(current_world))
+    logic.bring_to_top(current_world, entity)
+    launched_entities = chains.subtree(entity)
+
+    for launched_entity in launched_entities:
+        # Remove collisions to make it go wooo, remove item to prevent dragging
+        current_world.remove_component(launched_entity, logic.Item)
+        current_world.remove_component(launched_entity, physics.SpatialIndexSync)
+        current_world.remove_component(launched_entity, physics.CollisionRectangle)
+        current_world.remove_component(launched_entity, physics.Velocity)
+        current_world.remove_component(launched_entity, logic.GiftPart)
+        current_world.add_component(launched_entity, physics.Velocity(0, 1500.))
     yield 3
-    current_world.delete_entity(entity)
+
+    for launched_entity in launched_entities:
+        current_world.delete_entity(launched_entity)
 
 
 @desper.event_handler('on_update')
@@ -83,7 +102,7 @@ class Slider(desper.Controller):
         self.start_pos = self.transform.position.x
 
     def on_update(self, dt):
-        self.dt = pmath.clamp(dt, constants.MIN_DT, constants.MAX_DT)
+        self.dt = dt
 
     def lerp_to_target(self, target_x):
         """Generator, can be used as coroutien to lerp to a target."""
@@ -178,49 +197,98 @@ class GiftPartProto(desper.Prototype):
     """Prototype for gift parts.
 
     Gift part category and sprite are selected automatically based on
-    the given name.
+    the given name. Parts are stacked through
+    :class:`graphics.ZOrderProcessor`, pass its batch, group and program
+    to prevent migrating sprites after creation. Parts collide with their
+    opaque pixels only (see :mod:`masks`). Image and mask can be given,
+    if already looked up (see :func:`spawn_parts`).
     """
-    component_types = (Sprite, desper.Transform2D, pdesper.SpriteSync, physics.BBox, logic.Item,
+    component_types = (Sprite, desper.Transform2D, graphics.SpriteSync, graphics.ZOrderSync,
+                       masks.AlphaMask, physics.BBox, physics.SpatialIndexSync, logic.Item,
                        logic.GiftPart)
 
     def __init__(self, x, y, sprite_name: str, batch: pyglet.graphics.Batch,
-                 group: pyglet.graphics.Group | None = None, z=0):
+                 group: pyglet.graphics.Group | None = None, z=0, program=None,
+                 image: pyglet.image.AbstractImage | None = None,
+                 mask: masks.AlphaMask | None = None):
         self.x = x
         self.y = y
         self.z = z
         self.sprite_name = sprite_name
         self.batch = batch
         self.group = group
+        self.program = program
+        if image is None:
+            image = desper.resource_map[TOYS_RESOURCE_PATH][sprite_name]
+        self.image = image
+        if mask is None:
+            mask = masks.get(f'{TOYS_RESOURCE_PATH}/{sprite_name}', image.width, image.height)
+        self.mask = mask
 
     def init_Sprite(self, component_type):
-        return component_type(desper.resource_map[TOYS_RESOURCE_PATH][self.sprite_name],
-                              z=self.z,
-                              subpixel=True, batch=self.batch, group=self.group)
+        return component_type(self.image, self.x, self.y, self.z,
+                              subpixel=True, batch=self.batch, group=self.group,
+                              program=self.program)
 
     def init_Transform2D(self, component_type):
         return component_type((self.x, self.y))
 
+    def init_AlphaMask(self, component_type):
+        return self.mask
+
     def init_GiftPart(self, component_type):
         return component_type(self.sprite_name)
 
 
+def spawn_parts(world: desper.World, parts: Iterable[tuple[str, float, float]],
+                batch: pyglet.graphics.Batch, group: pyglet.graphics.Group | None = None,
+                program=None) -> list[int]:
+    """Create gift parts (:class:`GiftPartProto`), return their entities.
+
+    Parts are given as name and position (see :func:`spawning.sample`).
+    Images and masks are looked up once per part name.
+    """
+    toys = desper.resource_map[TOYS_RESOURCE_PATH]
+    resources: dict[str, tuple[pyglet.image.AbstractImage, masks.AlphaMask]] = {}
+    entities = []
+    for part_name, x, y in parts:
+        resource = resources.get(part_name)
+        if resource is None:
+            image = toys[part_name]
+            resource = resources[part_name] = (
+                image, masks.get(f'{TOYS_RESOURCE_PATH}/{part_name}', image.width, image.height))
+        image, mask = resource
+
+        entities.append(world.create_entity(
+            *GiftPartProto(x, y, part_name, batch, group, program=program, image=image,
+                           mask=mask)))
+
+    return entities
+
+
 class MainGameTransformer:
     """Populate a game level."""
 
-    def __init__(self, story_dialogue: Dialogue, plausible_parts: Iterable[str],
+    def __init__(self, story_dialogue: Dialogue, plausible_parts: Sequence[str],
                  number_of_generated: int = 50):
         self.story_dialogue = story_dialogue
         self.plausible_parts = plausible_parts
         self.number_of_generated = number_of_generated
 
     def __call__(self, handle, world: desper.World):
+        # Seeds generated parts and sounds (SFXManager), logged if recording
+        recording.reseed()
         main_batch = pdesper.retrieve_batch(world)
 
         # General control
         world.add_processor(desper.OnUpdateProcessor())
         world.add_processor(desper.CoroutineProcessor())
         world.add_processor(logic.ItemDragProcessor())
+        world.add_processor(physics.SpatialIndexProcessor())
+        world.add_processor(logic.ItemChainProcessor())
+        world.add_processor(graphics.ZOrderProcessor())
         world.add_processor(physics.DispatchLaterProcessor(), -1)
+        world.add_processor(graphics.InterpolationProcessor(), -2)
         world.create_entity(physics.MouseToGameSpace())
         # Add self handle as an entity, used later for retrieval
         world.create_entity(handle)
@@ -232,12 +300,15 @@ class MainGameTransformer:
         world.add_processor(graphics.CameraProcessor())
         world.create_entity(
             graphics.BlackBarsViewportHandler(constants.VIEW_W, constants.VIEW_H),
-            pdesper.Camera(main_batch,
-                           projection=pmath.Mat4.orthogonal_projection(0, 1920, 0, 1080, 0, 1)))
+            graphics.Camera(main_batch,
+                            projection=pmath.Mat4.orthogonal_projection(0, 1920, 0, 1080, 0, 1)))
 
         # Physics
-        world.add_processor(physics.RectangleToAxisProcessor())
-        world.add_processor(physics.VelocityProcessor())
+        if vectorized.AVAILABLE:
+            world.add_processor(vectorized.VectorizedPhysicsProcessor())
+        else:
+            world.add_processor(physics.RectangleToAxisProcessor())
+            world.add_processor(physics.VelocityProcessor())
         world.add_processor(logic.HookedProcessor())
 
         # Layout
@@ -259,31 +330,25 @@ class MainGameTransformer:
         world.create_entity(Sprite(desper.resource_map['image/handler'], batch=main_batch),
                             desper.Transform2D((constants.VIEW_W + 400,
                                                 constants.HORIZONTAL_MAIN_SEPARATOR_Y)),
-                            pdesper.SpriteSync(),
+                            graphics.SpriteSync(),
                             Slider(),
                             TheHandler())
 
         # Delivery button
         world.create_entity(Sprite(desper.resource_map['image/delivery'], batch=main_batch),
                             desper.Transform2D((300, constants.VIEW_H - 200)),
-                            pdesper.SpriteSync(),
+                            graphics.SpriteSync(),
                             physics.BBox(),
                             DeliveryButton())
 
         world.create_entity(DialogueManager(self.story_dialogue))
 
-        # Objects
-        for index in range(self.number_of_generated):
-            # Sample part name and position
-            part_name = random.choice(self.plausible_parts)
-            part_image = desper.resource_map[TOYS_RESOURCE_PATH][part_name]
-            x = random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X + 10,
-                               constants.VIEW_W - part_image.width - 10)
-            y = random.uniform(10,
-                               constants.HORIZONTAL_MAIN_SEPARATOR_Y - part_image.height - 200)
-            world.create_entity(*GiftPartProto(x, y, part_name,
-                                               batch=main_batch,
-                                               group=pyglet.graphics.Group(index + 10)))
+        # Objects, sampled and created all at once
+        zorder = world.get_processor(graphics.ZOrderProcessor)
+        toys = desper.resource_map[TOYS_RESOURCE_PATH]
+        sizes = {name: (toys[name].width, toys[name].height) for name in self.plausible_parts}
+        spawn_parts(world, spawning.sample(self.plausible_parts, self.number_of_generated, sizes),
+                    batch=zorder.batch, group=zorder.group, program=zorder.program)
 
         # Add borders to the whole view
         world.create_entity(physics.CollisionAxes(0., 1))                       # Horizontal zero
@@ -295,37 +360,53 @@ class MainGameTransformer:
 
 
 class GiftTransformer:
-    """Add given gift constraint to the world + add some items."""
+    """Add given gift constraint to the world + add some items.
 
-    def __init__(self, gift_constraint):
+    Only the fewest parts making the order satisfiable are added (see
+    :meth:`logic.CompiledConstraint.plan`). If parts on the table would
+    exceed the budget, stale ones are reclaimed first (see
+    :func:`logic.reclaim_parts`).
+    """
+
+    def __init__(self, gift_constraint, part_budget: int = constants.PART_BUDGET):
         self.gift_constraint = gift_constraint
+        self.part_budget = part_budget
 
     def __call__(self, _, world: desper.World):
-        main_batch = pdesper.retrieve_batch(world)
+        recording.reseed()
 
         # Game elements and logic
-        world.create_entity(logic.GiftConstraint(self.gift_constraint))
-
-        # Find missing items for the constriant and create some of them
-        # to make sure it is satisfiable.
-        full_gift = [gift_part for _, gift_part in world.get(logic.GiftPart)]
-
-        for reason_constraint in self.gift_constraint.check(full_gift)[1]:
-            if type(reason_constraint) is logic.ItemSetConstraint:
-                for _ in range(reason_constraint.count):
-                    # Sample part name and position
-                    part_name = random.choice(tuple(reason_constraint.allowed_set))
-                    part_image = desper.resource_map[TOYS_RESOURCE_PATH][part_name]
-                    x = random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X + 10,
-                                       constants.VIEW_W - part_image.width - 10)
-                    y = random.uniform(10,
-                                       constants.HORIZONTAL_MAIN_SEPARATOR_Y
-                                       - part_image.height - 200)
-                    group_order = logic.get_next_top_value(world)
-                    world.create_entity(
-                        *GiftPartProto(x, y, part_name,
-                                       batch=main_batch,
-                                       group=pyglet.graphics.Group(group_order)))
+        gift_constraint = logic.GiftConstraint(self.gift_constraint)
+        world.create_entity(gift_constraint)
+
+        # Find missing items for the constriant and create them to make
+        # sure it is satisfiable.
+        compiled = gift_constraint.compiled
+        part_counts = logic.table_counts(world)
+        plan = compiled.plan(part_counts)
+
+        excess = len(world.get(logic.GiftPart)) + len(plan) - self.part_budget
+        if excess > 0:
+            wanted = set().union(*(leaf.allowed_set for leaf in compiled.item_set_leaves))
+            reclaimed = logic.reclaim_parts(world, excess, wanted)
+            # Deletion is deferred, discount reclaimed parts by hand
+            part_counts = part_counts - Counter(world.get_component(entity, logic.GiftPart).name
+                                                for entity in reclaimed)
+            plan = compiled.plan(part_counts)
+
+        zorder = world.get_processor(graphics.ZOrderProcessor)
+        for part_names in plan:
+            # Sample part name and position
+            part_name = random.choice(part_names)
+            part_image = desper.resource_map[TOYS_RESOURCE_PATH][part_name]
+            x = random.uniform(constants.VERTICAL_MAIN_SEPARATOR_X + 10,
+                               constants.VIEW_W - part_image.width - 10)
+            y = random.uniform(10,
+                               constants.HORIZONTAL_MAIN_SEPARATOR_Y - part_image.height - 200)
+            world.create_entity(
+                *GiftPartProto(x, y, part_name,
+                               batch=zorder.batch, group=zorder.group,
+                               program=zorder.program))
 
 
 class LetterTransformer:
@@ -338,14 +419,15 @@ class LetterTransformer:
 
     def __call__(self, _, world: desper.World):
         main_batch = pdesper.retrieve_batch(world)
+        fonts.require(self.font_name)
 
         # Remove previously existing letters to prevent weird overlaps
         for old_letter_entity, _ in world.get(TheLetter):
             world.delete_entity(old_letter_entity)
 
         letter_dialogue_data = desper.resource_map[LETTERS_RESOURCE_PATH][self.letter_name]
-        letter_text = Dialogue(letter_dialogue_data).next().parse_text(
-            dialogue.LANG_ITA, self.variables)
+        letter_text = dialogue.parse_text(Dialogue(letter_dialogue_data).next(),
+                                          dialogue.LANG_ITA, self.variables)
         letter_image = desper.resource_map['image/letter']
         world.create_entity(
             desper.Transform2D((-letter_image.width - 50, 20)),
@@ -358,7 +440,8 @@ class LetterTransformer:
                               multiline=True,
                               width=letter_image.width - 50,
                               font_name=self.font_name, batch=main_batch,
-                              font_size=20, color=constants.FG_COLOR),
+                              font_size=constants.LETTER_FONT_SIZE,
+                              color=constants.FG_COLOR),
             graphics.LetterSize(),
             graphics.LetterPositionSync(),
             Slider(20),
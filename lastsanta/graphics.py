@@ -1,24 +1,143 @@
 """Handle cameras and main graphical aspects of the game."""
+import weakref
+
 import desper
 import pyglet_desper as pdesper
 import pyglet
+from pyglet.gl import (glEnable, glDisable, glDepthFunc, glDepthMask, GL_DEPTH_TEST, GL_LESS,
+                       GL_FALSE, GL_TRUE)
+from pyglet.sprite import Sprite
 from pyglet.window import Window
 from typing import SupportsFloat
 
+from . import constants
+
+Z_LAYERS = 2 ** 16
+
+stacked_fragment_source = """#version 150 core
+    in vec4 vertex_colors;
+    in vec3 texture_coords;
+    out vec4 final_colors;
+
+    uniform sampler2D sprite_texture;
+    uniform bool opaque_pass;
+
+    void main()
+    {
+        final_colors = texture(sprite_texture, texture_coords.xy) * vertex_colors;
+        // Transparent pixels shall not hide what is below
+        if (final_colors.a < 0.01)
+            discard;
+        // Opaque pixels are drawn (and hide what is below) in the first
+        // pass, translucent ones are blended over them in the second
+        if (opaque_pass != (final_colors.a >= 0.99))
+            discard;
+    }
+"""
+
+
+def current_window() -> Window | None:
+    """Return the game window, ``None`` if there is none (headless)."""
+    return next(iter(pyglet.app.windows), None)
+
 
 @desper.event_handler('on_draw')
 class CameraProcessor(desper.Processor):
 
-    def __init__(self):
-        self.window = next(iter(pyglet.app.windows))
+    @property
+    def window(self) -> Window | None:
+        return current_window()
 
     def process(self, dt):
         pass
 
     def on_draw(self):
+        # Nothing to draw on (headless)
+        if self.window is None:
+            return
+
+        interpolation = self.world.get_processor(InterpolationProcessor)
+        if interpolation is not None:
+            interpolation.interpolate(getattr(desper.default_loop, 'alpha', 1.))
+
         self.window.clear()
         self.world.dispatch(pdesper.ON_CAMERA_DRAW_EVENT_NAME)
 
+        # Stacked sprites, with the projection and viewport of the camera
+        zorder = self.world.get_processor(ZOrderProcessor)
+        if zorder is not None:
+            zorder.draw()
+
+
+class InterpolationProcessor(desper.Processor):
+    """Interpolate sprites between the last two simulation steps.
+
+    Sprites moved through :class:`SpriteSync` are tracked instead of
+    being moved right away. Before drawing, :class:`CameraProcessor`
+    places them in between their positions at the end of the previous
+    and of the last step, by the loop's interpolation factor (see
+    :class:`timestep.FixedStepLoop`). Sprites that stop moving are
+    placed at their final position and forgotten.
+
+    Shall be processed before any other processor.
+    """
+
+    def __init__(self):
+        # Sprite: [previous position, current position, moved in this step]
+        self._tracked: dict[Sprite, list] = {}
+
+    def track(self, sprite: Sprite, position: tuple[float, float]):
+        """Move a sprite to a new simulated position."""
+        entry = self._tracked.get(sprite)
+        if entry is None:
+            self._tracked[sprite] = [(sprite.x, sprite.y), position, True]
+        else:
+            entry[1] = position
+            entry[2] = True
+
+    def untrack(self, sprite: Sprite):
+        """Forget a sprite (e.g. because it is deleted)."""
+        self._tracked.pop(sprite, None)
+
+    def process(self, dt):
+        """Start a new step, settle sprites that did not move."""
+        settled = []
+        for sprite, entry in self._tracked.items():
+            if entry[2]:
+                entry[0] = entry[1]
+                entry[2] = False
+            else:
+                settled.append(sprite)
+
+        for sprite in settled:
+            _, (x, y), _ = self._tracked.pop(sprite)
+            sprite.position = (x, y, sprite.z)
+
+    def interpolate(self, alpha: float):
+        """Place tracked sprites by the given interpolation factor."""
+        for sprite, ((x0, y0), (x1, y1), _) in self._tracked.items():
+            sprite.position = (x0 + (x1 - x0) * alpha, y0 + (y1 - y0) * alpha, sprite.z)
+
+
+class Camera(pdesper.Camera):
+    """Camera that can also be created without a window (headless).
+
+    Without a window, the viewport defaults to the game's view size and
+    nothing is ever drawn.
+    """
+
+    def __init__(self, batch: pyglet.graphics.Batch, projection: desper.math.Mat4,
+                 viewport: tuple[int, int, int, int] | None = None):
+        if current_window() is not None:
+            super().__init__(batch, projection, viewport)
+            return
+
+        self.batch = batch
+        self.window = None
+        self.projection = projection
+        self.viewport = viewport or (0, 0, constants.VIEW_W, constants.VIEW_H)
+        self.view = desper.math.Mat4()
+
 
 @desper.event_handler('on_resize')
 class BlackBarsViewportHandler(desper.Controller):
@@ -33,7 +152,10 @@ class BlackBarsViewportHandler(desper.Controller):
         self.view_w = view_w
         self.view_h = view_h
         self.game_ratio = view_w / view_h
-        self.window: Window = next(iter(pyglet.app.windows))
+
+    @property
+    def window(self) -> Window | None:
+        return current_window()
 
     def on_resize(self, new_width, new_height):
         """Event handler: window resized."""
@@ -51,7 +173,12 @@ class BlackBarsViewportHandler(desper.Controller):
 
 
 class SpriteSync(pdesper.SpriteSync):
-    """Custom sprite sync with mild z support."""
+    """Custom sprite sync with mild z support.
+
+    If the world has an :class:`InterpolationProcessor`, positions are
+    interpolated for rendering.
+    """
+    interpolation = desper.ProcessorReference(InterpolationProcessor)
 
     def on_position_change(self, new_position: desper.math.Vec2):
         """Event handler: update graphical component position.
@@ -59,7 +186,17 @@ class SpriteSync(pdesper.SpriteSync):
         Ignore z.
         """
         sprite = self.get_component(self.component_type)
-        sprite.position = (*new_position, sprite.z)
+        interpolation = self.interpolation
+        if interpolation is None:
+            sprite.position = (*new_position, sprite.z)
+        else:
+            interpolation.track(sprite, tuple(new_position))
+
+    def on_remove(self, entity, world: desper.World):
+        interpolation = self.interpolation
+        if interpolation is not None:
+            interpolation.untrack(self.get_component(self.component_type))
+        super().on_remove(entity, world)
 
 
 class LetterSize(desper.Controller):
@@ -97,3 +234,136 @@ class LetterPositionSync(pdesper.PositionSync2D):
             self.deleted = True
             self.get_component(pyglet.text.Label).delete()
             self.get_component(pyglet.gui.NinePatch).delete()
+
+
+class DepthGroup(pyglet.graphics.Group):
+    """Group that depth tests its content.
+
+    Sprites inside it are stacked by their z (higher is on top) instead
+    of needing a group each. The camera projection shall map z in
+    ``[-1, 0]`` (e.g. orthogonal projection with near ``0`` and far
+    ``1``). See :meth:`ZOrderProcessor.draw` for blending.
+    """
+
+    def set_state(self):
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LESS)
+
+    def unset_state(self):
+        glDisable(GL_DEPTH_TEST)
+
+
+class ZOrderProcessor(desper.Processor):
+    """Stack sprites in a single depth tested group.
+
+    Each registered sprite has a rank, mapped to its z. Ranks increase
+    each time a sprite is brought on top. When they run out, ranks are
+    compacted, preserving the stacking order.
+
+    Stacked sprites are moved to the processor's own :attr:`batch`,
+    drawn by :class:`CameraProcessor` after the cameras (see
+    :meth:`draw`).
+    """
+
+    def __init__(self, layers: int = Z_LAYERS):
+        self.batch = pyglet.graphics.Batch()
+        self.group = DepthGroup()
+        self.layers = layers
+        self._ranks: weakref.WeakKeyDictionary[Sprite, int] = weakref.WeakKeyDictionary()
+        self._next_rank = 0
+        self._program = None
+
+    @property
+    def program(self):
+        """Sprite shader program drawing the passes of :meth:`draw`.
+
+        Lazily built, as it requires an OpenGL context.
+        """
+        if self._program is None:
+            self._program = pyglet.gl.current_context.create_program(
+                (pyglet.sprite.vertex_source, 'vertex'), (stacked_fragment_source, 'fragment'))
+        return self._program
+
+    def _set_rank(self, sprite: Sprite, rank: int):
+        self._ranks[sprite] = rank
+        sprite.z = (rank + 1) / self.layers - 1
+
+    def bring_to_top(self, sprite: Sprite):
+        """Register sprite if needed and stack it over all the others."""
+        if self._next_rank >= self.layers:
+            self._compact()
+
+        if sprite.batch is not self.batch:
+            sprite.batch = self.batch
+        if sprite.group != self.group:
+            sprite.group = self.group
+        if sprite.program is not self.program:
+            sprite.program = self.program
+
+        self._set_rank(sprite, self._next_rank)
+        self._next_rank += 1
+
+    def remove(self, sprite: Sprite):
+        """Forget about a sprite."""
+        self._ranks.pop(sprite, None)
+
+    def _compact(self):
+        """Reassign contiguous ranks, keeping the stacking order."""
+        sprites = sorted(self._ranks.items(), key=lambda kv: kv[1])
+        for rank, (sprite, _) in enumerate(sprites):
+            self._set_rank(sprite, rank)
+        self._next_rank = len(sprites)
+
+    def draw(self):
+        """Draw stacked sprites, in two passes.
+
+        Only fully opaque pixels are drawn (and write depth) in the
+        first pass. Translucent pixels (e.g. antialiased edges) are
+        drawn in the second, blended over opaque pixels below them
+        without writing depth. Translucent pixels over each other are
+        blended in draw order.
+        """
+        program = self.program
+        program['opaque_pass'] = True
+        self.batch.draw()
+
+        glDepthMask(GL_FALSE)
+        program['opaque_pass'] = False
+        self.batch.draw()
+        glDepthMask(GL_TRUE)
+
+    def process(self, dt):
+        pass
+
+
+@desper.event_handler('on_remove')
+class ZOrderSync(desper.Controller):
+    """Stack the entity's sprite through :class:`ZOrderProcessor`.
+
+    The sprite is put on top as soon as the controller is added.
+    """
+    zorder = desper.ProcessorReference(ZOrderProcessor)
+    sprite = desper.ComponentReference(Sprite)
+
+    def on_add(self, entity, world: desper.World):
+        super().on_add(entity, world)
+
+        zorder = self.zorder
+        if zorder is not None:
+            zorder.bring_to_top(self.sprite)
+
+    def on_remove(self, entity, world: desper.World):
+        zorder = world.get_processor(ZOrderProcessor)
+        sprite = world.get_component(entity, Sprite)
+        if zorder is not None and sprite is not None:
+            zorder.remove(sprite)
+
+
+def batch_statistics(batch: pyglet.graphics.Batch) -> tuple[int, int]:
+    """Return the number of groups and draw calls of a batch.
+
+    Draw calls are estimated as the number of vertex domains, which
+    pyglet draws one at a time.
+    """
+    return (len(batch.group_map),
+            sum(len(domain_map) for domain_map in batch.group_map.values()))
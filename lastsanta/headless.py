@@ -0,0 +1,193 @@
+"""Run game worlds without a window, as fast as possible.
+
+Set the ``LASTSANTA_HEADLESS`` environment variable (see
+:data:`constants.HEADLESS_ENV_VAR`) before importing :mod:`lastsanta`:
+no window is opened, OpenGL runs offscreen and audio is silent.
+Worlds are then stepped with a fixed timestep by :class:`HeadlessLoop`,
+which also injects synthetic ``on_mouse_game_*`` events::
+
+    loop = headless.HeadlessLoop()
+    desper.default_loop = loop
+    loop.switch(headless.game_world_handle('car'))
+    loop.press((500, 300))
+    loop.run(600)
+
+Sessions recorded by :mod:`recording` are replayed by :func:`replay`.
+"""
+import time
+from dataclasses import dataclass, field
+
+import desper
+import pyglet
+from ddesigner import Dialogue
+from pyglet.math import Vec2
+from pyglet.window import mouse
+
+from . import dialogue
+from . import game
+from . import gifts
+from . import physics
+from . import profiling
+from . import recording
+
+
+def game_world_handle(gift_name: str, letter_name: str | None = None,
+                      letter_font_name='Mechanical', number_of_generated=50,
+                      dialogue_name='dial/story') -> desper.WorldHandle:
+    """Return the handle of a new game world, as built by the dialogue.
+
+    The letter defaults to the gift's one. Resources shall be populated
+    (see :func:`lastsanta.populate_resources`).
+    """
+    if letter_name is None:
+        letter_name = gift_name
+    story = Dialogue(desper.resource_map[dialogue_name])
+    normal_items = set(desper.resource_map[game.TOYS_RESOURCE_PATH]
+                       .handles.keys()).difference(gifts.CRITICAL_ITEMS)
+    letter_transformer = game.LetterTransformer(letter_name, letter_font_name,
+                                                story.variables)
+    return dialogue.game_world_handle(story, tuple(sorted(normal_items)),
+                                      number_of_generated, gifts.gifts[gift_name],
+                                      letter_transformer)
+
+
+class HeadlessLoop(desper.Loop[desper.World]):
+    """Step the current world with a fixed timestep.
+
+    No window and no pacing: each :meth:`step` processes the current
+    world with ``dt`` right away. World switches
+    (:func:`desper.switch`) are applied as in the main loop.
+    Callbacks scheduled on the pyglet clock (e.g. sounds) are run once
+    per step.
+    """
+
+    def __init__(self, dt=1 / 60, max_frames: int | None = None):
+        super().__init__()
+        self.dt = dt
+        self.max_frames = max_frames
+        self.frames = 0
+
+    def switch(self, world_handle: desper.Handle[desper.World],
+               clear_current=False, clear_next=False):
+        """Switch world and enable its events."""
+        super().switch(world_handle, clear_current, clear_next)
+        world_handle().dispatch_enabled = True
+
+    def step(self):
+        """Advance the current world by a single timestep."""
+        profiling.profiler.begin_world_frame(self._current_world)
+        try:
+            self._current_world.process(self.dt)
+        except desper.SwitchWorld as ex:
+            self.switch(ex.world_handle, ex.clear_current, ex.clear_next)
+
+        pyglet.clock.tick()
+        self.frames += 1
+
+    def run(self, frames: int):
+        """Execute the given number of steps."""
+        for _ in range(frames):
+            self.step()
+
+    def loop(self):
+        """Step until :attr:`max_frames` (forever if ``None``)."""
+        while self.max_frames is None or self.frames < self.max_frames:
+            self.step()
+
+    def inject(self, event_name: str, *args):
+        """Dispatch an event in the current world."""
+        self._current_world.dispatch(event_name, *args)
+
+    def _dispatch_later(self, event_name: str, *args):
+        dispatch_later = self._current_world.get_processor(physics.DispatchLaterProcessor)
+        if dispatch_later is None:
+            self.inject(event_name, *args)
+        else:
+            dispatch_later.dispatch(event_name, *args)
+
+    def press(self, point, buttons=mouse.LEFT, mod=0):
+        """Press mouse buttons at a point, in game space.
+
+        As with the window, the event is dispatched on the next step.
+        """
+        self._dispatch_later('on_mouse_game_press', Vec2(*point), buttons, mod)
+
+    def release(self, point, buttons=mouse.LEFT, mod=0):
+        """Release mouse buttons at a point, in game space.
+
+        As with the window, the event is dispatched on the next step.
+        """
+        self._dispatch_later('on_mouse_game_release', Vec2(*point), buttons, mod)
+
+    def motion(self, point, delta=(0, 0)):
+        """Move the mouse to a point, in game space.
+
+        As with the window, the event is dispatched on the next step,
+        coalesced with other motion events.
+        """
+        dispatch_later = self._current_world.get_processor(physics.DispatchLaterProcessor)
+        if dispatch_later is None:
+            self.inject('on_mouse_game_motion', Vec2(*point), Vec2(*delta))
+        else:
+            dispatch_later.dispatch_coalesced(physics.merge_motions, 'on_mouse_game_motion',
+                                              Vec2(*point), Vec2(*delta))
+
+
+@dataclass
+class Replay:
+    """Outcome of a replayed session, see :func:`replay`.
+
+    Step times are in microseconds.
+    """
+    time: float = 0.
+    recorded_times: list[int] = field(default_factory=list)
+    replayed_times: list[int] = field(default_factory=list)
+    digests: int = 0
+    mismatches: list[int] = field(default_factory=list)
+    """Steps after which the world state differs from the recorded one."""
+
+    @property
+    def steps(self) -> int:
+        return len(self.replayed_times)
+
+
+def replay(filename: str, dialogue_name='dial/story') -> Replay:
+    """Replay a session recorded to a file, from the start of the story.
+
+    Steps are run as fast as possible, inputs are injected right before
+    the step that received them and world states are checked against
+    recorded digests. Resources shall be populated (see
+    :func:`lastsanta.populate_resources`).
+    """
+    step, records = recording.read(filename)
+    recording.replayed_seeds.clear()
+    recording.replayed_seeds.extend(payload[0] for tag, payload in records
+                                    if tag == recording.SEED)
+
+    loop = HeadlessLoop(step)
+    desper.default_loop = loop
+    result = Replay()
+
+    start = time.perf_counter()
+    dialogue.continue_dialogue(Dialogue(desper.resource_map[dialogue_name]), loop.switch)
+    for tag, payload in records:
+        if tag == recording.FRAME:
+            step_start = time.perf_counter_ns()
+            loop.step()
+            result.replayed_times.append((time.perf_counter_ns() - step_start) // 1000)
+            result.recorded_times.append(payload[0])
+        elif tag == recording.MOTION:
+            loop.motion(payload[:2], payload[2:])
+        elif tag == recording.PRESS:
+            loop.press(payload[:2], *payload[2:])
+        elif tag == recording.RELEASE:
+            loop.release(payload[:2], *payload[2:])
+        elif tag == recording.KEY:
+            loop.inject('on_key_press', *payload)
+        elif tag == recording.DIGEST:
+            result.digests += 1
+            if recording.digest(loop.current_world) != payload[0]:
+                result.mismatches.append(loop.frames)
+
+    result.time = time.perf_counter() - start
+    return result
@@ -1,8 +1,11 @@
 """Tools for hotkeys that handle user preferences."""
 import desper
+import pyglet_desper as pdesper
 import pyglet.window.key as key
 
 import lastsanta
+from . import graphics
+from . import profiling
 
 
 @desper.event_handler('on_key_press')
@@ -10,7 +13,7 @@ class ToggleFullscreen:
     """On F, toggle fullscreen."""
 
     def on_key_press(self, code, mod):
-        if code == key.F:
+        if code == key.F and lastsanta.window is not None:
             lastsanta.window.set_fullscreen(not lastsanta.window.fullscreen)
 
 
@@ -19,10 +22,60 @@ class QuitGame:
     """On ESC, quit."""
 
     def on_key_press(self, code, mod):
-        if code == key.ESCAPE:
+        if code == key.ESCAPE and lastsanta.window is not None:
             lastsanta.window.close()
 
 
+@desper.event_handler('on_key_press')
+class PrintBatchStatistics(desper.Controller):
+    """Debug: on B, print group and draw call counts of the world's batches.
+
+    Stacked sprites (see :class:`graphics.ZOrderProcessor`) are drawn
+    twice.
+    """
+
+    def on_key_press(self, code, mod):
+        if code == key.B:
+            groups, draw_calls = graphics.batch_statistics(pdesper.retrieve_batch(self.world))
+            zorder = self.world.get_processor(graphics.ZOrderProcessor)
+            if zorder is not None:
+                stacked_groups, stacked_draw_calls = graphics.batch_statistics(zorder.batch)
+                groups += stacked_groups
+                draw_calls += 2 * stacked_draw_calls
+            print(f'{groups} groups, {draw_calls} draw calls')
+
+
+@desper.event_handler('on_key_press')
+class PrintOrderProgress(desper.Controller):
+    """Debug: on P, print progress of the major gift toward the order."""
+
+    def on_key_press(self, code, mod):
+        from . import logic     # NOQA (see startup)
+
+        if code == key.P and self.world.get_processor(logic.ItemChainProcessor) is not None:
+            progress = logic.order_progress(self.world)
+            if progress is not None:
+                satisfied, required = progress
+                print(f'{satisfied} of {required} required parts')
+
+
+@desper.event_handler('on_key_press')
+class ToggleProfiler:
+    """Debug: on O, toggle the profiler overlay. On T, export a trace."""
+
+    def on_key_press(self, code, mod):
+        if code == key.O:
+            profiling.toggle_overlay()
+        elif code == key.T:
+            profiling.profiler.export_chrome_trace()
+            print(f'{len(profiling.profiler.frames)} frames written to '
+                  f'{profiling.TRACE_FILENAME}')
+
+
 def hotkeys_transformer(_, world: desper.World):
     """Add to the world hotkey event handlers."""
     world.create_entity(ToggleFullscreen(), QuitGame())
+
+    if __debug__:
+        world.create_entity(PrintBatchStatistics(), PrintOrderProgress())
+        world.create_entity(ToggleProfiler(), profiling.ProfilerOverlay())
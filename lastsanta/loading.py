@@ -0,0 +1,196 @@
+"""Load resources in background, with progress and timings.
+
+Decoding (images, atlas pages, sounds and dialogue data) happens in a
+pool of worker threads. Everything that touches OpenGL (texture
+uploads) is handed back to the main thread, a bit at a time, through
+the pyglet clock. Fonts are left to :mod:`fonts`, which registers them
+when first needed.
+
+Resources requested by the game before they are ready are simply
+loaded on the spot by their handle, as usual.
+"""
+import os
+import time
+from collections.abc import Iterator
+from concurrent import futures
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import desper
+import pyglet
+import pyglet_desper as pdesper
+
+from . import atlas
+from . import dialogue
+
+MAX_WORKERS = 4
+MAIN_THREAD_BUDGET = 1 / 240
+"""Time (in seconds) spent finishing resources on each clock tick."""
+
+
+def iter_handles(resource_map: desper.ResourceMap,
+                 prefix='') -> Iterator[tuple[str, desper.Handle]]:
+    """Iterate over all handles of a map, with their full keys."""
+    for key, handle in resource_map.handles.items():
+        yield prefix + key, handle
+
+    for key, submap in resource_map.maps.items():
+        yield from iter_handles(submap, f'{prefix}{key}{resource_map.split_char}')
+
+
+def _decode(handle: desper.Handle):
+    """Decode a resource, without touching OpenGL. Run in workers."""
+    match handle:
+        case (pdesper.RichImageFileHandle() | pdesper.ImageFileHandle()
+              | atlas.AtlasPageHandle()):
+            return pyglet.image.load(handle.filename)
+        case pdesper.MediaFileHandle():
+            return handle.load()
+        case dialogue.DialogueHandle():
+            return handle.load()
+
+
+def _finish(handle: desper.Handle, decoded):
+    """Turn a decoded resource into the handle's value. Main thread only."""
+    match handle:
+        case pdesper.RichImageFileHandle() | pdesper.ImageFileHandle():
+            texture_bin = pdesper.default_texture_bin
+            if (decoded.width + 1 <= texture_bin.texture_width
+                    and decoded.height + 1 <= texture_bin.texture_height):
+                return texture_bin.add(decoded, 1)
+            return decoded
+        case atlas.AtlasPageHandle():
+            return decoded.get_texture()
+        case _:
+            return decoded
+
+
+def is_background_loadable(handle: desper.Handle) -> bool:
+    """Check if a handle can be loaded by :class:`ResourceLoader`.
+
+    Spritesheets, animations and streamed media are left to their
+    handles.
+    """
+    match handle:
+        case pdesper.RichImageFileHandle() | pdesper.ImageFileHandle():
+            return handle.filename.lower().endswith('.png')
+        case pdesper.MediaFileHandle():
+            return not handle.streaming
+        case dialogue.DialogueHandle() | atlas.AtlasPageHandle():
+            return True
+
+    return False
+
+
+class ResourceLoader:
+    """Load all resources of a map in background.
+
+    Call :meth:`start` to submit decoding to the worker pool and to
+    begin finishing resources on the main thread. Load times, in
+    seconds, are recorded in :attr:`timings` (decoding in a worker,
+    finishing on the main thread) by resource key.
+    """
+
+    def __init__(self, resource_map: desper.ResourceMap,
+                 max_workers: int = min(MAX_WORKERS, os.cpu_count() or 1)):
+        self.resource_map = resource_map
+        self.max_workers = max_workers
+        self.timings: dict[str, tuple[float, float]] = {}
+        self.total = 0
+        self.loaded = 0
+        self.start_time: float | None = None
+        self.end_time: float | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: list[tuple[str, desper.Handle, Future]] = []
+
+    @property
+    def progress(self) -> float:
+        """Fraction of loaded resources, in ``[0, 1]``."""
+        if not self.total:
+            return 1. if self.start_time is not None else 0.
+        return self.loaded / self.total
+
+    @property
+    def done(self) -> bool:
+        """Whether all resources are loaded."""
+        return self.end_time is not None
+
+    def start(self):
+        """Start loading all resources not loaded yet."""
+        self.start_time = time.perf_counter()
+        self._executor = ThreadPoolExecutor(self.max_workers,
+                                            thread_name_prefix='resource-loader')
+
+        for key, handle in iter_handles(self.resource_map):
+            if handle.cached or not is_background_loadable(handle):
+                continue
+            self._pending.append((key, handle, self._executor.submit(self._timed_decode,
+                                                                     handle)))
+        self.total = len(self._pending)
+
+        pyglet.clock.schedule(self.poll)
+
+    @staticmethod
+    def _timed_decode(handle: desper.Handle):
+        start = time.perf_counter()
+        decoded = _decode(handle)
+        return decoded, time.perf_counter() - start
+
+    def poll(self, dt=0., budget: float = MAIN_THREAD_BUDGET):
+        """Finish decoded resources on the main thread, within a budget.
+
+        Scheduled on the pyglet clock by :meth:`start`.
+        """
+        if self.done:
+            return
+
+        deadline = time.perf_counter() + budget
+        still_pending = []
+        for index, (key, handle, future) in enumerate(self._pending):
+            if time.perf_counter() > deadline:
+                still_pending += self._pending[index:]
+                break
+
+            if not future.done():
+                still_pending.append((key, handle, future))
+                continue
+
+            start = time.perf_counter()
+            try:
+                decoded, decode_time = future.result()
+            except Exception:
+                # Leave it to the handle, on the main thread
+                decoded, decode_time = None, 0.
+                handle()
+
+            # Requested meanwhile, already loaded by its handle
+            if not handle.cached:
+                # Fill the handle's cache, as its __call__ would do
+                handle._cache = _finish(handle, decoded)
+                handle._cached = True
+            self.timings[key] = decode_time, time.perf_counter() - start
+            self.loaded += 1
+
+        self._pending = still_pending
+
+        if not self._pending:
+            self.end_time = time.perf_counter()
+            pyglet.clock.unschedule(self.poll)
+            self._executor.shutdown(wait=False)
+
+    def wait(self):
+        """Block until all resources are loaded."""
+        futures.wait([future for _, _, future in self._pending])
+        self.poll(budget=float('inf'))
+
+    def report(self) -> str:
+        """Return a human readable summary of load timings."""
+        lines = [f'{self.loaded}/{self.total} resources']
+        if self.done:
+            lines[0] += f' in {self.end_time - self.start_time:.3f}s'
+
+        timings = sorted(self.timings.items(), key=lambda kv: -sum(kv[1]))
+        for key, (decode_time, finish_time) in timings:
+            lines.append(f'{key}: decode {decode_time * 1e3:.1f}ms, '
+                         f'finish {finish_time * 1e3:.1f}ms')
+
+        return '\n'.join(lines)
@@ -1,52 +1,324 @@
 """Main game logic and user interactions."""
+import functools
+import itertools
 import operator
+from collections import Counter
 from dataclasses import dataclass, field
-from collections.abc import Collection
+from collections.abc import Collection, Iterable
 from typing import Any
 
 import desper
 import pyglet
-from pyglet.math import Vec2, clamp
+from pyglet.math import Vec2
 from pyglet.sprite import Sprite
 
 from . import physics
 from . import constants
+from . import graphics
 
 MAX_MOUSE_INTERTIA_SPEED = 1000
 
 
-@dataclass
+@desper.event_handler('on_add', 'on_remove')
+@dataclass(eq=False)
 class Item:
-    """Represents an in game item."""
+    """Represents an in game item.
+
+    Items register themselves in the world's
+    :class:`ItemChainProcessor`, if any. Change :attr:`hooked` through
+    :meth:`ItemChainProcessor.hook` and :meth:`ItemChainProcessor.unhook`
+    to keep the index consistent. Items grabbed at least once are
+    :attr:`touched`.
+    """
     base: bool = False
     hooked: int | None = None
     hook_offset: Vec2 = field(default_factory=Vec2)
+    touched: bool = False
 
     def contains(self, world: desper.World, ):
         """Check if chain of items contains the given id."""
 
+    def on_add(self, entity: int, world: desper.World):
+        """Enter the chain index."""
+        chains = world.get_processor(ItemChainProcessor)
+        if chains is not None:
+            chains.add(entity, self, world.get_component(entity, desper.Transform2D))
 
-def itemchain_contains(start_entity: int, target: int, world: desper.World) -> int:
-    """Check if chain of items contains the given entity."""
-    current_entity = start_entity
-    while current_entity is not None:
-        if current_entity == target:
+    def on_remove(self, entity: int, world: desper.World):
+        """Leave the chain index."""
+        chains = world.get_processor(ItemChainProcessor)
+        if chains is not None:
+            chains.remove(entity, deleted=not world.entity_exists(entity))
+
+
+@desper.event_handler(desper.ON_POSITION_CHANGE_EVENT_NAME)
+class _MoveListener:
+    """Mark an item as moved when its transform changes."""
+
+    def __init__(self, entity: int, moved: set[int]):
+        self.entity = entity
+        self.moved = moved
+
+    def on_position_change(self, new_position):
+        self.moved.add(self.entity)
+
+
+class ItemChainProcessor(desper.Processor):
+    """Index of hooked item chains (assemblies).
+
+    Mirrors :attr:`Item.hooked` pointers with parent/children maps and
+    keeps, for each item, the root of its chain, its depth and, for each
+    root, the members of its chain. Roots and members are answered in
+    constant time, while hooking and unhooking cost as much as the size
+    of the moved subtree.
+
+    Items whose parent leaves the index become the root of their
+    subtree, even if their :attr:`Item.hooked` still points to the old
+    parent. If the parent was deleted, the subtree is collected as
+    orphaned (see :meth:`pop_orphans`).
+
+    Moved items (i.e. whose :class:`desper.Transform2D` position
+    changed) are also tracked, see :meth:`pop_moved`.
+
+    Gift part names (see :class:`GiftPart`) are counted per chain, see
+    :meth:`part_counts`.
+    """
+
+    def __init__(self):
+        self._items: dict[int, Item] = {}
+        self._parents: dict[int, int] = {}
+        self._children: dict[int, set[int]] = {}
+        self._roots: dict[int, int] = {}
+        self._depths: dict[int, int] = {}
+        self._members: dict[int, set[int]] = {}
+        self._listeners: dict[int, tuple[desper.Transform2D, _MoveListener]] = {}
+        self._moved: set[int] = set()
+        self._orphans: set[int] = set()
+        self._parts: dict[int, str] = {}
+        self._counts: dict[int, Counter[str]] = {}
+        self._total_counts: Counter[str] = Counter()
+
+    def add(self, entity: int, item: Item, transform: desper.Transform2D | None = None):
+        """Insert an item, as the root of a new chain.
+
+        If the item is already hooked to an indexed item, it is
+        attached to its chain. If a transform is given, position
+        changes are tracked.
+        """
+        self._items[entity] = item
+        self._children[entity] = set()
+        self._roots[entity] = entity
+        self._depths[entity] = 0
+        self._members[entity] = {entity}
+        self._counts[entity] = Counter()
+        if entity in self._parts:
+            self._counts[entity][self._parts[entity]] += 1
+
+        if transform is not None:
+            listener = _MoveListener(entity, self._moved)
+            transform.add_handler(listener)
+            self._listeners[entity] = transform, listener
+
+        if item.hooked in self._items:
+            self._attach(entity, item.hooked)
+
+    def remove(self, entity: int, deleted=False):
+        """Remove an item, its children become roots of their subtrees.
+
+        If ``deleted``, the subtrees are also marked as orphaned.
+        """
+        if entity not in self._items:
+            return
+
+        self._detach(entity)
+        for child in tuple(self._children[entity]):
+            if deleted:
+                self._orphans.update(self.subtree(child))
+            self._detach(child)
+
+        if entity in self._listeners:
+            transform, listener = self._listeners.pop(entity)
+            transform.remove_handler(listener)
+
+        self._moved.discard(entity)
+        self._orphans.discard(entity)
+        del self._counts[entity]
+        del self._members[entity]
+        del self._depths[entity]
+        del self._roots[entity]
+        del self._children[entity]
+        del self._items[entity]
+
+    def __contains__(self, entity: int) -> bool:
+        """Check if an item is indexed."""
+        return entity in self._items
+
+    def subtree(self, entity: int) -> list[int]:
+        """Return entity and all its descendants, parents first."""
+        subtree = [entity]
+        for member in subtree:
+            subtree += self._children[member]
+
+        return subtree
+
+    def _attach(self, child: int, parent: int):
+        """Link a root to a parent, moving its subtree in the parent's chain."""
+        root = self._roots[parent]
+        depth_delta = self._depths[parent] + 1
+        subtree = self._members.pop(child)
+
+        self._parents[child] = parent
+        self._children[parent].add(child)
+        self._members[root] |= subtree
+        self._counts[root] += self._counts.pop(child)
+        for member in subtree:
+            self._roots[member] = root
+            self._depths[member] += depth_delta
+
+    def _detach(self, child: int):
+        """Unlink an item from its parent, making it a root."""
+        parent = self._parents.pop(child, None)
+        if parent is None:
+            return
+
+        self._children[parent].discard(child)
+        subtree = set(self.subtree(child))
+        depth_delta = self._depths[child]
+        counts = Counter(self._parts[member] for member in subtree if member in self._parts)
+        self._members[self._roots[child]] -= subtree
+        self._counts[self._roots[child]] -= counts
+        self._members[child] = subtree
+        self._counts[child] = counts
+        for member in subtree:
+            self._roots[member] = child
+            self._depths[member] -= depth_delta
+
+    def hook(self, child: int, parent: int, offset: Vec2):
+        """Hook an item to a parent item, with the given offset."""
+        assert not self.contains(child, parent), 'Hooking would create a loop'
+
+        self._detach(child)
+        self._attach(child, parent)
+
+        item = self._items[child]
+        item.hooked = parent
+        item.hook_offset = offset
+
+    def unhook(self, entity: int):
+        """Unhook an item from its parent, if any."""
+        self._detach(entity)
+        self._items[entity].hooked = None
+
+    def root(self, entity: int) -> int:
+        """Return root entity of the given item's chain."""
+        return self._roots[entity]
+
+    def depth(self, entity: int) -> int:
+        """Return the number of hooks between an item and its root."""
+        return self._depths[entity]
+
+    def children(self, entity: int) -> set[int]:
+        """Return the items directly hooked to the given one.
+
+        The returned set shall not be modified.
+        """
+        return self._children[entity]
+
+    def members(self, entity: int) -> set[int]:
+        """Return all the items in the chain of the given item.
+
+        The returned set shall not be modified.
+        """
+        return self._members[self._roots[entity]]
+
+    def assemblies(self) -> dict[int, set[int]]:
+        """Return a mapping from chain roots to chain members.
+
+        The returned mapping shall not be modified.
+        """
+        return self._members
+
+    def set_part(self, entity: int, name: str | None):
+        """Set or clear (if ``None``) the gift part name of an entity.
+
+        The entity does not need to be an indexed item.
+        """
+        old_name = self._parts.pop(entity, None)
+        if name is not None:
+            self._parts[entity] = name
+
+        all_counts = [self._total_counts]
+        if entity in self._roots:
+            all_counts.append(self._counts[self._roots[entity]])
+
+        for counts in all_counts:
+            if old_name is not None:
+                counts[old_name] -= 1
+                if counts[old_name] <= 0:
+                    del counts[old_name]
+            if name is not None:
+                counts[name] += 1
+
+    def part_counts(self, entity: int | None = None) -> Counter[str]:
+        """Return gift part names counts of an item's chain.
+
+        If no item is given, return the counts of all gift parts,
+        indexed items or not. The returned counter shall not be
+        modified.
+        """
+        if entity is None:
+            return self._total_counts
+        return self._counts[self._roots[entity]]
+
+    def major_assembly(self) -> int | None:
+        """Return the root of the chain with the most items, if any."""
+        if not self._members:
+            return None
+        return max(self._members, key=lambda root: len(self._members[root]))
+
+    def contains(self, ancestor: int, entity: int) -> bool:
+        """Check if ``ancestor`` is ``entity`` or one of its ancestors.
+
+        Use it to prevent hooking into a loop.
+        """
+        if self._roots[ancestor] != self._roots[entity]:
+            return False
+
+        if self._roots[ancestor] == ancestor:
             return True
 
-        current_entity = world.get_component(current_entity, Item).hooked
+        current_entity = entity
+        while current_entity is not None:
+            if current_entity == ancestor:
+                return True
+            current_entity = self._parents.get(current_entity)
+
+        return False
+
+    def pop_moved(self) -> set[int]:
+        """Return and forget the items moved since the last call."""
+        moved = set(self._moved)
+        self._moved.clear()
+        return moved
+
+    def pop_orphans(self) -> set[int]:
+        """Return and forget items whose chain lost a deleted parent."""
+        orphans = self._orphans
+        self._orphans = set()
+        return orphans
+
+    def process(self, dt):
+        pass
+
 
-    return False
+def itemchain_contains(start_entity: int, target: int, world: desper.World) -> int:
+    """Check if chain of items contains the given entity."""
+    return world.get_processor(ItemChainProcessor).contains(target, start_entity)
 
 
 def find_root(start_entity: int, world: desper.World) -> int:
     """Find root entity of a chain."""
-    last_entity = start_entity
-    current_entity = start_entity
-    while current_entity is not None:
-        last_entity = current_entity
-        current_entity = world.get_component(current_entity, Item).hooked
-
-    return last_entity
+    return world.get_processor(ItemChainProcessor).root(start_entity)
 
 
 @desper.event_handler('on_mouse_game_press', 'on_mouse_game_motion', 'on_mouse_game_release')
@@ -57,7 +329,6 @@ class ItemDragProcessor(desper.Processor):
     last_delta: Vec2 = Vec2()
     last_dt: float = 1.
     pickup_position = desper.math.Vec2()
-    _next_top_value: int = 1000
 
     def on_mouse_game_press(self, point: Vec2, buttons: int, mod):
         """Event: handle mouse."""
@@ -93,17 +364,26 @@ class ItemDragProcessor(desper.Processor):
         self.last_delta = delta
 
     def find_drag(self, point: Vec2) -> desper.Controller | None:
-        """Given a point, find an item to grab."""
-        # TODO: pixel perfect check
+        """Given a point, find an item to grab.
+
+        Items are hit by their opaque pixels only (see
+        :func:`physics.point_collision`).
+        """
         # Find top item
         top_item = None
-        top_order = -1
-        for item_entity, _ in self.world.get(Item):
+        top_z = -float('inf')
+        spatial_index = self.world.get_processor(physics.SpatialIndexProcessor)
+        # In world order, as ties in depth go to the first item
+        for item_entity in sorted(spatial_index.query_point(point)):
+            if not self.world.has_component(item_entity, Item):
+                continue
+
             item_controller = desper.controller(item_entity, self.world)
             sprite: Sprite = item_controller.get_component(Sprite)
-            if physics.point_collision(point, item_controller) and top_order < sprite.group.order:
+            # Cheap depth check first, skips pixel checks of covered items
+            if top_z < sprite.z and physics.point_collision(point, item_controller):
                 top_item = item_controller
-                top_order = sprite.group.order
+                top_z = sprite.z
 
         return top_item
 
@@ -117,14 +397,15 @@ class ItemDragProcessor(desper.Processor):
 
         # Save current item and mouse offset for dragging
         self.dragged = top_item
+        top_item.get_component(Item).touched = True
         self.pickup_position = top_item.get_component(desper.Transform2D).position
         self.offset = point - self.pickup_position
         top_item.remove_component(physics.Velocity)
 
-        top_item.get_component(Item).hooked = None          # Unhook
+        self.world.get_processor(ItemChainProcessor).unhook(top_item.entity)     # Unhook
 
         # Bring on top globally
-        top_item.get_component(Sprite).group = pyglet.graphics.Group(self.get_next_top_value())
+        bring_to_top(self.world, top_item.entity)
 
     def begin_drag_chain(self, point: Vec2):
         """On mouse press, find intersecting items and grab one.
@@ -139,20 +420,16 @@ class ItemDragProcessor(desper.Processor):
         self.world.dispatch('on_pickup')
 
         # Save current item and mouse offset for dragging
-        top_item = desper.controller(find_root(top_item.entity, top_item.world), top_item.world)
+        chains = self.world.get_processor(ItemChainProcessor)
+        top_item = desper.controller(chains.root(top_item.entity), self.world)
         self.dragged = top_item
+        top_item.get_component(Item).touched = True
         self.pickup_position = top_item.get_component(desper.Transform2D).position
         self.offset = point - self.pickup_position
         top_item.remove_component(physics.Velocity)
 
         # Bring on top globally
-        top_item.get_component(Sprite).group = pyglet.graphics.Group(self.get_next_top_value())
-
-    def get_next_top_value(self) -> int:
-        """Return next top z value and increase it."""
-        next_value = self._next_top_value
-        self._next_top_value += 1
-        return next_value
+        bring_to_top(self.world, top_item.entity)
 
     def end_drag(self, to_hook=True):
         """If something is being dragged, release it."""
@@ -182,22 +459,37 @@ class ItemDragProcessor(desper.Processor):
             return
 
         # Handle item hooking
-        hooked = False
-        dragged_item = self.dragged.get_component(Item)
-        for entity, _ in self.world.get(physics.CollisionRectangle):
+        chains = self.world.get_processor(ItemChainProcessor)
+        hook_target = None
+        dragged_rectangle = self.dragged.get_component(physics.CollisionRectangle)
+        spatial_index = self.world.get_processor(physics.SpatialIndexProcessor)
+        candidates = []
+        # In world order (the index returns a set), so that the hook
+        # target is deterministic
+        for entity in sorted(spatial_index.query_rectangle(
+                dragged_position - dragged_rectangle.offset, dragged_rectangle.size)):
             if entity == self.dragged.entity:       # Don't self collide
                 continue
 
             # Hook things that overlap, prevent hooking into a loop
             if (to_hook
-                and physics.rectangle_collision(self.dragged,
-                                                desper.controller(entity, self.world))
-                    and not itemchain_contains(entity, self.dragged.entity, self.world)):
-                dragged_item.hooked = entity
-                dragged_item.hook_offset = (self.world.get_component(entity,
-                                                                     desper.Transform2D).position
-                                            - dragged_position)
-                hooked = True
+                and not chains.contains(self.dragged.entity, entity)
+                    and physics.rectangle_collision(self.dragged,
+                                                    desper.controller(entity, self.world))):
+                candidates.append(entity)
+
+        # Hook to the last candidate whose opaque pixels overlap,
+        # pixels are only checked until one is found
+        for entity in reversed(candidates):
+            if physics.mask_collision(self.dragged, desper.controller(entity, self.world)):
+                hook_target = entity
+                break
+
+        hooked = hook_target is not None
+        if hooked:
+            chains.hook(self.dragged.entity, hook_target,
+                        self.world.get_component(hook_target, desper.Transform2D).position
+                        - dragged_position)
 
         # Apply an eventual inertia from the mouse, if not hooked
         if not hooked and self.last_delta.mag > 0.5:
@@ -215,81 +507,158 @@ class ItemDragProcessor(desper.Processor):
     def process(self, dt: float):
         """Reset mouse delta and keep track of dt."""
         self.last_delta = Vec2()
-        self.last_dt = clamp(dt, constants.MIN_DT, constants.MAX_DT)
-
-
-def get_next_top_value(world: desper.World) -> int:
-    """Retrieve next top value for items in world and increase it."""
-    drag_processor = world.get_processor(ItemDragProcessor)
-    return drag_processor.get_next_top_value()
+        self.last_dt = dt
 
 
 class HookedProcessor(desper.Processor):
     """Process hooked items.
 
-    Hooked items mirror their parent's positions. and should be on
-    top of them.
+    Hooked items mirror their parent's positions. Only subtrees of
+    moved items are updated, parents first (shallowest moved items
+    first), so that whole assemblies follow in a single frame. Idle
+    assemblies cost nothing.
+
+    Items whose parent was deleted are deleted as well.
     """
 
     def process(self, _):
-        for entity, item in self.world.get(Item):
-            if item.hooked is None:
-                continue
+        chains = self.world.get_processor(ItemChainProcessor)
 
-            # Delete entities part of a non-existing chain
-            if not self.world.entity_exists(item.hooked):
+        # Delete entities part of a non-existing chain
+        for entity in chains.pop_orphans():
+            if self.world.entity_exists(entity):
                 self.world.delete_entity(entity)
+
+        visited = set()
+        for moved_entity in sorted(chains.pop_moved(), key=chains.depth):
+            if moved_entity in visited:
                 continue
 
-            # Adjust position according to parent
-            transform = self.world.get_component(entity, desper.Transform2D)
+            for entity in chains.subtree(moved_entity):
+                visited.add(entity)
+                # Adjust position according to parent
+                if entity != moved_entity:
+                    item = self.world.get_component(entity, Item)
+                    transform = self.world.get_component(entity, desper.Transform2D)
+                    parent_transform = self.world.get_component(item.hooked, desper.Transform2D)
+                    transform.position = parent_transform.position - item.hook_offset
 
-            parent_transform = self.world.get_component(item.hooked, desper.Transform2D)
-            parent_gift_part = self.world.get_component(item.hooked, GiftPart)
-            transform.position = parent_transform.position - item.hook_offset
+        # Propagation itself moved items, forget about them
+        chains.pop_moved()
 
-            # If parent has no gift part, remove part as well
-            if parent_gift_part is None:
-                self.world.remove_component(entity, GiftPart)
 
-            # Check ordering
-            sprite = self.world.get_component(entity, Sprite)
-            parent_sprite = self.world.get_component(item.hooked, Sprite)
-            if sprite.group.order <= parent_sprite.group.order:
-                sprite.group = pyglet.graphics.Group(get_next_top_value(self.world))
+def bring_to_top(world: desper.World, entity: int):
+    """Bring an item and the items hooked to it on top, parents first."""
+    zorder = world.get_processor(graphics.ZOrderProcessor)
+    for member in world.get_processor(ItemChainProcessor).subtree(entity):
+        zorder.bring_to_top(world.get_component(member, Sprite))
 
 
-@dataclass(frozen=True)
+@desper.event_handler('on_add', 'on_remove')
+@dataclass(frozen=True, eq=False)
 class GiftPart:
-    """Represent a gift part."""
+    """Represent a gift part.
+
+    Parts are counted by the world's :class:`ItemChainProcessor`, if
+    any.
+    """
     name: str
 
+    def on_add(self, entity: int, world: desper.World):
+        """Count this part."""
+        chains = world.get_processor(ItemChainProcessor)
+        if chains is not None:
+            chains.set_part(entity, self.name)
 
-def find_major_gift(world: desper.World) -> tuple[int, list[GiftPart]]:
-    """Return the major gift from the world."""
-    # Build all gifts in the scene
-    gifts = {}
-    explored = set()
-    for entity, item in world.get(Item):
-        if entity in explored:
-            continue
+    def on_remove(self, entity: int, world: desper.World):
+        """Stop counting this part."""
+        chains = world.get_processor(ItemChainProcessor)
+        if chains is not None:
+            chains.set_part(entity, None)
 
-        # Populate candidate gift
-        last_entity = entity
-        current_entity = entity
-        current_chain = []
-        while current_entity is not None:
-            last_entity = current_entity
-            # Don't add parts more than once
-            if current_entity not in explored:
-                current_chain.append(world.get_component(current_entity, GiftPart))
-                explored.add(current_entity)
-            current_entity = world.get_component(current_entity, Item).hooked
 
-        gifts.setdefault(last_entity, [])
-        gifts[last_entity] += current_chain
+def table_counts(world: desper.World) -> Counter[str]:
+    """Return gift part names counts of the whole world.
+
+    Counts kept by :class:`ItemChainProcessor` are used if the world
+    is dispatching. Parts of a world being built are not counted there
+    yet (adding them is deferred), so they are counted one by one. The
+    returned counter shall not be modified.
+    """
+    chains = world.get_processor(ItemChainProcessor)
+    if chains is not None and world.dispatch_enabled:
+        return chains.part_counts()
+    return count_parts(part for _, part in world.get(GiftPart))
+
+
+def reclaim_parts(world: desper.World, count: int,
+                  wanted: Collection[str] = ()) -> list[int]:
+    """Delete up to ``count`` stale gift parts, return them.
+
+    Only loose parts are deleted: not hooked, with nothing hooked to
+    them and not dragged. Parts not indexed yet (i.e. of a world
+    being built) are checked through their :class:`Item`. Stalest
+    parts go first: not ``wanted`` (part names), then off-screen, then
+    never touched, then oldest. Deletion is deferred, as usual.
+    """
+    chains = world.get_processor(ItemChainProcessor)
+    drag = world.get_processor(ItemDragProcessor)
+    dragged = drag.dragged.entity if drag is not None and drag.dragged is not None else None
+    hooked_to = {item.hooked for _, item in world.get(Item)}
+
+    def is_loose(entity: int) -> bool:
+        if entity == dragged:
+            return False
+        if entity in chains:
+            return len(chains.members(entity)) == 1
+        return world.get_component(entity, Item).hooked is None and entity not in hooked_to
+
+    def staleness(entity_part: tuple[int, GiftPart]):
+        entity, part = entity_part
+        start = world.get_component(entity, desper.Transform2D).position
+        size = 0, 0
+        # Parts of a world being built have no rectangle yet
+        coll_rectangle = world.get_component(entity, physics.CollisionRectangle)
+        if coll_rectangle is not None:
+            start -= coll_rectangle.offset
+            size = coll_rectangle.size
+        on_screen = (start.x + size[0] > 0 and start.x < constants.VIEW_W
+                     and start.y + size[1] > 0 and start.y < constants.VIEW_H)
+        return (part.name in wanted, on_screen, world.get_component(entity, Item).touched,
+                entity)
+
+    loose = [(entity, part) for entity, part in world.get(GiftPart) if is_loose(entity)]
+    reclaimed = [entity for entity, _ in sorted(loose, key=staleness)[:max(count, 0)]]
+    for entity in reclaimed:
+        world.delete_entity(entity)
+
+    return reclaimed
+
+
+def find_major_gift(world: desper.World) -> tuple[int | None, Counter[str]]:
+    """Return the major gift from the world and its part counts.
+
+    The returned counter shall not be modified.
+    """
+    chains = world.get_processor(ItemChainProcessor)
+    root = chains.major_assembly()
+    if root is None:
+        return None, Counter()
+    return root, chains.part_counts(root)
+
+
+def order_progress(world: desper.World) -> tuple[int, int] | None:
+    """Return satisfied and required parts of the current order.
+
+    Parts are counted on the major gift. If there is no order, return
+    ``None``.
+    """
+    gift_constraint_query = world.get(GiftConstraint)
+    if not gift_constraint_query:
+        return None
 
-    return max(gifts.items(), key=lambda kv: len(kv[1]))
+    _, counts = find_major_gift(world)
+    return gift_constraint_query[0][1].compiled.progress(counts)
 
 
 class Constraint:
@@ -301,6 +670,17 @@ class Constraint:
         Return number of errors and list of reasons.
         """
 
+    def leaves(self) -> Iterable['Constraint']:
+        """Return leaf constraints, in checking order."""
+        return (self,)
+
+    def check_counts(self, counts: Counter[str], total: int) -> int:
+        """Override to check a leaf against counts of part names.
+
+        ``total`` is the total amount of parts. Return number of errors,
+        the constraint itself is the reason if there are any.
+        """
+
 
 class JointConstraint(Constraint):
     """Conjunction between constraints."""
@@ -315,7 +695,12 @@ class JointConstraint(Constraint):
         """
         all_checks = [constraint.check(items) for constraint in self.constraints]
         return (sum(map(operator.itemgetter(0), all_checks)),
-                sum(map(operator.itemgetter(1), all_checks), start=[]))
+                list(itertools.chain.from_iterable(map(operator.itemgetter(1), all_checks))))
+
+    def leaves(self) -> Iterable[Constraint]:
+        """Return leaves of all subconstraints, in checking order."""
+        return itertools.chain.from_iterable(constraint.leaves()
+                                             for constraint in self.constraints)
 
 
 class ItemSetConstraint(Constraint):
@@ -341,6 +726,10 @@ class ItemSetConstraint(Constraint):
 
         return max(errors, 0), reason
 
+    def check_counts(self, counts: Counter[str], total: int) -> int:
+        """Return number of missing items to reach given count."""
+        return max(self.count - sum(counts[name] for name in self.allowed_set), 0)
+
 
 class ItemsNumberConstraint(Constraint):
     """Constraint: check if total amount of parts is higher/lower than the given amount.
@@ -365,8 +754,103 @@ class ItemsNumberConstraint(Constraint):
 
         return errors, reason
 
+    def check_counts(self, counts: Counter[str], total: int) -> int:
+        """Check if total item count is higher/lower than the given amount."""
+        return int(not self.method(total, self.count))
+
+
+class CompiledConstraint:
+    """Flat evaluator for a constraint tree.
+
+    Leaves are checked in the same order as :meth:`Constraint.check`
+    would, against a single :class:`Counter` of part names. Same
+    errors and reasons are returned.
+    """
+
+    def __init__(self, constraint: Constraint):
+        self.constraint = constraint
+        self.leaves = tuple(constraint.leaves())
+        self.item_set_leaves = tuple(leaf for leaf in self.leaves
+                                     if isinstance(leaf, ItemSetConstraint))
+        self.required = sum(leaf.count for leaf in self.item_set_leaves)
+
+    def check_counts(self, counts: Counter[str]) -> tuple[int, list[Any]]:
+        """Return number of errors and list of reasons, given part counts."""
+        total = counts.total()
+        errors = 0
+        reasons = []
+        for leaf in self.leaves:
+            leaf_errors = leaf.check_counts(counts, total)
+            if leaf_errors:
+                errors += leaf_errors
+                reasons.append(leaf)
+
+        return errors, reasons
+
+    def check(self, items: Iterable[GiftPart]) -> tuple[int, list[Any]]:
+        """Return number of errors and list of reasons."""
+        return self.check_counts(count_parts(items))
+
+    def plan(self, counts: Counter[str]) -> list[tuple[str, ...]]:
+        """Return the fewest parts satisfying item set constraints.
+
+        Given part counts, return one tuple of names per missing part:
+        any of the names would do. As in :meth:`check_counts`, a part
+        counts towards all the constraints allowing it.
+        """
+        deficits = tuple(leaf.check_counts(counts, 0) for leaf in self.item_set_leaves)
+        if not any(deficits):
+            return []
+
+        # Names allowed by the same constraints are interchangeable,
+        # only keep groups not allowed by a subset of another's
+        groups: dict[frozenset[int], list[str]] = {}
+        for name in sorted(set().union(*(leaf.allowed_set for leaf in self.item_set_leaves))):
+            signature = frozenset(index for index, leaf in enumerate(self.item_set_leaves)
+                                  if name in leaf.allowed_set)
+            groups.setdefault(signature, []).append(name)
+        signatures = [signature for signature in groups
+                      if not any(signature < other for other in groups)]
+
+        # Some part shall satisfy the first unmet constraint, try all
+        @functools.cache
+        def fewest(deficits: tuple[int, ...]) -> tuple[frozenset[int], ...]:
+            first = next((index for index, deficit in enumerate(deficits) if deficit > 0), None)
+            if first is None:
+                return ()
+
+            best = None
+            for signature in signatures:
+                if first not in signature:
+                    continue
+                rest = fewest(tuple(max(deficit - (index in signature), 0)
+                                    for index, deficit in enumerate(deficits)))
+                if best is None or len(rest) + 1 < len(best):
+                    best = (signature, *rest)
+            return best
+
+        return [tuple(groups[signature]) for signature in fewest(deficits)]
+
+    def progress(self, counts: Counter[str]) -> tuple[int, int]:
+        """Return satisfied and required parts, given part counts.
+
+        Only item set constraints are considered.
+        """
+        total = counts.total()
+        missing = sum(leaf.check_counts(counts, total) for leaf in self.item_set_leaves)
+        return self.required - missing, self.required
+
+
+def count_parts(items: Iterable[GiftPart]) -> Counter[str]:
+    """Count gift parts by name."""
+    return Counter(item.name for item in items)
+
 
 @dataclass
 class GiftConstraint:
     """Encapsulate the level's current gift constraints."""
     constraint: Constraint
+    compiled: CompiledConstraint = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.compiled = CompiledConstraint(self.constraint)
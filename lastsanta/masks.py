@@ -0,0 +1,121 @@
+"""Use prebuilt alpha masks of images (see ``build_masks.py``).
+
+:func:`install` finds masks of images in the resource map, whose
+source did not change since the masks were built. :func:`get` returns
+an :class:`AlphaMask`, used as a component to check collisions with
+opaque pixels only (see :func:`physics.point_collision`).
+"""
+import json
+from pathlib import Path
+
+import desper
+
+from . import atlas
+
+MASKS_DIRECTORY = 'masks'
+INDEX_FILENAME = 'index.json'
+DATA_FILENAME = 'masks.bin'
+
+
+class AlphaMask:
+    """Opaque pixels of an image, as rows of bits.
+
+    Bit ``x`` of ``rows[y]`` is set if pixel ``(x, y)`` is opaque
+    (origin at the bottom left). ``bounds`` enclose opaque pixels, as
+    ``(x_start, y_start, x_end, y_end)``, ends excluded.
+    """
+    __slots__ = ('width', 'height', 'bounds', 'rows')
+
+    def __init__(self, width: int, height: int, bounds: tuple[int, int, int, int],
+                 rows: tuple[int, ...]):
+        self.width = width
+        self.height = height
+        self.bounds = bounds
+        self.rows = rows
+
+    @classmethod
+    def unpack(cls, width: int, height: int, bounds: tuple[int, int, int, int],
+               data: bytes) -> 'AlphaMask':
+        """Build a mask from packed rows, lowest bits first."""
+        stride = (width + 7) // 8
+        return cls(width, height, tuple(bounds),
+                   tuple(int.from_bytes(data[y * stride:(y + 1) * stride], 'little')
+                         for y in range(height)))
+
+    @classmethod
+    def opaque(cls, width: int, height: int) -> 'AlphaMask':
+        """Build a mask where all pixels are opaque."""
+        return cls(width, height, (0, 0, width, height), ((1 << width) - 1,) * height)
+
+    def contains(self, x: int, y: int) -> bool:
+        """Check if a pixel is opaque."""
+        return 0 <= y < self.height and x >= 0 and bool(self.rows[y] >> x & 1)
+
+    def overlaps(self, other: 'AlphaMask', dx: int, dy: int) -> bool:
+        """Check if opaque pixels overlap with another mask's.
+
+        Pixel ``(x, y)`` of this mask lies on pixel
+        ``(x - dx, y - dy)`` of the other one.
+        """
+        y_start = max(self.bounds[1], other.bounds[1] + dy)
+        y_end = min(self.bounds[3], other.bounds[3] + dy)
+        other_rows = other.rows
+        if dx >= 0:
+            return any(row & other_rows[y - dy] << dx
+                       for y, row in enumerate(self.rows[y_start:y_end], y_start))
+        return any(row & other_rows[y - dy] >> -dx
+                   for y, row in enumerate(self.rows[y_start:y_end], y_start))
+
+
+_packed: dict[str, tuple[int, int, tuple[int, int, int, int], bytes]] = {}
+_masks: dict[str, AlphaMask] = {}
+
+
+def install(resource_map: desper.ResourceMap, root: str) -> list[str]:
+    """Find masks for images in the resource map, if masks exist.
+
+    Only images currently in the map whose source did not change since
+    the masks were built get one. Masks are unpacked on demand, by
+    :func:`get`. ``root`` is the resources directory. Return keys of
+    images with a mask.
+    """
+    masks_path = Path(root) / MASKS_DIRECTORY
+    try:
+        with open(masks_path / INDEX_FILENAME, encoding='utf8') as fin:
+            index = json.load(fin)
+        with open(masks_path / DATA_FILENAME, 'rb') as fin:
+            data = fin.read()
+    except (OSError, ValueError):
+        return []
+
+    installed = []
+    for key, entry in index['masks'].items():
+        handle = resource_map.get(key)
+        filename = getattr(handle, 'filename', None)
+        if filename is None or not atlas.is_fresh(Path(filename), entry):
+            continue
+
+        size = (entry['width'] + 7) // 8 * entry['height']
+        _packed[key] = (entry['width'], entry['height'], tuple(entry['bounds']),
+                        data[entry['offset']:entry['offset'] + size])
+        _masks.pop(key, None)
+        installed.append(key)
+
+    return installed
+
+
+def get(key: str, width: int, height: int) -> AlphaMask:
+    """Return the mask of an image, given its resource key and size.
+
+    Images without a mask (e.g. masks were not built) are considered
+    fully opaque.
+    """
+    mask = _masks.get(key)
+    if mask is None:
+        if key in _packed:
+            mask = AlphaMask.unpack(*_packed.pop(key))
+        else:
+            mask = AlphaMask.opaque(width, height)
+        _masks[key] = mask
+
+    return mask
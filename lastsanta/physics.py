@@ -1,71 +1,257 @@
 """Basic physics and collisions."""
-from dataclasses import dataclass
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field, replace
 from typing import SupportsFloat
 
 import desper
-import pyglet
+import pyglet_desper as pdesper
 from pyglet.math import Vec2
 from pyglet.sprite import Sprite
 from pyglet.window import Window
 
 from . import constants
+from . import graphics
+from . import masks
+from . import recording
 
+SPATIAL_CELL_SIZE = 128
+LATENCY_SAMPLES = 120
 
-def _point_to_gamespace(x, y, viewport, gameport) -> Vec2:
-    """Transform point from window space to game space."""
-    return Vec2((x - viewport[0]) * (gameport[0] / viewport[2]),
-                (y - viewport[1]) * (gameport[1] / viewport[3]))
+
+@dataclass
+class Channel:
+    """A kind of event dispatched by :class:`DispatchLaterProcessor`.
+
+    Events of lower ``priority`` are delivered first, events of the
+    same priority in the order they were posted. Events posted to a
+    ``batched`` channel during a frame are delivered once, as a single
+    event whose argument is the list of posted items (e.g. bouncing
+    entities).
+    """
+    name: str
+    priority: int = 0
+    batched: bool = False
+    posted: int = field(default=0, compare=False)
+    delivered: int = field(default=0, compare=False)
+
+
+CHANNELS = (Channel('on_bounce', priority=1, batched=True),)
+"""Channels known to all :class:`DispatchLaterProcessor`."""
 
 
 class DispatchLaterProcessor(desper.Processor):
-    """Dispatch the given events on process."""
+    """Dispatch the given events on process.
 
-    def __init__(self):
-        self._queue = []
+    Events are posted to channels (see :class:`Channel`). Events of
+    unknown channels are delivered with priority ``0``, one by one.
+    Events posted while delivering are delivered on the next frame.
+    """
+
+    def __init__(self, channels: Iterable[Channel] = CHANNELS):
+        self.channels: dict[str, Channel] = {}
+        self._queue: list[list] = []
+        self._batches: dict[str, list] = {}
+
+        for channel in channels:
+            self.add_channel(replace(channel))
+
+    def add_channel(self, channel: Channel) -> Channel:
+        """Add or replace a channel, return it."""
+        self.channels[channel.name] = channel
+        return channel
+
+    def channel(self, event_name: str) -> Channel:
+        """Get the channel of an event, created if missing."""
+        channel = self.channels.get(event_name)
+        if channel is None:
+            channel = self.channels[event_name] = Channel(event_name)
+        return channel
+
+    def post(self, event_name: str, *args):
+        """Schedule an event to be dispatched later.
+
+        For batched channels, a single argument is expected: the item
+        to be appended to the frame's batch.
+        """
+        channel = self.channel(event_name)
+        channel.posted += 1
+
+        if not channel.batched:
+            self._queue.append([channel, args])
+            return
+
+        item, = args
+        batch = self._batches.get(event_name)
+        if batch is None:
+            batch = self._batches[event_name] = []
+            self._queue.append([channel, (batch,)])
+        batch.append(item)
 
     def dispatch(self, *event_parameters):
         """Schedule an event to be dispatched later."""
-        self._queue.append(event_parameters)
+        self.post(*event_parameters)
+
+    def dispatch_coalesced(self, merge: Callable[[tuple, tuple], tuple], event_name: str,
+                           *args) -> bool:
+        """Schedule an event, merged into the last one if of the same kind.
+
+        ``merge`` receives the arguments of the scheduled and of the
+        new event, and returns the merged ones. Return whether the
+        event was merged.
+        """
+        if self._queue and self._queue[-1][0].name == event_name:
+            entry = self._queue[-1]
+            entry[0].posted += 1
+            entry[1] = merge(entry[1], args)
+            return True
+
+        self.post(event_name, *args)
+        return False
 
     def process(self, _):
         old_queue = self._queue
         self._queue = []
+        self._batches = {}
+
+        # Stable: same priority events keep their order
+        old_queue.sort(key=lambda entry: entry[0].priority)
+        for channel, args in old_queue:
+            channel.delivered += 1
+            self.world.dispatch(channel.name, *args)
+
+
+def post_batch(world: desper.World, event_name: str, items: list):
+    """Post items to a batched channel of a world.
+
+    If the world has no :class:`DispatchLaterProcessor`, they are
+    dispatched right away, as a single batch.
+    """
+    if not items:
+        return
+
+    dispatch_later = world.get_processor(DispatchLaterProcessor)
+    if dispatch_later is None:
+        world.dispatch(event_name, items)
+        return
+
+    for item in items:
+        dispatch_later.post(event_name, item)
+
 
-        for event_tuple in old_queue:
-            self.world.dispatch(*event_tuple)
+def merge_motions(scheduled: tuple[Vec2, Vec2], new: tuple[Vec2, Vec2]) -> tuple[Vec2, Vec2]:
+    """Merge two ``on_mouse_game_motion`` events: last point, summed deltas."""
+    return new[0], scheduled[1] + new[1]
 
 
-@desper.event_handler('on_mouse_press', 'on_mouse_release')
+class GameSpaceMapping:
+    """Map points from a viewport in window space to game space."""
+    __slots__ = ('x', 'y', 'scale_x', 'scale_y')
+
+    def __init__(self, viewport, gameport=(constants.VIEW_W, constants.VIEW_H)):
+        self.x, self.y = viewport[0], viewport[1]
+        self.scale_x = gameport[0] / viewport[2]
+        self.scale_y = gameport[1] / viewport[3]
+
+    def point(self, x, y) -> Vec2:
+        return Vec2((x - self.x) * self.scale_x, (y - self.y) * self.scale_y)
+
+    def delta(self, dx, dy) -> Vec2:
+        return Vec2(dx * self.scale_x, dy * self.scale_y)
+
+
+@dataclass
+class InputStats:
+    """Counters and latency of mouse input.
+
+    Latency goes from a press or release to the start of the first
+    frame drawn after it is dispatched, in seconds.
+    """
+    motions: int = 0
+    coalesced: int = 0
+    latencies: deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def latency(self) -> tuple[float, float]:
+        """Return average and maximum latency, in milliseconds."""
+        if not self.latencies:
+            return 0., 0.
+        return sum(self.latencies) / len(self.latencies) * 1e3, max(self.latencies) * 1e3
+
+
+input_stats = InputStats()
+
+
+@desper.event_handler('on_mouse_press', 'on_mouse_release', 'on_resize', 'on_draw',
+                      'on_mouse_game_press', 'on_mouse_game_release')
 @desper.event_handler('on_mouse_motion', on_mouse_drag='on_mouse_motion')
 class MouseToGameSpace(desper.Controller):
-    """Map mouse events from window space to game space."""
+    """Map mouse events from window space to game space.
+
+    The mapping follows the viewport of the world's camera (the
+    window's one if missing) and is only recomputed after a resize.
+    All game space events are dispatched on the next process. Motion
+    events are coalesced: consecutive ones (not interleaved by presses
+    or releases) are dispatched once, with summed deltas. Counters and
+    latency are kept in :data:`input_stats`.
+    """
     dispatch_later = desper.ProcessorReference(DispatchLaterProcessor)
 
     def __init__(self):
-        self.window: Window = next(iter(pyglet.app.windows))
+        self._mapping: GameSpaceMapping | None = None
+        self._scheduled: deque[float] = deque()
+        self._dispatched: list[float] = []
+
+    @property
+    def window(self) -> Window | None:
+        return graphics.current_window()
+
+    @property
+    def mapping(self) -> GameSpaceMapping:
+        if self._mapping is None:
+            cameras = self.world.get(pdesper.Camera)
+            self._mapping = GameSpaceMapping(cameras[0][1].viewport if cameras
+                                             else self.window.viewport)
+        return self._mapping
+
+    def on_resize(self, *args):
+        self._mapping = None
 
     def on_mouse_motion(self, x, y, dx, dy, *args):
-        return self.world.dispatch('on_mouse_game_motion',
-                                   _point_to_gamespace(x, y, self.window.viewport,
-                                                       (constants.VIEW_W, constants.VIEW_H)),
-                                   _point_to_gamespace(dx, dy,
-                                                       (0, 0, self.window.viewport[2],
-                                                        self.window.viewport[3]),
-                                                       (constants.VIEW_W, constants.VIEW_H)))
+        point = self.mapping.point(x, y)
+        delta = self.mapping.delta(dx, dy)
+        if recording.recorder is not None:
+            recording.recorder.motion(point, delta)
+
+        input_stats.motions += 1
+        input_stats.coalesced += self.dispatch_later.dispatch_coalesced(
+            merge_motions, 'on_mouse_game_motion', point, delta)
 
     def on_mouse_press(self, x, y, buttons, mod):
-        return self.dispatch_later.dispatch('on_mouse_game_press',
-                                            _point_to_gamespace(x, y, self.window.viewport,
-                                                                (constants.VIEW_W,
-                                                                 constants.VIEW_H)),
-                                            buttons, mod)
+        point = self.mapping.point(x, y)
+        if recording.recorder is not None:
+            recording.recorder.press(point, buttons, mod)
+        self._scheduled.append(time.perf_counter())
+        return self.dispatch_later.dispatch('on_mouse_game_press', point, buttons, mod)
 
     def on_mouse_release(self, x, y, buttons, mod):
-        return self.dispatch_later.dispatch('on_mouse_game_release',
-                                            _point_to_gamespace(x, y, self.window.viewport,
-                                                                (constants.VIEW_W,
-                                                                 constants.VIEW_H)),
-                                            buttons, mod)
+        point = self.mapping.point(x, y)
+        if recording.recorder is not None:
+            recording.recorder.release(point, buttons, mod)
+        self._scheduled.append(time.perf_counter())
+        return self.dispatch_later.dispatch('on_mouse_game_release', point, buttons, mod)
+
+    def on_mouse_game_press(self, *args):
+        # Injected events (e.g. headless) are not timed
+        if self._scheduled:
+            self._dispatched.append(self._scheduled.popleft())
+
+    on_mouse_game_release = on_mouse_game_press
+
+    def on_draw(self):
+        now = time.perf_counter()
+        input_stats.latencies.extend(now - event_time for event_time in self._dispatched)
+        self._dispatched.clear()
 
 
 @dataclass
@@ -77,7 +263,11 @@ class CollisionRectangle:
 
 def point_collision(point: tuple[SupportsFloat, SupportsFloat],
                     collision_controller: desper.Controller) -> bool:
-    """Check if point collides with entity."""
+    """Check if point collides with entity.
+
+    The collision rectangle is checked first. Then, if the entity has
+    a :class:`masks.AlphaMask`, the pixel under the point.
+    """
     x, y = point
 
     coll_rectangle: CollisionRectangle = collision_controller.get_component(CollisionRectangle)
@@ -86,8 +276,17 @@ def point_collision(point: tuple[SupportsFloat, SupportsFloat],
     rect_start = transform.position - coll_rectangle.offset
     rect_end = rect_start + coll_rectangle.size
 
-    return (x > rect_start.x and x < rect_end.x
-            and y > rect_start.y and y < rect_end.y)
+    if not (x > rect_start.x and x < rect_end.x
+            and y > rect_start.y and y < rect_end.y):
+        return False
+
+    mask: masks.AlphaMask | None = collision_controller.get_component(masks.AlphaMask)
+    if mask is None:
+        return True
+
+    # The rectangle starts at the mask bounds
+    return mask.contains(int(x - rect_start.x) + mask.bounds[0],
+                         int(y - rect_start.y) + mask.bounds[1])
 
 
 def axis_to_rectangle(axis_pos: SupportsFloat, index: int, coll_rectangle: CollisionRectangle,
@@ -133,17 +332,162 @@ def rectangle_collision(collision_controller1: desper.Controller,
             and rect1_start.y + rect1_coll.size[1] > rect2_start.y)
 
 
+def mask_collision(collision_controller1: desper.Controller,
+                   collision_controller2: desper.Controller) -> bool:
+    """Check if opaque pixels of two colliding entities overlap.
+
+    Meant to refine :func:`rectangle_collision`. Entities without a
+    :class:`masks.AlphaMask` are fully opaque.
+    """
+    mask1: masks.AlphaMask | None = collision_controller1.get_component(masks.AlphaMask)
+    mask2: masks.AlphaMask | None = collision_controller2.get_component(masks.AlphaMask)
+    if mask1 is None or mask2 is None:
+        return True
+
+    rect1_start = (collision_controller1.get_component(desper.Transform2D).position
+                   - collision_controller1.get_component(CollisionRectangle).offset)
+    rect2_start = (collision_controller2.get_component(desper.Transform2D).position
+                   - collision_controller2.get_component(CollisionRectangle).offset)
+
+    # Rectangles start at the mask bounds
+    return mask1.overlaps(mask2,
+                          round(rect2_start.x - rect1_start.x) + mask1.bounds[0] - mask2.bounds[0],
+                          round(rect2_start.y - rect1_start.y) + mask1.bounds[1] - mask2.bounds[1])
+
+
 @desper.event_handler('on_add')
 class BBox(desper.Controller):
-    """Generate a collision rectangle based on Sprite."""
+    """Generate a collision rectangle based on Sprite.
+
+    If the entity has a :class:`masks.AlphaMask`, the rectangle only
+    encloses opaque pixels.
+    """
     sprite = desper.ComponentReference(Sprite)
 
     def on_add(self, entity: int, world: desper.World):
         super().on_add(entity, world)
 
-        self.add_component(CollisionRectangle((self.sprite.width, self.sprite.height),
-                                              (self.sprite.image.anchor_x,
-                                               self.sprite.image.anchor_x)))
+        image = self.sprite.image
+        mask = self.get_component(masks.AlphaMask)
+        if mask is None:
+            self.add_component(CollisionRectangle((self.sprite.width, self.sprite.height),
+                                                  (image.anchor_x, image.anchor_y)))
+            return
+
+        x_start, y_start, x_end, y_end = mask.bounds
+        self.add_component(CollisionRectangle((x_end - x_start, y_end - y_start),
+                                              (image.anchor_x - x_start,
+                                               image.anchor_y - y_start)))
+
+
+class SpatialIndexProcessor(desper.Processor):
+    """Uniform grid indexing collision rectangles by the cells they span.
+
+    Entities are kept up to date by :class:`SpatialIndexSync`. Queries
+    return candidate entities only, exact collision checks are left to
+    the caller.
+    """
+
+    def __init__(self, cell_size: float = SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], set[int]] = {}
+        self._entity_cells: dict[int, tuple[tuple[int, int], ...]] = {}
+
+    def _cell_range(self, start: tuple[SupportsFloat, SupportsFloat],
+                    size: tuple[SupportsFloat, SupportsFloat]) -> tuple[tuple[int, int], ...]:
+        """Return all the cells covered by the given rectangle."""
+        cell_size = self.cell_size
+        x_start = int(start[0] // cell_size)
+        y_start = int(start[1] // cell_size)
+        x_end = int((start[0] + size[0]) // cell_size)
+        y_end = int((start[1] + size[1]) // cell_size)
+
+        return tuple((x, y) for x in range(x_start, x_end + 1)
+                     for y in range(y_start, y_end + 1))
+
+    def update(self, entity: int, start: tuple[SupportsFloat, SupportsFloat],
+               size: tuple[SupportsFloat, SupportsFloat]):
+        """Insert or move an entity, given its rectangle."""
+        new_cells = self._cell_range(start, size)
+        old_cells = self._entity_cells.get(entity, ())
+        if new_cells == old_cells:
+            return
+
+        for cell in old_cells:
+            cell_entities = self._cells[cell]
+            cell_entities.discard(entity)
+            if not cell_entities:
+                del self._cells[cell]
+
+        for cell in new_cells:
+            self._cells.setdefault(cell, set()).add(entity)
+
+        self._entity_cells[entity] = new_cells
+
+    def remove(self, entity: int):
+        """Remove an entity from the index, if present."""
+        for cell in self._entity_cells.pop(entity, ()):
+            cell_entities = self._cells[cell]
+            cell_entities.discard(entity)
+            if not cell_entities:
+                del self._cells[cell]
+
+    def query_point(self, point: tuple[SupportsFloat, SupportsFloat]) -> set[int]:
+        """Return candidate entities whose rectangle may contain point."""
+        cell = (int(point[0] // self.cell_size), int(point[1] // self.cell_size))
+        return set(self._cells.get(cell, ()))
+
+    def query_rectangle(self, start: tuple[SupportsFloat, SupportsFloat],
+                        size: tuple[SupportsFloat, SupportsFloat]) -> set[int]:
+        """Return candidate entities whose rectangle may overlap the given one."""
+        candidates = set()
+        for cell in self._cell_range(start, size):
+            candidates.update(self._cells.get(cell, ()))
+
+        return candidates
+
+    def process(self, dt):
+        pass
+
+
+@desper.event_handler('on_position_change', 'on_remove')
+class SpatialIndexSync(desper.Controller):
+    """Keep the entity's :class:`CollisionRectangle` in the spatial index.
+
+    Requires a :class:`CollisionRectangle` to be present when added
+    (e.g. add it after a :class:`BBox`).
+    """
+    spatial_index = desper.ProcessorReference(SpatialIndexProcessor)
+    transform = desper.ComponentReference(desper.Transform2D)
+
+    def on_add(self, entity: int, world: desper.World):
+        super().on_add(entity, world)
+
+        transform = self.transform
+        transform.add_handler(self)
+        self.on_position_change(transform.position)
+
+    def on_position_change(self, new_position: desper.math.Vec2):
+        """Event handler: move the entity in the index."""
+        spatial_index = self.spatial_index
+        coll_rectangle = self.get_component(CollisionRectangle)
+        if spatial_index is None or coll_rectangle is None:
+            return
+
+        spatial_index.update(self.entity,
+                             (new_position[0] - coll_rectangle.offset[0],
+                              new_position[1] - coll_rectangle.offset[1]),
+                             coll_rectangle.size)
+
+    def on_remove(self, entity: int, world: desper.World):
+        """Leave the index and stop listening to the transform."""
+        transform = world.get_component(entity, desper.Transform2D)
+        if transform is not None:
+            transform.remove_handler(self)
+
+        spatial_index = world.get_processor(SpatialIndexProcessor)
+        if spatial_index is not None:
+            spatial_index.remove(entity)
 
 
 class Velocity(Vec2):
@@ -180,55 +524,67 @@ class RectangleToAxisProcessor(desper.Processor):
     def process(self, dt):
         axis_entities = self.world.get(CollisionAxes)
 
+        bounced = []
         for dynamic_entity, velocity in self.world.get(Velocity):
             coll_rectangle = self.world.get_component(dynamic_entity, CollisionRectangle)
             if coll_rectangle is None:
                 continue
-            norm_velocity = velocity.normalize()
+            dynamic_transform = self.world.get_component(dynamic_entity, desper.Transform2D)
 
             # Check collisions with all axis
-            reflection = Vec2()
+            reflection = [False, False]
             for _, axes in axis_entities:
-                reflection += self._resolve(
-                    dt, coll_rectangle, self.world.get_component(dynamic_entity,
-                                                                 desper.Transform2D),
-                    velocity, norm_velocity, axes)
+                reflection[axes.index] |= self._resolve(dt, coll_rectangle, dynamic_transform,
+                                                        velocity, axes)
 
             # Change velocity (bounce)
-            bounce = False
-            if reflection.x > 0.1:
-                bounce = True
+            if reflection[0]:
                 velocity.x = -velocity.x
 
-            if reflection.y > 0.1:
-                bounce = True
+            if reflection[1]:
                 velocity.y = -velocity.y
 
-            if bounce:
-                self.world.dispatch('on_bounce')
+            if reflection[0] or reflection[1]:
+                bounced.append(dynamic_entity)
+
+        post_batch(self.world, 'on_bounce', bounced)
 
     def _resolve(self, dt: float, coll_rectangle: CollisionRectangle,
                  dynamic_transform: desper.Transform2D,
-                 dynamic_velocity: Velocity, norm_velocity: Velocity, axes: CollisionAxes):
-        """Apply velocity and resolve collision with axes."""
+                 dynamic_velocity: Velocity, axes: CollisionAxes) -> bool:
+        """Resolve collision with axes, before velocity is applied.
+
+        The rectangle is swept along its velocity for the whole frame
+        and the time of impact with the axis is computed in closed form,
+        so that fast bodies cannot tunnel through it. On impact, the
+        body is offset along the axis normal so that, once its velocity
+        is reflected and applied, it ends up where the bounce at the
+        time of impact leads. Bodies already overlapping the axis are
+        pushed back on the side they came from.
+
+        Return whether a collision happened.
+        """
+        index = axes.index
+        axis_pos = axes.pos
+        velocity_component = dynamic_velocity[index]
         position = dynamic_transform.position
-        position = position + dynamic_velocity * dt
-        collided = False
-
-        # Adjust collision
-        while axis_to_rectangle(axes.pos, axes.index, coll_rectangle, position):
-            collided = True
-            position = position - norm_velocity
-
-        # If a collision happened, return a vector accordingly
-        reflection_axis = [0, 0]
-        reflection_axis[axes.index] = 1 * collided
+        rect_start = position[index] - coll_rectangle.offset[index]
+        rect_end = rect_start + coll_rectangle.size[index]
+        travel = velocity_component * dt
 
-        # If no collision, reset position
-        if collided:
-            dynamic_transform.position = position
+        # The trailing edge must start before the axis and the leading
+        # edge must end past it
+        if velocity_component > 0 and rect_start < axis_pos < rect_end + travel:
+            time_of_impact = (axis_pos - rect_end) / velocity_component
+        elif velocity_component < 0 and rect_start + travel < axis_pos < rect_end:
+            time_of_impact = (axis_pos - rect_start) / velocity_component
+        else:
+            return False
 
-        return Vec2(*reflection_axis)
+        bounce_offset = [0., 0.]
+        bounce_offset[index] = 2 * velocity_component * time_of_impact
+        dynamic_transform.position = position + bounce_offset
+        return True
 
 
 @desper.event_handler('on_mouse_game_motion')
@@ -236,7 +592,6 @@ class PointCheckDebug(desper.Controller):
     """Debug: find and log all objects found."""
 
     def __init__(self):
-        self.window: Window = next(iter(pyglet.app.windows))
         self.game_ratio = constants.VIEW_W / constants.VIEW_H
 
     def on_mouse_game_motion(self, mouse_position, delta):
@@ -0,0 +1,378 @@
+"""Opt-in frame profiler for worlds.
+
+Once a world is instrumented (:meth:`Profiler.instrument`), the
+profiler times:
+
+- each processor's ``process``
+- each dispatched event and each of its handlers (drawing included,
+  as handlers of ``on_draw``)
+- each step of coroutines
+
+Spans are grouped by frame (a frame starts on each iteration of the
+main loop, see :meth:`Profiler.begin_world_frame`) and kept in a ring
+buffer of the latest frames. They can be summarized
+(see :meth:`Profiler.summary`) or exported as Chrome trace events
+(see :meth:`Profiler.export_chrome_trace`), to be opened in
+``chrome://tracing`` or Perfetto.
+
+Instrumentation replaces methods of the world and of its processors,
+and wraps handler callbacks on their classes. Worlds that are not
+instrumented are not timed. Worlds with a
+:class:`ProfilerOverlay` are instrumented at creation if the
+``LASTSANTA_PROFILE`` environment variable is set, or as soon as the
+overlay is first shown.
+"""
+import functools
+import json
+import os
+import time
+import weakref
+from collections import defaultdict, deque
+from collections.abc import Callable, Generator
+from dataclasses import dataclass, field
+
+import desper
+import pyglet
+import pyglet_desper as pdesper
+from pyglet.text import Label
+
+from . import constants
+from . import physics
+
+RING_FRAMES = 600
+TRACE_FILENAME = 'profile_trace.json'
+OVERLAY_FRAMES = 120
+OVERLAY_LINES = 16
+OVERLAY_INTERVAL = 0.5
+
+CATEGORY_PROCESS = 'process'
+CATEGORY_EVENT = 'event'
+CATEGORY_HANDLER = 'handler'
+CATEGORY_COROUTINE = 'coroutine'
+
+
+@dataclass
+class Frame:
+    """Spans recorded during a frame.
+
+    Spans are tuples: name, category, start and duration (in
+    nanoseconds) and nesting depth.
+    """
+    start: int
+    spans: list[tuple[str, str, int, int, int]] = field(default_factory=list)
+
+    @property
+    def busy(self) -> int:
+        """Time spent in outermost spans, in nanoseconds."""
+        return sum(span[3] for span in self.spans if span[4] == 0)
+
+
+class Profiler:
+    """Record timings of instrumented worlds, frame by frame."""
+
+    def __init__(self, ring_frames: int = RING_FRAMES,
+                 enabled: bool = bool(os.environ.get(constants.PROFILE_ENV_VAR))):
+        self.enabled = enabled
+        self.frames: deque[Frame] = deque(maxlen=ring_frames)
+        self._frame: Frame | None = None
+        self._depth = 0
+        self._worlds: weakref.WeakSet[desper.World] = weakref.WeakSet()
+        self._handlers: weakref.WeakSet[desper.EventHandler] = weakref.WeakSet()
+
+    def begin_frame(self):
+        """Close the current frame (if any) and start a new one."""
+        self._frame = Frame(time.perf_counter_ns())
+        self.frames.append(self._frame)
+
+    def begin_world_frame(self, world: desper.World):
+        """Start a new frame, if enabled and the world is instrumented.
+
+        Called by loops once per iteration, however many times the world
+        is processed in it.
+        """
+        if self.enabled and world in self._worlds:
+            self.begin_frame()
+
+    def clear(self):
+        """Forget all recorded frames."""
+        self.frames.clear()
+        self._frame = None
+
+    def _call(self, name: str, category: str, function: Callable, *args, **kwargs):
+        """Call a function, recording a span for it."""
+        if self._frame is None or not self.enabled:
+            return function(*args, **kwargs)
+
+        frame = self._frame
+        depth = self._depth
+        self._depth += 1
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            frame.spans.append((name, category, start, time.perf_counter_ns() - start, depth))
+            self._depth = depth
+
+    def _timed(self, name: str, category: str, function: Callable) -> Callable:
+        """Return a version of function that records spans."""
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            return self._call(name, category, function, *args, **kwargs)
+
+        return timed
+
+    def _timed_generator(self, name: str, generator: Generator,
+                         wrappers: weakref.WeakKeyDictionary) -> Generator:
+        """Wrap a coroutine, recording a span for each step.
+
+        The wrapper is forgotten (see ``wrappers``) once the coroutine
+        terminates.
+        """
+        while True:
+            try:
+                wait = self._call(name, CATEGORY_COROUTINE, next, generator)
+            except StopIteration as ex:
+                wrappers.pop(generator, None)
+                return ex.value
+            yield wait
+
+    def _timed_handler(self, method: Callable) -> Callable:
+        """Wrap a handler method, recording spans for instrumented handlers."""
+        @functools.wraps(method)
+        def timed(handler, *args, **kwargs):
+            if handler not in self._handlers:
+                return method(handler, *args, **kwargs)
+            return self._call(f'{type(handler).__name__}.{method.__name__}', CATEGORY_HANDLER,
+                              method, handler, *args, **kwargs)
+
+        timed.profiled = True
+        return timed
+
+    def instrument_handler(self, handler: desper.EventHandler):
+        """Time a handler's callbacks.
+
+        Callbacks are wrapped on the handler's class (as that is where
+        the dispatcher looks them up), the first time one of its
+        instances is instrumented. Instances that are not instrumented
+        are called straight through.
+        """
+        self._handlers.add(handler)
+        handler_type = type(handler)
+        for method_name in handler.__events__.values():
+            method = getattr(handler_type, method_name)
+            if not getattr(method, 'profiled', False):
+                setattr(handler_type, method_name, self._timed_handler(method))
+
+    def instrument_processor(self, processor: desper.Processor):
+        """Time a processor's ``process``.
+
+        Coroutines started through a :class:`desper.CoroutineProcessor`
+        are timed as well. They are stepped through a wrapper, but are
+        still identified by their own generator when calling ``start``,
+        ``kill`` or ``state``.
+        """
+        processor.process = self._timed(type(processor).__name__, CATEGORY_PROCESS,
+                                        processor.process)
+
+        if isinstance(processor, desper.CoroutineProcessor):
+            start = processor.start
+            kill = processor.kill
+            state = processor.state
+            wrappers = weakref.WeakKeyDictionary()
+
+            @functools.wraps(start)
+            def timed_start(generator):
+                # Raise as start does, if already started
+                if state(wrappers.get(generator, generator)) != desper.CoroutineState.TERMINATED:
+                    return start(wrappers[generator])
+
+                wrapper = self._timed_generator(generator.__qualname__, generator, wrappers)
+                wrappers[generator] = wrapper
+                return start(wrapper)
+
+            @functools.wraps(kill)
+            def timed_kill(generator):
+                kill(wrappers.get(generator, generator))
+                # A killed coroutine can be started again, with a new wrapper
+                wrappers.pop(generator, None)
+
+            @functools.wraps(state)
+            def timed_state(generator):
+                return state(wrappers.get(generator, generator))
+
+            processor.start = timed_start
+            processor.kill = timed_kill
+            processor.state = timed_state
+
+    def instrument(self, world: desper.World):
+        """Time processing and event dispatching of a world.
+
+        Processors and handlers added later are timed as well.
+        Instrumenting the same world twice has no effect.
+        """
+        if world in self._worlds:
+            return
+        self._worlds.add(world)
+
+        dispatch = world.dispatch
+        add_processor = world.add_processor
+        add_handler = world.add_handler
+
+        def timed_dispatch(event_name: str, *args, **kwargs):
+            # Queued events are timed when released
+            if not world.dispatch_enabled:
+                return dispatch(event_name, *args, **kwargs)
+            return self._call(event_name, CATEGORY_EVENT, dispatch, event_name, *args, **kwargs)
+
+        def timed_add_processor(processor: desper.Processor, priority: int | None = None):
+            add_processor(processor, priority)
+            self.instrument_processor(processor)
+
+        def timed_add_handler(handler: desper.EventHandler):
+            # Wrap first, the world looks callbacks up when adding
+            self.instrument_handler(handler)
+            add_handler(handler)
+
+        world.dispatch = timed_dispatch
+        world.add_processor = timed_add_processor
+        world.add_handler = timed_add_handler
+        for processor in world.processors:
+            self.instrument_processor(processor)
+
+        handlers = [world, *world.processors]
+        for entity in world.entities:
+            handlers += world.get_components(entity)
+        # Registered again, as the world keeps the callbacks it found
+        for handler in handlers:
+            if hasattr(handler, '__events__') and world.is_handler(handler):
+                world.remove_handler(handler)
+                world.add_handler(handler)
+
+    def summary(self, frames: int | None = None) -> tuple[float, float, list[tuple]]:
+        """Summarize the latest frames (all recorded frames by default).
+
+        Return average and maximum busy time of a frame and, for each
+        span name, its category and average time per frame (sorted by
+        time, descending). Times are in milliseconds.
+        """
+        recorded = list(self.frames)
+        # The current frame is not complete yet
+        if recorded and recorded[-1] is self._frame:
+            recorded.pop()
+        if frames is not None:
+            recorded = recorded[-frames:]
+        if not recorded:
+            return 0., 0., []
+
+        totals = defaultdict(int)
+        categories = {}
+        for frame in recorded:
+            for name, category, _, duration, _ in frame.spans:
+                totals[name] += duration
+                categories[name] = category
+
+        busy = [frame.busy for frame in recorded]
+        entries = sorted(((name, categories[name], total / len(recorded) / 1e6)
+                          for name, total in totals.items()), key=lambda entry: -entry[2])
+        return sum(busy) / len(busy) / 1e6, max(busy) / 1e6, entries
+
+    def chrome_trace(self) -> dict:
+        """Return recorded frames as Chrome trace events."""
+        events = []
+        if not self.frames:
+            return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+        origin = self.frames[0].start
+        for index, frame in enumerate(self.frames):
+            events.append({'name': 'frame', 'cat': 'frame', 'ph': 'i', 's': 't',
+                           'ts': (frame.start - origin) / 1e3, 'pid': 0, 'tid': 0,
+                           'args': {'index': index}})
+            for name, category, start, duration, _ in frame.spans:
+                events.append({'name': name, 'cat': category, 'ph': 'X',
+                               'ts': (start - origin) / 1e3, 'dur': duration / 1e3,
+                               'pid': 0, 'tid': 0})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, filename: str = TRACE_FILENAME):
+        """Write recorded frames to a Chrome trace event JSON file."""
+        with open(filename, 'w', encoding='utf8') as fout:
+            json.dump(self.chrome_trace(), fout)
+
+
+profiler = Profiler()
+
+
+class ProfilerOverlay(desper.Controller):
+    """Show a summary of the latest frames on top of the world.
+
+    See :func:`toggle_overlay`.
+    """
+    overlays: weakref.WeakSet['ProfilerOverlay'] = weakref.WeakSet()
+    visible = False
+
+    def __init__(self):
+        self.label: Label | None = None
+
+    def on_add(self, entity: int, world: desper.World):
+        super().on_add(entity, world)
+        ProfilerOverlay.overlays.add(self)
+
+        if profiler.enabled:
+            profiler.instrument(world)
+        if ProfilerOverlay.visible:
+            self.update()
+
+    def update(self):
+        """Update the overlay with the latest summary."""
+        if self.label is None:
+            self.label = Label('', x=20, y=constants.VIEW_H - 20, anchor_y='top',
+                               multiline=True, width=constants.VIEW_W // 2, font_size=14,
+                               color=constants.FG_COLOR,
+                               batch=pdesper.retrieve_batch(self.world),
+                               group=pyglet.graphics.Group(1000))
+
+        average, maximum, entries = profiler.summary(OVERLAY_FRAMES)
+        lines = [f'frame {average:.2f} ms avg, {maximum:.2f} ms max']
+        stats = physics.input_stats
+        if stats.latencies:
+            input_average, input_maximum = stats.latency()
+            lines.append(f'input {input_average:.2f} ms avg, {input_maximum:.2f} ms max, '
+                         f'{stats.coalesced}/{stats.motions} motions coalesced')
+        dispatch_later = self.world.get_processor(physics.DispatchLaterProcessor)
+        if dispatch_later is not None:
+            channels = [channel for channel in dispatch_later.channels.values() if channel.posted]
+            if channels:
+                lines.append('events ' + ', '.join(
+                    f'{channel.name} {channel.delivered}/{channel.posted}'
+                    for channel in channels))
+        lines += [f'{time_ms:7.3f} {category:<10} {name}'
+                  for name, category, time_ms in entries[:OVERLAY_LINES]]
+        self.label.text = '\n'.join(lines)
+        self.label.visible = ProfilerOverlay.visible
+
+
+def _update_overlays(dt=0.):
+    for overlay in ProfilerOverlay.overlays:
+        if overlay.world is not None:
+            overlay.update()
+
+
+def toggle_overlay():
+    """Show or hide profiler overlays.
+
+    When shown, the profiler is enabled and worlds with an overlay
+    are instrumented. Once hidden, recording stops.
+    """
+    ProfilerOverlay.visible = not ProfilerOverlay.visible
+    profiler.enabled = ProfilerOverlay.visible
+
+    if ProfilerOverlay.visible:
+        for overlay in ProfilerOverlay.overlays:
+            if overlay.world is not None:
+                profiler.instrument(overlay.world)
+        pyglet.clock.schedule_interval(_update_overlays, OVERLAY_INTERVAL)
+    else:
+        pyglet.clock.unschedule(_update_overlays)
+
+    _update_overlays()
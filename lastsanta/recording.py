@@ -0,0 +1,191 @@
+"""Record play sessions as compact binary logs, to be replayed.
+
+Set the ``LASTSANTA_RECORD`` environment variable (see
+:data:`constants.RECORD_ENV_VAR`) to a file name to record a session
+(see :func:`start`). A log starts with a header (magic, version and
+simulation step) followed by records, each one made of a tag byte and
+a fixed size payload:
+
+- ``FRAME``: a world step, with the wall clock time it took
+- ``PRESS``, ``RELEASE``: mouse buttons, at a point in game space
+- ``MOTION``: mouse motion, point and delta in game space
+- ``KEY``: a key press
+- ``SEED``: a seed of the module level :mod:`random` generator
+  (see :func:`reseed`)
+- ``DIGEST``: a digest of the world state (see :func:`digest`), every
+  :data:`DIGEST_INTERVAL` steps and at the end of the session
+
+Records are written in the order they happen: inputs precede the
+step that receives them. Sessions are replayed by
+:func:`headless.replay`.
+"""
+import atexit
+import hashlib
+import random
+import struct
+import time
+from collections import deque
+from typing import BinaryIO
+
+import desper
+
+from . import constants
+
+MAGIC = b'LSRC'
+VERSION = 1
+HEADER = struct.Struct('<4sBd')
+DIGEST_INTERVAL = 300
+
+FRAME = 0
+PRESS = 1
+RELEASE = 2
+MOTION = 3
+KEY = 4
+SEED = 5
+DIGEST = 6
+
+RECORDS = {
+    FRAME: struct.Struct('<BI'),            # Step time (microseconds)
+    PRESS: struct.Struct('<BddBH'),         # x, y, buttons, modifiers
+    RELEASE: struct.Struct('<BddBH'),
+    MOTION: struct.Struct('<Bdddd'),        # x, y, dx, dy
+    KEY: struct.Struct('<BIH'),             # Symbol, modifiers
+    SEED: struct.Struct('<BQ'),
+    DIGEST: struct.Struct('<BQ'),
+}
+
+MAX_FRAME_TIME = 2 ** 32 - 1
+
+
+def digest(world: desper.World) -> int:
+    """Return a 64 bit digest of a world's state.
+
+    Entities and their positions are hashed: replaying the same
+    session shall result in the same digest.
+    """
+    hasher = hashlib.blake2b(digest_size=8)
+    for entity, transform in sorted(world.get(desper.Transform2D), key=lambda pair: pair[0]):
+        hasher.update(struct.pack('<qdd', entity, *transform.position))
+    return int.from_bytes(hasher.digest(), 'little')
+
+
+class Recorder:
+    """Write a session log to a binary file."""
+
+    def __init__(self, file: BinaryIO, step: float = constants.SIMULATION_STEP,
+                 digest_interval: int = DIGEST_INTERVAL):
+        self.file = file
+        self.digest_interval = digest_interval
+        self.steps = 0
+        file.write(HEADER.pack(MAGIC, VERSION, step))
+
+    def _write(self, tag: int, *values):
+        self.file.write(RECORDS[tag].pack(tag, *values))
+
+    def process(self, world: desper.World, dt: float):
+        """Process a world, recording the step and its time.
+
+        Once every few steps, the world state is recorded as well.
+        """
+        start = time.perf_counter_ns()
+        try:
+            world.process(dt)
+        finally:
+            self._write(FRAME, min((time.perf_counter_ns() - start) // 1000, MAX_FRAME_TIME))
+            self.steps += 1
+
+        # Skipped on world switches: when replaying, the next world
+        # would be current already
+        if self.steps % self.digest_interval == 0:
+            self._write(DIGEST, digest(world))
+
+    def press(self, point, buttons: int, mod: int):
+        self._write(PRESS, *point, buttons, mod)
+
+    def release(self, point, buttons: int, mod: int):
+        self._write(RELEASE, *point, buttons, mod)
+
+    def motion(self, point, delta):
+        self._write(MOTION, *point, *delta)
+
+    def key(self, symbol: int, mod: int):
+        self._write(KEY, symbol, mod)
+
+    def seed(self, seed: int):
+        self._write(SEED, seed)
+
+    def close(self, world: desper.World | None = None):
+        """Record the final state of a world (if given) and close."""
+        if self.file.closed:
+            return
+        if world is not None:
+            self._write(DIGEST, digest(world))
+        self.file.close()
+
+
+recorder: Recorder | None = None
+replayed_seeds: deque[int] = deque()
+"""Seeds used by :func:`reseed` instead of new ones, when replaying."""
+
+
+def start(filename: str) -> Recorder:
+    """Start recording the session to a file.
+
+    The log is closed at exit, recording the state of the current
+    world.
+    """
+    global recorder
+    recorder = Recorder(open(filename, 'wb'))
+    atexit.register(stop)
+    return recorder
+
+
+def stop():
+    """Stop recording, if recording."""
+    global recorder
+    if recorder is None:
+        return
+
+    loop = desper.default_loop
+    recorder.close(loop.current_world if loop is not None else None)
+    recorder = None
+
+
+def reseed() -> int:
+    """Seed the module level :mod:`random` generator, return the seed.
+
+    A new seed is generated, unless there are :data:`replayed_seeds`
+    left. If recording, the seed is logged.
+    """
+    seed = replayed_seeds.popleft() if replayed_seeds else random.SystemRandom().getrandbits(64)
+    random.seed(seed)
+    if recorder is not None:
+        recorder.seed(seed)
+    return seed
+
+
+def read(filename: str) -> tuple[float, list[tuple[int, tuple]]]:
+    """Read a session log.
+
+    Return the simulation step and the list of records, as tag and
+    payload tuples. A truncated last record (e.g. after a crash) is
+    ignored.
+    """
+    with open(filename, 'rb') as fin:
+        data = fin.read()
+
+    magic, version, step = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{filename} is not a session log of version {VERSION}')
+
+    records = []
+    offset = HEADER.size
+    while offset < len(data):
+        record = RECORDS[data[offset]]
+        if offset + record.size > len(data):
+            break
+        tag, *payload = record.unpack_from(data, offset)
+        records.append((tag, tuple(payload)))
+        offset += record.size
+
+    return step, records
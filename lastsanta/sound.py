@@ -1,8 +1,12 @@
 """Handle sound."""
+import functools
 import random
+from collections import Counter
 
 import desper
+import pyglet
 from ddesigner.default_model import ExecuteNode
+from pyglet.media import Player, StaticSource
 
 DELIVERY_BUTTON_SFX = 'media/button'
 PAPER_OUT_SFX = 'media/paper_out'
@@ -15,12 +19,118 @@ PICKUP_SFX = 'media/pickup'
 DROP_SFX = 'media/drop'
 HOOK_SFX = 'media/hook'
 
+HIT_SOUND_CLASS = 'hit'
+VOICE_SOUND_CLASS = 'voice'
+EFFECT_SOUND_CLASS = 'effect'
+SOUND_CLASS_LIMITS = {HIT_SOUND_CLASS: 3, VOICE_SOUND_CLASS: 1, EFFECT_SOUND_CLASS: 6}
+MAX_PLAYERS = 10
+
+
+def sound_class(key: str) -> str:
+    """Return the class of a sound, used to limit concurrent voices."""
+    if key in HIT_SFXS:
+        return HIT_SOUND_CLASS
+    if key.startswith(VOICE_SFX_FOLDER + desper.ResourceMap.split_char):
+        return VOICE_SOUND_CLASS
+    return EFFECT_SOUND_CLASS
+
+
+class Mixer:
+    """Play sounds through a capped pool of reusable players.
+
+    Sounds are requested by resource key. Requests of the same sound
+    in the same frame are coalesced and actually played on the next
+    clock tick. Sounds exceeding the limit of their class (see
+    :func:`sound_class`) or the total amount of players are dropped.
+    Sources are kept as static, pre-decoded buffers.
+    """
+
+    def __init__(self, max_players: int = MAX_PLAYERS,
+                 limits: dict[str, int] = SOUND_CLASS_LIMITS):
+        self.max_players = max_players
+        self.limits = limits
+        self.played = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._sources: dict[str, StaticSource] = {}
+        self._folders: dict[str, tuple[str, ...]] = {}
+        self._pending: dict[str, None] = {}
+        self._idle: list[Player] = []
+        self._active: dict[Player, str] = {}
+        self._class_counts: Counter[str] = Counter()
+
+    def play(self, key: str):
+        """Request a sound, played on the next clock tick."""
+        if key in self._pending:
+            self.coalesced += 1
+            return
+
+        if not self._pending:
+            pyglet.clock.schedule_once(self.flush, 0)
+        self._pending[key] = None
+
+    def play_random(self, folder: str):
+        """Request a random sound from a resource folder."""
+        keys = self._folders.get(folder)
+        if keys is None:
+            keys = self._folders[folder] = tuple(
+                f'{folder}{desper.ResourceMap.split_char}{key}'
+                for key in desper.resource_map.get(folder).handles)
+        self.play(random.choice(keys))
+
+    def flush(self, dt=0.):
+        """Play requested sounds, within limits."""
+        pending = self._pending
+        self._pending = {}
+        for key in pending:
+            self._start(key)
+
+    def source(self, key: str) -> StaticSource:
+        """Return the static source of a sound."""
+        source = self._sources.get(key)
+        if source is None:
+            source = desper.resource_map[key]
+            if not isinstance(source, StaticSource):
+                source = StaticSource(source)
+            self._sources[key] = source
+        return source
+
+    def _start(self, key: str):
+        key_class = sound_class(key)
+        if (len(self._active) >= self.max_players
+                or self._class_counts[key_class] >= self.limits.get(key_class,
+                                                                    self.max_players)):
+            self.dropped += 1
+            return
+
+        player = self._idle.pop() if self._idle else self._new_player()
+        player.queue(self.source(key))
+        player.play()
+        self._active[player] = key_class
+        self._class_counts[key_class] += 1
+        self.played += 1
+
+    def _new_player(self) -> Player:
+        player = Player()
+        player.push_handlers(on_player_eos=functools.partial(self._release, player))
+        return player
+
+    def _release(self, player: Player):
+        """Return a player to the pool, once it is done."""
+        key_class = self._active.pop(player, None)
+        if key_class is not None:
+            self._class_counts[key_class] -= 1
+            self._idle.append(player)
+
+
+mixer = Mixer()
+
 
 @ExecuteNode.subscriber
 def sfx_subscriber(sfx: str, _):
     """Interpret all commands as SFX, for simplicity."""
     # Check for mute?
-    desper.resource_map[sfx].play()
+    mixer.play(sfx)
 
 
 @desper.event_handler('on_delivery', 'on_pickup', 'on_drop', 'on_hook', 'on_bounce',
@@ -35,49 +145,54 @@ class SFXManager:
         if self.mute:
             return
 
-        desper.resource_map[PAPER_OUT_SFX].play()
+        mixer.play(PAPER_OUT_SFX)
 
         yield 0.2
-        desper.resource_map[STEPS_IN_SFX].play()
+        mixer.play(STEPS_IN_SFX)
 
     def on_pickup(self):
         """Play pickup sound."""
         if self.mute:
             return
 
-        desper.resource_map[PICKUP_SFX].play()
+        mixer.play(PICKUP_SFX)
 
     def on_drop(self):
         """Play drop sound."""
         if self.mute:
             return
 
-        desper.resource_map[DROP_SFX].play()
+        mixer.play(DROP_SFX)
 
     def on_hook(self):
         """Play drop sound."""
         if self.mute:
             return
 
-        desper.resource_map[HOOK_SFX].play()
+        mixer.play(HOOK_SFX)
+
+    def on_bounce(self, entities: list[int]):
+        """Play a different hit sound for each entity bouncing this frame.
 
-    def on_bounce(self):
+        As many as the available hit sounds.
+        """
         if self.mute:
             return
 
-        desper.resource_map[random.choice(HIT_SFXS)].play()
+        for sfx in random.sample(HIT_SFXS, min(len(entities), len(HIT_SFXS))):
+            mixer.play(sfx)
 
     def on_letter_in(self):
         if self.mute:
             return
 
-        desper.resource_map[PAPER_IN_SFX].play()
+        mixer.play(PAPER_IN_SFX)
 
     def on_handler_out(self):
         if self.mute:
             return
 
-        desper.resource_map[STEPS_OUT_SFX].play()
+        mixer.play(STEPS_OUT_SFX)
 
 
 @desper.event_handler('on_switch_in')
@@ -85,10 +200,16 @@ class VoiceSFXManager:
     """Handle voice sounds."""
     mute = False
 
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+
     def on_switch_in(self, *args):
         """Play some voice eventually."""
-        if self.mute:
+        self.play()
+
+    def play(self):
+        """Play a random voice, if enabled."""
+        if self.mute or not self.enabled:
             return
 
-        all_voices = tuple(desper.resource_map[VOICE_SFX_FOLDER].handles.values())
-        random.choice(all_voices)().play()
+        mixer.play_random(VOICE_SFX_FOLDER)
@@ -0,0 +1,129 @@
+"""Sample many gift parts at once, spread over the workbench.
+
+Part names and positions are sampled in a single pass (see
+:func:`sample`). Positions are blue noise: no two parts are closer
+than a radius derived from the workbench area and the number of parts,
+so that they do not pile up. Samples are drawn for many grid cells at
+once (see :func:`poisson_disk`), based on NumPy. NumPy is an optional
+dependency: when it is not installed, :data:`AVAILABLE` is ``False``
+and parts are placed uniformly at random.
+"""
+import math
+import random
+from collections.abc import Mapping, Sequence
+
+from . import constants
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+WORKBENCH = (constants.VERTICAL_MAIN_SEPARATOR_X + 10, 10.,
+             constants.VIEW_W - 10., constants.HORIZONTAL_MAIN_SEPARATOR_Y - 200)
+"""Area where parts are placed, as ``(x_start, y_start, x_end, y_end)``."""
+PACKING = 0.5
+"""Workbench area (fraction) per part, squared it gives the radius."""
+ROUNDS = 8
+"""Darts thrown at each empty grid cell, at most."""
+_NEIGHBORS = tuple((dy, dx) for dy in range(-2, 3) for dx in range(-2, 3) if dy or dx)
+"""Cells (offsets) close enough to hold points closer than the radius."""
+
+
+def poisson_disk(width: float, height: float, radius: float,
+                 generator: 'np.random.Generator', rounds: int = ROUNDS) -> 'np.ndarray':
+    """Return points in a rectangle, no two closer than radius.
+
+    Points are kept in a grid with a cell size of ``radius / sqrt(2)``
+    (i.e. at most one point per cell), as flat arrays of coordinates.
+    Cells are split in 9 phases, cells of the same phase are three
+    cells apart: darts are thrown at all the empty cells of a phase at
+    once, each one only checked against points of the neighboring
+    cells. Return an ``(n, 2)`` array.
+    """
+    cell = radius / math.sqrt(2)
+    columns = max(math.ceil(width / cell), 1)
+    rows = max(math.ceil(height / cell), 1)
+    # Flat grids, padded by two cells on each side so that neighbors
+    # always exist
+    stride = columns + 4
+    grid_x = np.full((rows + 4) * stride, np.nan)
+    grid_y = np.full((rows + 4) * stride, np.nan)
+    neighbor_offsets = np.array([dy * stride + dx for dy, dx in _NEIGHBORS])
+    radius_squared = radius * radius
+
+    for _ in range(rounds):
+        accepted_any = False
+        for phase_y in range(3):
+            for phase_x in range(3):
+                cell_y, cell_x = np.meshgrid(np.arange(phase_y, rows, 3),
+                                             np.arange(phase_x, columns, 3), indexing='ij')
+                cells = (cell_y.ravel() + 2) * stride + cell_x.ravel() + 2
+                empty = np.isnan(grid_x[cells])
+                cells = cells[empty]
+
+                dart_x = (cell_x.ravel()[empty] + generator.random(len(cells))) * cell
+                dart_y = (cell_y.ravel()[empty] + generator.random(len(cells))) * cell
+
+                # NaN (empty neighbors) never compares as close
+                neighbors = cells[:, None] + neighbor_offsets
+                close = (((grid_x.take(neighbors) - dart_x[:, None]) ** 2
+                          + (grid_y.take(neighbors) - dart_y[:, None]) ** 2)
+                         < radius_squared).any(axis=1)
+                accepted = (dart_x < width) & (dart_y < height) & ~close
+                grid_x[cells[accepted]] = dart_x[accepted]
+                grid_y[cells[accepted]] = dart_y[accepted]
+                accepted_any |= accepted.any()
+
+        if not accepted_any:
+            break
+
+    filled = ~np.isnan(grid_x)
+    return np.stack((grid_x[filled], grid_y[filled]), axis=1)
+
+
+def sample(part_names: Sequence[str], count: int, sizes: Mapping[str, tuple[int, int]],
+           area: tuple[float, float, float, float] = WORKBENCH,
+           rng: random.Random = random) -> list[tuple[str, float, float]]:
+    """Sample names and positions of parts, return them.
+
+    Names are drawn from ``part_names``, ``sizes`` maps them to image
+    sizes. Positions (bottom left corners) keep the parts inside the
+    area. NumPy is seeded by ``rng``, parts are placed as blue noise.
+    """
+    x_start, y_start, x_end, y_end = area
+    if count <= 0:
+        return []
+
+    if not AVAILABLE:
+        parts = []
+        for _ in range(count):
+            part_name = rng.choice(part_names)
+            width, height = sizes[part_name]
+            parts.append((part_name, rng.uniform(x_start, x_end - width),
+                          rng.uniform(y_start, y_end - height)))
+        return parts
+
+    generator = np.random.default_rng(rng.getrandbits(64))
+    name_indices = generator.integers(len(part_names), size=count)
+    part_sizes = np.array([sizes[name] for name in part_names], dtype=float).reshape(-1, 2)
+
+    # Pick centers among blue noise points, top up if there are not
+    # enough (unlikely, given the packing)
+    width, height = x_end - x_start, y_end - y_start
+    points = poisson_disk(width, height, math.sqrt(PACKING * width * height / count),
+                          generator)
+    centers = points[generator.permutation(len(points))[:count]]
+    if len(centers) < count:
+        centers = np.concatenate((centers, generator.random((count - len(centers), 2))
+                                  * (width, height)))
+
+    # Center parts on the points, inside the area
+    size_per_part = part_sizes[name_indices]
+    corners = np.clip(centers + (x_start, y_start) - size_per_part / 2, (x_start, y_start),
+                      np.maximum((x_end, y_end) - size_per_part, (x_start, y_start)))
+
+    return [(part_names[index], x, y)
+            for index, (x, y) in zip(name_indices.tolist(), corners.tolist())]
@@ -0,0 +1,80 @@
+"""Startup timing and work deferred after the first frame.
+
+To show the first story line as soon as possible, :func:`lastsanta.main`
+only opens the window, scans resources and builds the dialogue world.
+Game modules (:data:`DEFERRED_MODULES`) are then imported in background
+and resources are loaded by :class:`loading.ResourceLoader`.
+
+Startup milestones are timed by :data:`timer`, since ``lastsanta``
+is imported. If the ``LASTSANTA_STARTUP_REPORT`` environment variable
+(see :data:`constants.STARTUP_REPORT_ENV_VAR`) is set to a file name,
+a report is written there once resources are loaded. This works for
+frozen builds as well (see ``benchmarks/startup.py``).
+"""
+import importlib
+import threading
+import time
+
+DEFERRED_MODULES = 'lastsanta.logic', 'lastsanta.gifts', 'lastsanta.game'
+"""Modules not needed by dialogue lines, imported after the first frame."""
+
+
+class StartupTimer:
+    """Record the time of named startup milestones.
+
+    Times are in seconds, since the timer is created. Only the first
+    time a milestone is reached is recorded.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks: dict[str, float] = {}
+
+    def mark(self, name: str):
+        """Record a milestone, now."""
+        self.marks.setdefault(name, time.perf_counter() - self.start)
+
+    def report(self) -> str:
+        """Return a human readable report of the milestones."""
+        lines = []
+        previous = 0.
+        for name, mark_time in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f'{name}: {mark_time * 1e3:.1f}ms '
+                         f'(+{(mark_time - previous) * 1e3:.1f}ms)')
+            previous = mark_time
+        return '\n'.join(lines)
+
+    def write_report(self, filename: str):
+        with open(filename, 'w', encoding='utf8') as fout:
+            fout.write(self.report() + '\n')
+
+
+timer = StartupTimer()
+
+
+def import_deferred(modules=DEFERRED_MODULES) -> threading.Thread:
+    """Import modules in a background thread, return the thread.
+
+    Importing them again (e.g. when the first game world is built)
+    simply waits for the background import to finish.
+    """
+    def import_all():
+        for module in modules:
+            importlib.import_module(module)
+        timer.mark('deferred imports')
+
+    thread = threading.Thread(target=import_all, name='deferred-imports', daemon=True)
+    thread.start()
+    return thread
+
+
+def on_first_frame(window, callback):
+    """Call back once, right after the first frame of a window is shown."""
+    import pyglet       # NOQA
+
+    def on_draw():
+        window.remove_handler('on_draw', on_draw)
+        # Drawn and flipped by the next tick
+        pyglet.clock.schedule_once(lambda dt: callback(), 0)
+
+    window.push_handlers(on_draw)
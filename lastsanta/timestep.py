@@ -0,0 +1,62 @@
+"""Fixed timestep main loop."""
+import desper
+import pyglet_desper as pdesper
+
+from . import constants
+from . import profiling
+from . import recording
+
+
+class FixedStepLoop(pdesper.Loop):
+    """Main loop, processing the current world with a fixed timestep.
+
+    On each clock tick (at most once per ``interval``, if given),
+    elapsed time is accumulated and the world is processed in steps of
+    ``step`` seconds. At most ``max_substeps`` steps are done per tick,
+    exceeding time is dropped (see :attr:`dropped`): after a hitch the
+    game slows down instead of piling up steps.
+
+    The fraction of a step left over is kept in :attr:`alpha`, used to
+    interpolate rendering (see :class:`graphics.InterpolationProcessor`).
+
+    Each tick is a single profiler frame (see :mod:`profiling`).
+    """
+
+    def __init__(self, step: float = constants.SIMULATION_STEP, interval: float | None = None,
+                 max_substeps: int = constants.MAX_SUBSTEPS):
+        super().__init__(interval)
+        self.step = step
+        self.max_substeps = max_substeps
+        self.accumulator = 0.
+        self.alpha = 1.
+        self.steps = 0
+        self.dropped = 0.
+
+    def iteration(self, dt: float):
+        """Process as many steps as the elapsed time allows."""
+        profiling.profiler.begin_world_frame(self._current_world)
+        self.accumulator += dt
+
+        substeps = 0
+        while self.accumulator >= self.step:
+            if substeps == self.max_substeps:
+                self.dropped += self.accumulator - self.accumulator % self.step
+                self.accumulator %= self.step
+                break
+
+            if recording.recorder is None:
+                self._current_world.process(self.step)
+            else:
+                recording.recorder.process(self._current_world, self.step)
+            self.accumulator -= self.step
+            self.steps += 1
+            substeps += 1
+
+        self.alpha = self.accumulator / self.step
+
+    def switch(self, world_handle: desper.Handle[desper.World],
+               clear_current=False, clear_next=False):
+        """Switch world, starting from a whole step."""
+        super().switch(world_handle, clear_current, clear_next)
+        self.accumulator = 0.
+        self.alpha = 1.
@@ -0,0 +1,120 @@
+"""Vectorized physics backend, based on NumPy.
+
+NumPy is an optional dependency. When it is not installed,
+:data:`AVAILABLE` is ``False`` and the per-entity processors from
+:mod:`physics` shall be used instead.
+"""
+import itertools
+import operator
+
+import desper
+
+from . import physics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+
+class VectorizedPhysicsProcessor(desper.Processor):
+    """Integrate velocities and bounce on axes for all bodies at once.
+
+    Equivalent to a :class:`physics.RectangleToAxisProcessor` followed
+    by a :class:`physics.VelocityProcessor`. Bodies (entities with a
+    :class:`physics.Velocity`) are stored as a structure of arrays,
+    which is rebuilt only when the set of bodies changes. Results are
+    written back to :class:`desper.Transform2D` every frame.
+    """
+
+    def __init__(self):
+        self._entities: list[int] = []
+        self._velocity_components: list[physics.Velocity] = []
+        self._transforms: list[desper.Transform2D] = []
+        self._velocities = np.zeros((0, 2))
+        self._offsets = np.zeros((0, 2))
+        self._sizes = np.zeros((0, 2))
+        self._has_rectangle = np.zeros(0, dtype=bool)
+
+    def _sync_bodies(self, bodies: list[tuple[int, physics.Velocity]]):
+        """Rebuild arrays if bodies were added, removed or replaced."""
+        velocity_components = [velocity for _, velocity in bodies]
+        if (len(velocity_components) == len(self._velocity_components)
+                and all(map(operator.is_, velocity_components, self._velocity_components))):
+            return
+
+        self._velocity_components = velocity_components
+        self._entities = [entity for entity, _ in bodies]
+        self._transforms = [self.world.get_component(entity, desper.Transform2D)
+                            for entity, _ in bodies]
+        rectangles = [self.world.get_component(entity, physics.CollisionRectangle)
+                      for entity, _ in bodies]
+
+        self._velocities = np.array([(velocity.x, velocity.y)
+                                     for velocity in velocity_components],
+                                    dtype=float).reshape(-1, 2)
+        self._has_rectangle = np.array([rectangle is not None for rectangle in rectangles],
+                                       dtype=bool)
+        self._offsets = np.array([rectangle.offset if rectangle is not None else (0., 0.)
+                                  for rectangle in rectangles], dtype=float).reshape(-1, 2)
+        self._sizes = np.array([rectangle.size if rectangle is not None else (0., 0.)
+                                for rectangle in rectangles], dtype=float).reshape(-1, 2)
+
+    def process(self, dt):
+        bodies = self.world.get(physics.Velocity)
+        self._sync_bodies(bodies)
+        if not bodies:
+            return
+
+        # Flatten positions through iteration, building arrays from
+        # desper vectors directly is much slower
+        positions = np.fromiter(
+            itertools.chain.from_iterable(transform.position for transform in self._transforms),
+            dtype=float, count=2 * len(self._transforms)).reshape(-1, 2)
+        velocities = self._velocities
+
+        # Resolve axes one at a time, as the per-entity implementation
+        # does. Each axis is resolved for all bodies at once, see
+        # RectangleToAxisProcessor._resolve
+        reflection = np.zeros((len(bodies), 2), dtype=bool)
+        for _, axes in self.world.get(physics.CollisionAxes):
+            index = axes.index
+            axis_pos = float(axes.pos)
+            velocity_component = velocities[:, index]
+            travel = velocity_component * dt
+            rect_start = positions[:, index] - self._offsets[:, index]
+            rect_end = rect_start + self._sizes[:, index]
+
+            forward = ((velocity_component > 0) & (rect_start < axis_pos)
+                       & (axis_pos < rect_end + travel))
+            backward = ((velocity_component < 0) & (rect_start + travel < axis_pos)
+                        & (axis_pos < rect_end))
+            collided = self._has_rectangle & (forward | backward)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                time_of_impact = np.where(forward, axis_pos - rect_end,
+                                          axis_pos - rect_start) / velocity_component
+            time_of_impact[~collided] = 0.
+
+            positions[:, index] += 2 * velocity_component * time_of_impact
+            reflection[:, index] |= collided
+
+        # Bounce
+        velocities[reflection] = -velocities[reflection]
+        bounced = reflection.any(axis=1)
+
+        # Integrate
+        positions += velocities * dt
+
+        for transform, (x, y) in zip(self._transforms, positions.tolist()):
+            transform.position = desper.math.Vec2(x, y)
+
+        bounced_entities = []
+        for body_index in np.flatnonzero(bounced).tolist():
+            velocity = self._velocity_components[body_index]
+            velocity.x, velocity.y = velocities[body_index].tolist()
+            bounced_entities.append(self._entities[body_index])
+
+        physics.post_batch(self.world, 'on_bounce', bounced_entities)